@@ -0,0 +1,152 @@
+"""
+
+File: bench_buffer_pool.py
+
+Description: Compares the frame path with and without buffer reuse (--reuse-buffers). Both modes read the same video
+with cv2.VideoCapture and run FrameAnalyzer on every frame, with a stub detector that returns fixed boxes so only our
+own code is timed. Without reuse every frame allocates a new capture frame plus new gray, edge and morphology images.
+With reuse, frames are read into a FramePool and LineDetector writes into the same intermediate images every frame.
+
+Every mode runs twice:
+- a timing pass, giving the throughput and the p50/p95/p99/max latency of read + analysis per frame;
+- an allocation pass under tracemalloc (which slows things down, so it isn't timed), giving the peak memory allocated
+  on top of what was live before the frame, per frame, and the MB/s that would churn at the source frame rate.
+The detection rows of both modes are compared, they have to be identical.
+
+If no video is given, a synthetic rail scene (see benchmarks/synthetic.py) is rendered at --resolution and written to
+a temporary MJPG file first.
+
+Usage:
+Run from the run_files directory so the functions package can be imported:
+
+python -m benchmarks.bench_buffer_pool --resolution 1920x1080 --frames 300
+python -m benchmarks.bench_buffer_pool --video inputs/train_clip.mp4
+
+Command Line Arguments:
+- --video, -v: Video to read. Default is a synthetic scene.
+- --resolution: Size of the synthetic scene as WIDTHxHEIGHT. Default is 1920x1080.
+- --frames, -f: Number of frames per pass. Default is 300.
+- --line-scale: Processing scale of LineDetector. Default is 1.0.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from benchmarks.synthetic import RailScene
+from functions.buffer_pool import FramePool
+from functions.detection_sink import MemorySink
+from functions.detectors import StubDetector
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+from functions.renderer import NULL_RENDERER
+from functions.run_frame import FrameAnalyzer
+
+
+def render_video(path, resolution, n_frames):
+    """
+    Writes a synthetic rail scene video.
+
+    :return: Boxes of the scene's objects, for the stub detector
+    """
+    width, height = (int(v) for v in resolution.lower().split('x'))
+    scene = RailScene(width, height)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30, (width, height))
+    for seed in range(n_frames):
+        out.write(scene.render(seed))
+    out.release()
+    return [box for box, _ in scene.boxes()]
+
+
+def run_pass(video, boxes, n_frames, reuse, line_scale, trace = False):
+    """
+    Reads and analyzes the frames of the video in one mode.
+
+    :param trace: Measure the peak allocation of every frame with tracemalloc instead of its latency
+    :return: (per-frame seconds or peak bytes, detection rows, frame pool or None)
+    """
+    cap = cv2.VideoCapture(video)
+    reader = FramePool(cap, 1) if reuse else cap
+    fa = FrameAnalyzer(StubDetector(boxes), LineDetector(process_scale=line_scale, reuse_buffers=reuse),
+                       DistanceEstimator(), renderer=NULL_RENDERER)
+    sink = MemorySink()
+
+    values = []
+    if trace:
+        tracemalloc.start()
+    for n_frame in range(n_frames):
+        if trace:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+
+        success, frame = reader.read()
+        if not success:
+            break
+        fa.run_frame(frame, n_frame=n_frame, sink=sink)
+
+        if trace:
+            values.append(tracemalloc.get_traced_memory()[1] - before)
+        else:
+            values.append(time.perf_counter() - start)
+    if trace:
+        tracemalloc.stop()
+
+    cap.release()
+    sink.close()
+    return values, sink.rows, reader if reuse else None
+
+
+def main(video, resolution, n_frames, line_scale):
+    temp_dir = None
+    boxes = [[0, 0, 1, 1]]
+    if video is None:
+        temp_dir = tempfile.mkdtemp(prefix='bench_pool_')
+        video = os.path.join(temp_dir, 'scene.avi')
+        print(f'Rendering {n_frames} frames of a {resolution} synthetic scene')
+        boxes = render_video(video, resolution, n_frames)
+
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    try:
+        results = {}
+        for name, reuse in [('allocate', False), ('reuse', True)]:
+            seconds, rows, pool = run_pass(video, boxes, n_frames, reuse, line_scale)
+            peaks, _, _ = run_pass(video, boxes, n_frames, reuse, line_scale, trace=True)
+            results[name] = (seconds, peaks, rows, pool)
+    finally:
+        if temp_dir is not None:
+            os.remove(video)
+            os.rmdir(temp_dir)
+
+    print(f"{size[0]}x{size[1]}, {len(results['allocate'][0])} frames, line scale {line_scale}")
+    print(f"{'mode':<10}{'FPS':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'MB/frame':>10}{f'MB/s @{fps:.0f}':>11}")
+    for name, (seconds, peaks, _, _) in results.items():
+        ms = np.asarray(seconds[1:]) * 1000  # the first frame allocates the buffers in both modes
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        mb = np.mean(peaks[1:]) / 1e6
+        print(f'{name:<10}{1000 / ms.mean():>8.1f}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{ms.max():>9.2f}'
+              f'{mb:>10.2f}{mb * fps:>11.1f}')
+
+    pool = results['reuse'][3]
+    print(f'Frame pool: {pool.reads} reads, {pool.allocations} allocations')
+    same = results['allocate'][2] == results['reuse'][2]
+    print(f"Detection rows identical: {'yes' if same else 'NO'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the frame path with and without buffer reuse.')
+    parser.add_argument('--video', '-v', type=str, default=None, help='Video to read, a synthetic scene if not given')
+    parser.add_argument('--resolution', type=str, default='1920x1080', help='Size of the synthetic scene')
+    parser.add_argument('--frames', '-f', type=int, default=300, help='Frames per pass')
+    parser.add_argument('--line-scale', type=float, default=1.0, help='Processing scale of LineDetector')
+    args = parser.parse_args()
+
+    main(args.video, args.resolution, args.frames, args.line_scale)
@@ -0,0 +1,95 @@
+"""
+
+File: bench_clustering.py
+
+Description: Micro-benchmark for DistanceEstimator.k_cluster_lines. Times the numpy 2-means path against the
+original pandas/sklearn KMeans path on synthetic Hough output and reports how far apart their left and right lines are.
+
+Usage:
+Run from the run_files directory so the functions package can be imported:
+
+python -m benchmarks.bench_clustering --frames 200 --lines 40
+
+Command Line Arguments:
+- --frames, -f: Number of synthetic frames to cluster. Default is 200.
+- --lines, -l: Number of Hough segments per frame. Default is 40.
+- --seed, -s: Random seed for the synthetic lines. Default is 0.
+"""
+
+import argparse
+import time
+import numpy as np
+from functions.distance_functions import DistanceEstimator
+
+
+def synthetic_lines(rng, n_lines, height=1080, width=1920):
+    """
+    Builds a (N,1,4) Hough-like array with segments scattered around a left and a right rail.
+
+    :param rng: numpy random generator
+    :param n_lines: Number of segments in the frame
+    :return: (N,1,4) int array of [x1,y1,x2,y2]
+    """
+    lines = np.zeros((n_lines, 1, 4), dtype=np.int32)
+    for i in range(n_lines):
+        # x = intercept + slope * y, left rail has a negative slope, right rail a positive one
+        if i % 2 == 0:
+            intercept, slope = width * 0.75 + rng.normal(0, 8), -0.45 + rng.normal(0, 0.02)
+        else:
+            intercept, slope = width * 0.25 + rng.normal(0, 8), 0.45 + rng.normal(0, 0.02)
+        y1 = rng.uniform(height * 0.5, height * 0.7)
+        y2 = rng.uniform(height * 0.8, height)
+        lines[i, 0] = [intercept + slope * y1, y1, intercept + slope * y2, y2]
+    return lines
+
+
+def time_method(method, frames):
+    """
+    Clusters every frame with one estimator and records the per-frame cost.
+
+    :param method: cluster_method passed to DistanceEstimator
+    :param frames: List of (N,1,4) line arrays
+    :return: per-frame times in seconds and the [left_line, right_line] found for each frame
+    """
+    estimator = DistanceEstimator(cluster_method=method)
+    times = []
+    found = []
+    for lines in frames:
+        start = time.perf_counter()
+        estimator.k_cluster_lines(lines)
+        times.append(time.perf_counter() - start)
+        found.append((list(estimator.left_line), list(estimator.right_line)))
+    return np.array(times), found
+
+
+def main(n_frames, n_lines, seed):
+    rng = np.random.default_rng(seed)
+    frames = [synthetic_lines(rng, n_lines) for _ in range(n_frames)]
+
+    results = {}
+    for method in ['numpy', 'kmeans']:
+        times, found = time_method(method, frames)
+        results[method] = found
+        print(f'{method:>7}: mean {times.mean() * 1e3:8.3f} ms/frame, '
+              f'p95 {np.percentile(times, 95) * 1e3:8.3f} ms/frame')
+
+    # compare the lines both methods produced for each frame
+    differences = []
+    for (l_np, r_np), (l_km, r_km) in zip(results['numpy'], results['kmeans']):
+        if None in l_np + r_np + l_km + r_km:
+            continue
+        differences.append(np.abs(np.array(l_np + r_np) - np.array(l_km + r_km)))
+    if differences:
+        differences = np.array(differences)
+        print(f'max |intercept| difference: {differences[:, [0, 2]].max():.4f} px, '
+              f'max |slope| difference: {differences[:, [1, 3]].max():.6f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark numpy vs sklearn clustering of Hough lines.')
+    parser.add_argument('--frames', '-f', type=int, default=200, help='Number of synthetic frames')
+    parser.add_argument('--lines', '-l', type=int, default=40, help='Number of Hough segments per frame')
+    parser.add_argument('--seed', '-s', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    main(args.frames, args.lines, args.seed)
@@ -0,0 +1,84 @@
+"""
+
+File: bench_line_scale.py
+
+Description: Compares speed against accuracy of LineDetector at different processing scales. Every scale runs the same
+frames through detect_lines_frame and DistanceEstimator.analyze_lines. The smoothed rail lines are compared with the
+full resolution (scale 1.0) result by how far apart they are, in full resolution pixels, at the bottom of the frame and
+at 60% of its height.
+
+Usage:
+Run from the run_files directory so the functions package can be imported:
+
+python -m benchmarks.bench_line_scale --scales 1.0 0.75 0.5 0.35 0.25
+
+Command Line Arguments:
+- --images, -i: Images to benchmark on. Default is the sample inputs.
+- --scales, -s: Processing scales to compare. Default is 1.0 0.75 0.5 0.35 0.25.
+- --repeats, -r: Number of frames per measurement. Default is 30.
+"""
+
+import argparse
+import time
+import cv2
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+
+
+def run_scale(image, scale, repeats):
+    """
+    Runs the line detection on the same image several times at one scale.
+
+    :return: mean ms per frame and the estimator's final [left_line, right_line]
+    """
+    detector = LineDetector(process_scale=scale)
+    estimator = DistanceEstimator()
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        lines = detector.detect_lines_frame(image)
+        estimator.analyze_lines(lines)
+    elapsed = time.perf_counter() - start
+
+    return 1000 * elapsed / repeats, [estimator.left_line, estimator.right_line]
+
+
+def line_error(rails, reference, ys):
+    """
+    Largest x distance between two sets of rail lines at the given y values. NaN if either is missing a line.
+    """
+    errors = []
+    for line, ref in zip(rails, reference):
+        if None in line or None in ref:
+            return float('nan')
+        for y in ys:
+            errors.append(abs((line[0] + line[1] * y) - (ref[0] + ref[1] * y)))
+    return max(errors)
+
+
+def main(images, scales, repeats):
+    print(f"{'image':<28}{'scale':>7}{'ms/frame':>10}{'speedup':>9}{'max err px':>12}")
+    for path in images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f'Could not read {path}')
+            continue
+        ys = [image.shape[0], 0.6 * image.shape[0]]
+
+        reference_ms, reference = run_scale(image, 1.0, repeats)
+        for scale in scales:
+            ms, rails = run_scale(image, scale, repeats)
+            error = line_error(rails, reference, ys)
+            print(f'{path:<28}{scale:>7.2f}{ms:>10.2f}{reference_ms / ms:>9.2f}{error:>12.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark LineDetector speed and accuracy across processing scales.')
+    parser.add_argument('--images', '-i', nargs='+', default=['inputs/rail_biker.png', 'inputs/bus.jpg'],
+                        help='Images to benchmark on')
+    parser.add_argument('--scales', '-s', nargs='+', type=float, default=[1.0, 0.75, 0.5, 0.35, 0.25],
+                        help='Processing scales to compare')
+    parser.add_argument('--repeats', '-r', type=int, default=30, help='Frames per measurement')
+    args = parser.parse_args()
+
+    main(args.images, args.scales, args.repeats)
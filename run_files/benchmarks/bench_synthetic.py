@@ -0,0 +1,240 @@
+"""
+
+File: bench_synthetic.py
+
+Description: Reproducible benchmark over synthetic rail scenes (see benchmarks/synthetic.py) at several resolutions and
+curvatures. Every scene has known rail lines and objects at known distances. YOLO is replaced by a stub that returns the
+true boxes, so no model weights are needed and only our own code is timed. For every scene it measures:
+- lines: LineDetector.detect_lines_frame
+- analyze_lines: DistanceEstimator.analyze_lines on the detected lines
+- estimate_distance: DistanceEstimator.estimate_distance, once per object
+- run_frame: the full FrameAnalyzer.run_frame (stub detection, lines, distances, drawing)
+Each stage gets its throughput and its mean/p50/p95/p99 latency. The distances written by run_frame are compared with
+the ground truth, and the smoothed rail lines are compared with the true ones.
+
+Results are printed as a table and can be written to a JSON file. Pass an earlier JSON file with --compare to print
+how much faster or slower every scene got.
+
+Usage:
+Run from the run_files directory so the functions package can be imported:
+
+python -m benchmarks.bench_synthetic --output bench.json
+python -m benchmarks.bench_synthetic --compare bench.json
+
+Command Line Arguments:
+- --resolutions: Frame sizes as WIDTHxHEIGHT. Default is 960x540 1280x720 1920x1080.
+- --curvatures: Sideways vanishing point offsets as a fraction of the width. Default is -0.035 0 0.035.
+- --frames, -f: Number of different frames rendered per scene. Default is 30.
+- --repeats, -r: Number of passes over the frames for the timings. Default is 3.
+- --adaptive-roi: Benchmark LineDetector with the adaptive rail-band ROI.
+- --line-scale: Processing scale of LineDetector. Default is 1.0.
+- --output, -o: JSON file to write the results to.
+- --compare: JSON file of an earlier run to compare the timings with.
+"""
+
+import argparse
+import json
+import platform
+import time
+import cv2
+import numpy as np
+from benchmarks.synthetic import RailScene
+from functions.detectors import StubDetector
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+from functions.run_frame import FrameAnalyzer
+
+
+class RowCollector:
+    """
+    Minimal sink that keeps every row run_frame writes.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def write_frame(self, rows):
+        self.rows.extend(rows)
+
+
+def latency_stats(seconds):
+    """
+    :param seconds: List of per-call timings in seconds
+    :return: dict with calls per second and mean/p50/p95/p99 latency in ms
+    """
+    ms = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'per_second': 1000 / ms.mean(), 'mean_ms': float(ms.mean()), 'p50_ms': float(p50),
+            'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def timed(fn, *args):
+    """
+    :return: (seconds the call took, result of the call)
+    """
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_scene(scene, n_frames, repeats, detector_kwargs):
+    """
+    Runs every stage on the frames of one scene.
+
+    :param scene: RailScene to benchmark
+    :param n_frames: Number of different frames to render
+    :param repeats: Number of passes over the frames
+    :param detector_kwargs: Keyword arguments of LineDetector
+    :return: dict with the scene, the per-stage latency stats and the accuracy against the ground truth
+    """
+    frames = [scene.render(seed) for seed in range(n_frames)]
+    boxes = scene.boxes()
+    y_bottoms = [box[3] for box, _ in boxes]
+    timings = {'lines': [], 'analyze_lines': [], 'estimate_distance': [], 'run_frame': []}
+
+    # line detection and clustering, fed in frame order like a video
+    detector = LineDetector(**detector_kwargs)
+    estimator = DistanceEstimator()
+    rails_found = 0
+    for _ in range(repeats):
+        for frame in frames:
+            seconds, (lines, params) = timed(detector.detect_lines_frame, frame, True, None, True)
+            timings['lines'].append(seconds)
+            timings['analyze_lines'].append(timed(estimator.analyze_lines, lines, params)[0])
+            rails_found += None not in estimator.left_line and None not in estimator.right_line
+
+            for y_bottom in y_bottoms:
+                timings['estimate_distance'].append(timed(estimator.estimate_distance, scene.height, y_bottom)[0])
+
+    # the full frame analysis, with the stub standing in for YOLO
+    fa = FrameAnalyzer(StubDetector([box for box, _ in boxes]), LineDetector(**detector_kwargs), DistanceEstimator())
+    sink = RowCollector()
+    for n in range(repeats * n_frames):
+        frame = frames[n % n_frames].copy()  # run_frame draws on the frame
+        timings['run_frame'].append(timed(fa.run_frame, frame, None, n, sink)[0])
+
+    return {'width': scene.width, 'height': scene.height, 'curvature': scene.curvature,
+            'frames': repeats * n_frames,
+            'stages': {name: latency_stats(seconds) for name, seconds in timings.items()},
+            'rails_found': rails_found / (repeats * n_frames),
+            'accuracy': accuracy(scene, sink.rows, fa.estimator)}
+
+
+def accuracy(scene, rows, estimator):
+    """
+    Compares the distances run_frame wrote and the final smoothed rail lines with the ground truth.
+
+    :param scene: RailScene the rows came from
+    :param rows: Rows written by run_frame
+    :param estimator: DistanceEstimator after the last frame
+    :return: dict with the mean absolute and relative distance error, the share of objects without a distance,
+    the largest rail position error in pixels and whether the trajectory matches the curvature
+    """
+    # match every row to its object by the bottom of its box
+    boxes = scene.boxes()
+    y_bottoms = np.array([box[3] for box, _ in boxes])
+    nearest = np.abs(np.array([row[9] for row in rows])[:, None] - y_bottoms[None, :]).argmin(axis=1)
+    true = np.array([boxes[i][1] for i in nearest], dtype=float)
+    estimated = np.array([row[5] for row in rows], dtype=float)
+    known = ~np.isnan(estimated)
+
+    errors = np.abs(estimated[known] - true[known])
+    result = {'distance_mae': float(errors.mean()) if known.any() else None,
+              'distance_mape': float((errors / true[known]).mean() * 100) if known.any() else None,
+              'distance_missing': float(1 - known.mean()) if len(rows) else None,
+              'rail_error_px': None}
+
+    # how far the smoothed rails are from the true ones, at the bottom of the frame and at the farthest object
+    if None not in estimator.left_line and None not in estimator.right_line:
+        ys = [scene.height, scene.object_y(max(scene.distances))]
+        result['rail_error_px'] = max(abs(estimator.calculate_x(line, y) - estimator.calculate_x(true_line, y))
+                                      for line, true_line in zip([estimator.left_line, estimator.right_line],
+                                                                 scene.rail_lines())
+                                      for y in ys)
+    expected = 'Straight Track'
+    if scene.curvature < 0:
+        expected = 'Left Curve'
+    elif scene.curvature > 0:
+        expected = 'Right Curve'
+    result['trajectory_correct'] = estimator.trajectory == expected
+    return result
+
+
+def scene_key(result):
+    return f"{result['width']}x{result['height']} c={result['curvature']:+.3f}"
+
+
+def print_table(results):
+    print(f"{'scene':<22}{'lines ms':>10}{'analyze ms':>12}{'estimate us':>13}{'frame ms':>10}{'frame p95':>11}"
+          f"{'FPS':>8}{'rails':>7}{'MAE':>8}{'MAPE %':>8}{'missing':>9}{'rail px':>9}")
+    for r in results:
+        s, a = r['stages'], r['accuracy']
+        fmt = lambda v, spec: 'n/a' if v is None else format(v, spec)
+        print(f"{scene_key(r):<22}{s['lines']['mean_ms']:>10.2f}{s['analyze_lines']['mean_ms']:>12.3f}"
+              f"{1000 * s['estimate_distance']['mean_ms']:>13.2f}{s['run_frame']['mean_ms']:>10.2f}"
+              f"{s['run_frame']['p95_ms']:>11.2f}{s['run_frame']['per_second']:>8.1f}{r['rails_found']:>7.0%}"
+              f"{fmt(a['distance_mae'], '.2f'):>8}{fmt(a['distance_mape'], '.1f'):>8}"
+              f"{fmt(a['distance_missing'], '.0%'):>9}{fmt(a['rail_error_px'], '.1f'):>9}")
+
+
+def print_comparison(results, baseline):
+    """
+    Prints the mean latency of every stage relative to an earlier run, e.g. 0.80x means 20% less time.
+    """
+    previous = {scene_key(r): r for r in baseline['results']}
+    stages = list(results[0]['stages']) if results else []
+    print(f"\nCompared with {baseline['meta']['timestamp']} (new time / old time):")
+    print(f"{'scene':<22}" + ''.join(f'{name:>19}' for name in stages))
+    for r in results:
+        old = previous.get(scene_key(r))
+        if old is None:
+            print(f'{scene_key(r):<22} not in the baseline')
+            continue
+        print(f'{scene_key(r):<22}' + ''.join(
+            f"{r['stages'][name]['mean_ms'] / old['stages'][name]['mean_ms']:>18.2f}x" for name in stages))
+
+
+def main(resolutions, curvatures, n_frames, repeats, adaptive_roi = False, line_scale = 1.0,
+         output = None, compare = None):
+    detector_kwargs = {'adaptive_roi': adaptive_roi, 'process_scale': line_scale}
+
+    results = []
+    for resolution in resolutions:
+        width, height = (int(v) for v in resolution.lower().split('x'))
+        for curvature in curvatures:
+            results.append(bench_scene(RailScene(width, height, curvature), n_frames, repeats, detector_kwargs))
+
+    print_table(results)
+
+    report = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                       'machine': platform.machine(), 'processor': platform.processor(),
+                       'frames': n_frames, 'repeats': repeats, 'detector': detector_kwargs},
+              'results': results}
+
+    if compare is not None:
+        with open(compare) as file:
+            print_comparison(results, json.load(file))
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic rail scenes with ground truth.')
+    parser.add_argument('--resolutions', nargs='+', default=['960x540', '1280x720', '1920x1080'],
+                        help='Frame sizes as WIDTHxHEIGHT')
+    parser.add_argument('--curvatures', nargs='+', type=float, default=[-0.035, 0.0, 0.035],
+                        help='Sideways vanishing point offsets as a fraction of the width')
+    parser.add_argument('--frames', '-f', type=int, default=30, help='Different frames rendered per scene')
+    parser.add_argument('--repeats', '-r', type=int, default=3, help='Passes over the frames')
+    parser.add_argument('--adaptive-roi', action='store_true', help='Use the adaptive rail-band ROI')
+    parser.add_argument('--line-scale', type=float, default=1.0, help='Processing scale of LineDetector')
+    parser.add_argument('--output', '-o', type=str, default=None, help='JSON file to write the results to')
+    parser.add_argument('--compare', type=str, default=None, help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    main(args.resolutions, args.curvatures, args.frames, args.repeats, args.adaptive_roi, args.line_scale,
+         args.output, args.compare)
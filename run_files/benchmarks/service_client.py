@@ -0,0 +1,158 @@
+"""
+
+File: service_client.py
+
+Description: Test client for run_service.py. It replays a video against a running service from several streams at
+once, one thread and one keep-alive connection per stream, each sending its next frame as soon as the previous answer
+arrives. It checks that every stream gets its frames back in order, counts rejected (503) requests, and reports the
+client-side latency percentiles, the throughput and the service's own /metrics.
+
+Usage:
+Start the service, then run from the run_files directory:
+
+python run_service.py --detector onnx --weights models/yolov8n.onnx
+python -m benchmarks.service_client --video inputs/train_clip.mp4 --streams 4
+
+Command Line Arguments:
+- --video, -v: Video whose frames are sent. Default is 'inputs/train_clip.mp4'.
+- --streams, -s: Number of concurrent streams. Default is 4.
+- --frames, -f: Frames sent per stream, 0 for the whole video. Default is 0.
+- --host: Host of the service. Default is '127.0.0.1'.
+- --port: Port of the service. Default is 8765.
+- --unix: Unix socket of the service, instead of host and port.
+- --quality: JPEG quality of the encoded frames. Default is 90.
+- --output, -o: JSON file to write the last response of every stream and the latencies to.
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    http.client connection over a Unix socket.
+    """
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connect(host, port, unix_path):
+    return UnixHTTPConnection(unix_path) if unix_path else http.client.HTTPConnection(host, port)
+
+
+def request(connection, method, path, body = None):
+    """
+    :return: (status, parsed JSON response)
+    """
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def encode_frames(video, n_frames, quality):
+    """
+    :return: List of the JPEG encoded frames of the video
+    """
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while not n_frames or len(frames) < n_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    cap.release()
+    return frames
+
+
+def run_stream(name, frames, host, port, unix_path, results):
+    """
+    Sends every frame in order on one connection and records the latencies and the responses.
+    """
+    connection = connect(host, port, unix_path)
+    latencies, rejected, out_of_order, last = [], 0, 0, None
+    n_frame = 0
+    while n_frame < len(frames):
+        start = time.perf_counter()
+        status, response = request(connection, 'POST', f'/analyze?stream={name}', frames[n_frame])
+        if status == 503:
+            rejected += 1
+            time.sleep(0.01)
+            continue  # try the same frame again
+        if status != 200:
+            raise RuntimeError(f'{name}: HTTP {status} {response}')
+
+        latencies.append(time.perf_counter() - start)
+        out_of_order += response['frame'] != n_frame
+        last = response
+        n_frame += 1
+    connection.close()
+    results[name] = {'latencies': latencies, 'rejected': rejected, 'out_of_order': out_of_order, 'last': last}
+
+
+def main(video, streams, n_frames, host, port, unix_path, quality, output):
+    frames = encode_frames(video, n_frames, quality)
+    print(f"Sending {len(frames)} frames on each of {streams} streams")
+
+    # start every stream from scratch, in case an earlier run used the same names
+    connection = connect(host, port, unix_path)
+    names = [f'client{i}' for i in range(streams)]
+    for name in names:
+        request(connection, 'DELETE', f'/streams/{name}')
+
+    results = {}
+    threads = [threading.Thread(target=run_stream, args=(name, frames, host, port, unix_path, results))
+               for name in names]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ms = np.concatenate([r['latencies'] for r in results.values()]) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    print(f"{len(ms)} frames in {elapsed:.2f}s ({len(ms) / elapsed:.2f} frames/s), "
+          f"{sum(r['rejected'] for r in results.values())} rejected, "
+          f"{sum(r['out_of_order'] for r in results.values())} out of order")
+    print(f"Client latency: mean {ms.mean():.1f} ms, p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+
+    _, metrics = request(connection, 'GET', '/metrics')
+    connection.close()
+    print(f"Service: {metrics['requests']} requests, {metrics['batches']} batches, "
+          f"{metrics['mean_batch_size']:.2f} frames per batch, {metrics['streams']} streams")
+    for stage, s in metrics['latency'].items():
+        print(f"  {stage:<10} p50 {s['p50_ms']:.2f} ms, p95 {s['p95_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms")
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump({'metrics': metrics, 'streams': {name: {'latencies_ms': [1000 * v for v in r['latencies']],
+                                                              'rejected': r['rejected'], 'last': r['last']}
+                                                       for name, r in results.items()}}, file, indent=2)
+        print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a video against run_service.py from several streams.')
+    parser.add_argument('--video', '-v', type=str, default='inputs/train_clip.mp4', help='Video to send')
+    parser.add_argument('--streams', '-s', type=int, default=4, help='Concurrent streams')
+    parser.add_argument('--frames', '-f', type=int, default=0, help='Frames per stream, 0 for the whole video')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host of the service')
+    parser.add_argument('--port', type=int, default=8765, help='Port of the service')
+    parser.add_argument('--unix', type=str, default=None, help='Unix socket of the service')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the frames')
+    parser.add_argument('--output', '-o', type=str, default=None, help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    main(args.video, args.streams, args.frames, args.host, args.port, args.unix, args.quality, args.output)
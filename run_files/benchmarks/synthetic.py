@@ -0,0 +1,123 @@
+"""
+
+File: synthetic.py
+
+Description: Synthetic rail scenes with known geometry, for benchmarks that need ground truth and no model weights.
+The rails are straight lines that meet at a vanishing point, which is how DistanceEstimator models them. The track
+width at the bottom of the frame is therefore known, and so is the width at every y. An object at distance D (in the
+same units as DistanceEstimator's dist_to_cam) is placed where the track is dist_to_cam / D times as wide as at the
+bottom. Moving the vanishing point sideways gives the slope asymmetry that DistanceEstimator reports as a left or
+right curve.
+
+Classes:
+- RailScene: Geometry of one scene, draws its frames and knows the true rail lines and object boxes.
+
+Usage:
+scene = RailScene(1280, 720, curvature=0.02)
+frames = [scene.render(seed) for seed in range(30)]
+yolo = StubDetector([box for box, _ in scene.boxes()])  # from functions.detectors
+"""
+
+import cv2
+import numpy as np
+
+
+class RailScene:
+
+    def __init__(self, width, height, curvature = 0.0, distances = (14, 19, 28, 38), dist_to_cam = 9.5,
+                 vanishing_y = 0.2, gauge = 1 / 6):
+        """
+        Sets up the geometry of the scene.
+
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param curvature: Sideways offset of the vanishing point as a fraction of the width, negative for a left curve
+        :param distances: True distances of the objects placed on the track
+        :param dist_to_cam: Distance from the camera to the bottom of the frame, same as DistanceEstimator's
+        :param vanishing_y: Height of the vanishing point as a fraction of the height, from the top
+        :param gauge: Track width at the bottom of the frame as a fraction of the width
+        """
+        self.width = width
+        self.height = height
+        self.curvature = curvature
+        self.distances = list(distances)
+        self.dist_to_cam = dist_to_cam
+
+        self.vanishing_point = (width / 2 + curvature * width, vanishing_y * height)
+        half_gauge = gauge * width / 2
+        self.bottom = (width / 2 - half_gauge, width / 2 + half_gauge)
+
+    def rail_lines(self):
+        """
+        :return: True [left_line, right_line] as [intercept, slope] in terms of x = intercept + slope * y
+        """
+        vx, vy = self.vanishing_point
+        lines = []
+        for x_bottom in self.bottom:
+            slope = (x_bottom - vx) / (self.height - vy)
+            lines.append([vx - slope * vy, slope])
+        return lines
+
+    def track_width(self, y):
+        """
+        :return: True distance between the rails in pixels at y
+        """
+        left, right = self.rail_lines()
+        return (right[0] + right[1] * y) - (left[0] + left[1] * y)
+
+    def object_y(self, distance):
+        """
+        :return: y of the bottom of an object at the given distance, where the track is dist_to_cam / distance as wide
+        """
+        vy = self.vanishing_point[1]
+        return vy + (self.height - vy) * self.dist_to_cam / distance
+
+    def boxes(self):
+        """
+        :return: List of ([x1, y1, x2, y2], distance) for every object, centered on the track and sized with it
+        """
+        left, right = self.rail_lines()
+        boxes = []
+        for distance in self.distances:
+            y2 = self.object_y(distance)
+            x_left = left[0] + left[1] * y2
+            x_right = right[0] + right[1] * y2
+            width = x_right - x_left
+            boxes.append(([x_left + 0.1 * width, y2 - 0.9 * width, x_right - 0.1 * width, y2], distance))
+        return boxes
+
+    def render(self, seed = 0):
+        """
+        Draws one frame: gravel-like noise, sleepers, the two rails and a filled box for every object.
+        Different seeds only change the noise, so the geometry and ground truth stay the same.
+
+        :param seed: Seed of the noise
+        :return: BGR frame of shape (height, width, 3)
+        """
+        rng = np.random.default_rng(seed)
+        frame = rng.normal(90, 12, size=(self.height, self.width)).clip(0, 255).astype(np.uint8)
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+        left, right = self.rail_lines()
+        vy = self.vanishing_point[1]
+        thickness = max(3, self.width // 320)
+
+        # sleepers, spaced evenly in distance so they bunch up towards the vanishing point
+        for d in np.arange(self.dist_to_cam, 8 * self.dist_to_cam, self.dist_to_cam / 3):
+            y = int(round(self.object_y(d)))
+            x1 = int(round(left[0] + left[1] * y - 0.1 * self.track_width(y)))
+            x2 = int(round(right[0] + right[1] * y + 0.1 * self.track_width(y)))
+            cv2.line(frame, (x1, y), (x2, y), (60, 70, 80), max(1, thickness // 2))
+
+        # rails, from the bottom of the frame up to just below the vanishing point
+        y_top = int(vy + 0.05 * (self.height - vy))
+        for line in (left, right):
+            top = (int(round(line[0] + line[1] * y_top)), y_top)
+            bottom = (int(round(line[0] + line[1] * self.height)), self.height)
+            cv2.line(frame, top, bottom, (200, 200, 200), thickness, cv2.LINE_AA)
+
+        for (x1, y1, x2, y2), _ in self.boxes():
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (40, 40, 160), -1)
+
+        return frame
+
@@ -0,0 +1,80 @@
+"""
+Command line arguments shared by the run_*.py scripts, so every flag is defined and documented in one place.
+
+Shared Command Line Arguments:
+- --flush-frames: Number of frames of detections buffered before the detection log is written. Default is 30.
+- --flush-seconds: Maximum seconds detections stay buffered before the detection log is written. Default is 1.0.
+- --format: Detection log format, 'csv' or 'columnar'. Default is 'csv'.
+- --track: Track objects across frames, adding a track ID, smoothed distance and closing speed to every row.
+- --detect-every: Only run the object detector on every Nth frame. In between, tracks are propagated (with --track) or
+  the previous boxes are reused. Default is 1.
+- --adaptive-roi: Run Canny/Hough only in narrow bands around the previous frames' rail lines instead of the fixed
+  crop, falling back to the fixed crop when the rails are lost.
+- --line-scale: Run the line detection on a region of interest downscaled by this factor. Default is 1.0. See
+  benchmarks/bench_line_scale.py for the speed/accuracy trade-off.
+- --smoothing: How the rail lines of previous frames are combined, 'mean', 'ewm' or 'median'. Default is 'mean'.
+- --line-gate: Reuse the previous rail lines on frames whose rail region differs from the last analyzed one by less
+  than this mean gray level difference (0-255), e.g. 2. Off by default. See functions/line_gate.py.
+- --line-gate-max-reuse: Maximum frames in a row that reuse the rail lines before they are detected again. Default is 5.
+- --profile: Time every stage (YOLO, line detection, clustering, distances, writing, drawing) and print rolling
+  p50/p95/p99 latencies every 10 seconds and at the end.
+- --profile-stats: Write the profiling summaries to this JSON file instead of printing them.
+- --detector: Object detector backend, 'ultralytics' (PyTorch), 'onnx' (ONNX Runtime on the CPU, needs an exported
+  model, see functions/detectors.py) or 'stub' (no objects, no weights needed). Default is 'ultralytics'.
+- --weights: Model file of the detector. Default is 'models/yolov8n.pt', or 'models/yolov8n.onnx' for onnx.
+
+Methods:
+- add_log_arguments(parser): Add --flush-frames, --flush-seconds and --format.
+- add_analysis_arguments(parser): Add --track, --detect-every and the rail line flags.
+- add_profile_arguments(parser): Add --profile and --profile-stats.
+- add_detector_arguments(parser): Add --detector and --weights.
+"""
+
+
+def add_log_arguments(parser):
+    """
+    :param parser: argparse.ArgumentParser of the script
+    """
+    parser.add_argument('--flush-frames', type=int, default=30,
+                        help='Frames of detections to buffer before writing the log')
+    parser.add_argument('--flush-seconds', type=float, default=1.0,
+                        help='Seconds detections can stay buffered before writing the log')
+    parser.add_argument('--format', type=str, default='csv', choices=['csv', 'columnar'],
+                        help='Detection log format: csv text or a typed columnar binary log')
+
+
+def add_analysis_arguments(parser):
+    """
+    :param parser: argparse.ArgumentParser of the script
+    """
+    parser.add_argument('--track', action='store_true',
+                        help='Track objects for stable IDs, smoothed distances and closing speeds')
+    parser.add_argument('--detect-every', type=int, default=1, help='Only run the detector on every Nth frame')
+    parser.add_argument('--adaptive-roi', action='store_true',
+                        help='Search for the rails only in bands around the previous frames\' rail lines')
+    parser.add_argument('--line-scale', type=float, default=1.0,
+                        help='Scale the region of interest by this factor before the Hough transform, e.g. 0.5')
+    parser.add_argument('--smoothing', type=str, default='mean', choices=['mean', 'ewm', 'median'],
+                        help='How the rail lines of previous frames are smoothed')
+    parser.add_argument('--line-gate', type=float, default=None,
+                        help='Reuse the rail lines on frames whose rail region changed less than this, e.g. 2')
+    parser.add_argument('--line-gate-max-reuse', type=int, default=5,
+                        help='Maximum frames in a row that reuse the rail lines')
+
+
+def add_profile_arguments(parser):
+    """
+    :param parser: argparse.ArgumentParser of the script
+    """
+    parser.add_argument('--profile', action='store_true', help='Time every stage and report latency percentiles')
+    parser.add_argument('--profile-stats', type=str, default=None,
+                        help='JSON file the profiling summaries are written to (implies --profile)')
+
+
+def add_detector_arguments(parser):
+    """
+    :param parser: argparse.ArgumentParser of the script
+    """
+    parser.add_argument('--detector', type=str, default='ultralytics', choices=['ultralytics', 'onnx', 'stub'],
+                        help='Object detector backend')
+    parser.add_argument('--weights', type=str, default=None, help='Model file of the detector backend')
@@ -0,0 +1,407 @@
+"""
+Classes for writing detection rows to an output log that stays open for a whole run, and for reading them back.
+
+Rows are buffered in memory and written out every N frames or every T seconds, whichever comes first,
+so long videos and live feeds don't pay for an open/close per frame and keep their full history.
+Two formats are available:
+- csv: one text row per detection, easy to open anywhere.
+- columnar: a directory holding one typed binary file per column plus a small meta.json. Class names and
+  trajectories are dictionary encoded, every flush appends one chunk to each column, and ColumnarLog can
+  memory-map the columns or pull out a frame range without parsing the whole file.
+
+Attributes:
+- HEADER (list): Column names shared by image, video and live mode.
+- IMAGE_HEADER (list): HEADER with a leading Image column, for logs that merge the rows of many images.
+- COLUMNS (list): (name, dtype) of every column in the columnar format, in HEADER order.
+- SINK_FORMATS (dict): Format name -> sink class, used by the --format flag of the entry points.
+
+Classes:
+- DetectionSink: Buffering and flushing shared by every sink.
+- CsvSink: Writes rows to a CSV file.
+- MemorySink: Keeps the rows in a list, e.g. to send them to another process.
+- ColumnarSink: Appends rows to a columnar binary log.
+- ColumnarLog: Reads a columnar binary log through memory maps.
+
+Functions:
+- open_sink(fmt, path, flush_frames=30, flush_seconds=1.0): Open a sink of the given format.
+- merge_logs(fmt, parts, path): Concatenate logs of the same format, e.g. the chunks of a video, into one.
+"""
+
+import csv
+import json
+import math
+import os
+import shutil
+import time
+import numpy as np
+
+
+HEADER = ['Frame', 'Trajectory', 'Class ID', 'Object Name',
+          'Confidence', 'Distance', 'X1', 'Y1', 'X2', 'Y2',
+          'Track ID', 'Smoothed Distance', 'Closing Speed']
+
+IMAGE_HEADER = ['Image'] + HEADER
+
+COLUMNS = [('frame', '<i8'), ('trajectory', '<i2'), ('class_id', '<i2'), ('object_name', '<i2'),
+           ('confidence', '<f4'), ('distance', '<f4'),
+           ('x1', '<f4'), ('y1', '<f4'), ('x2', '<f4'), ('y2', '<f4'),
+           ('track_id', '<i4'), ('smoothed_distance', '<f4'), ('closing_speed', '<f4')]
+
+# columns that hold codes into a dictionary of strings, -1 means missing
+DICTIONARY_COLUMNS = ['trajectory', 'object_name']
+
+
+class DetectionSink:
+    HEADER = HEADER
+
+    def __init__(self, path, flush_frames = 30, flush_seconds = 1.0):
+        """
+        Sets up the buffer. Subclasses open their files before calling this.
+
+        :param path: Path to write output
+        :param flush_frames: How many frames of rows to buffer before writing them out
+        :param flush_seconds: How long rows can sit in the buffer before writing them out
+        """
+        self.path = path
+        self.flush_frames = flush_frames
+        self.flush_seconds = flush_seconds
+
+        self.buffer = []
+        self.frames_buffered = 0
+        self.last_flush = time.monotonic()
+        self.closed = False
+
+    def write_frame(self, rows):
+        """
+        Buffers the rows of one frame and writes them to disk once enough frames or time has passed.
+
+        :param rows: List of rows in HEADER order
+        :return: None
+        """
+        self.buffer.extend(rows)
+        self.frames_buffered += 1
+
+        if (self.frames_buffered >= self.flush_frames
+                or time.monotonic() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every buffered row to disk.
+
+        :return: None
+        """
+        self.write_rows(self.buffer)
+        self.buffer.clear()
+
+        self.frames_buffered = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Flushes whatever is left in the buffer and closes the output. Safe to call more than once.
+
+        :return: None
+        """
+        if not self.closed:
+            self.flush()
+            self.close_output()
+            self.closed = True
+
+    def write_rows(self, rows):
+        """
+        Writes a chunk of rows to disk and makes sure they reach the OS. Implemented by each format.
+
+        :param rows: List of rows in HEADER order (may be empty)
+        """
+        raise NotImplementedError
+
+    def close_output(self):
+        """
+        Closes the files of the format. Implemented by each format.
+        """
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvSink(DetectionSink):
+
+    def __init__(self, path, flush_frames = 30, flush_seconds = 1.0, header = None, append = False):
+        """
+        Opens the CSV file (clearing whatever was there) and writes the header.
+
+        :param path: Path to write CSV output
+        :param flush_frames: How many frames of rows to buffer before writing them out
+        :param flush_seconds: How long rows can sit in the buffer before writing them out
+        :param header: Column names, defaults to HEADER
+        :param append: Add to an existing file instead of clearing it, the header is only written to an empty file
+        """
+        if header is not None:
+            self.HEADER = header
+        self.file = open(path, mode='a' if append else 'w', newline='')
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(self.HEADER)
+        super().__init__(path, flush_frames, flush_seconds)
+
+    def write_rows(self, rows):
+        if rows:
+            self.writer.writerows(rows)
+        self.file.flush()
+
+    def close_output(self):
+        self.file.close()
+
+
+class MemorySink(DetectionSink):
+
+    def __init__(self):
+        """
+        Keeps every row in self.rows instead of writing them anywhere.
+        """
+        self.rows = []
+        super().__init__(None, flush_frames=1)
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+
+    def close_output(self):
+        pass
+
+
+class ColumnarSink(DetectionSink):
+
+    def __init__(self, path, flush_frames = 30, flush_seconds = 1.0):
+        """
+        Creates the log directory (clearing an older log there) and opens one binary file per column.
+
+        :param path: Directory to write the columnar log to
+        :param flush_frames: How many frames of rows to buffer before appending a chunk
+        :param flush_seconds: How long rows can sit in the buffer before appending a chunk
+        """
+        os.makedirs(path, exist_ok=True)
+        self.files = {name: open(os.path.join(path, f'{name}.bin'), mode='wb') for name, _ in COLUMNS}
+        self.dictionaries = {name: [] for name in DICTIONARY_COLUMNS}
+        self.codes = {name: {} for name in DICTIONARY_COLUMNS}
+        self.rows = 0
+        super().__init__(path, flush_frames, flush_seconds)
+        self.write_meta()
+
+    def encode(self, column, value):
+        """
+        Looks up (or adds) the dictionary code of a string value.
+
+        :param column: Name of a dictionary column
+        :param value: String to encode, None is stored as -1
+        :return: Integer code
+        """
+        if value is None:
+            return -1
+        codes = self.codes[column]
+        if value not in codes:
+            codes[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return codes[value]
+
+    @staticmethod
+    def to_float(value):
+        """
+        Converts a value to float, anything that isn't a number (e.g. 'Error: No Lines Detected' or None) becomes NaN.
+        """
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+
+        # split the rows into columns and convert every column to its stored type
+        (frame, trajectory, class_id, object_name, conf, distance, x1, y1, x2, y2,
+         track_id, smoothed_distance, closing_speed) = zip(*rows)
+        values = {
+            'frame': frame,
+            'trajectory': [self.encode('trajectory', t) for t in trajectory],
+            'class_id': class_id,
+            'object_name': [self.encode('object_name', n) for n in object_name],
+            'confidence': conf,
+            'distance': [self.to_float(d) for d in distance],
+            'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+            'track_id': [-1 if t is None else t for t in track_id],
+            'smoothed_distance': [self.to_float(d) for d in smoothed_distance],
+            'closing_speed': [self.to_float(v) for v in closing_speed],
+        }
+
+        # append one chunk to every column
+        for name, dtype in COLUMNS:
+            file = self.files[name]
+            file.write(np.asarray(values[name], dtype=dtype).tobytes())
+            file.flush()
+
+        self.rows += len(rows)
+        self.write_meta()
+
+    def write_meta(self):
+        """
+        Rewrites meta.json with the row count and dictionaries. The row count is only bumped after the
+        column chunks are written, so a reader never sees a half written chunk.
+        """
+        meta = {
+            'rows': self.rows,
+            'columns': dict(COLUMNS),
+            'header': dict(zip([name for name, _ in COLUMNS], HEADER)),
+            'dictionaries': self.dictionaries,
+        }
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+
+    def close_output(self):
+        for file in self.files.values():
+            file.close()
+
+
+class ColumnarLog:
+
+    def __init__(self, path):
+        """
+        Opens a log written by ColumnarSink. Nothing is parsed besides meta.json.
+
+        :param path: Directory of the columnar log
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        self.rows = meta['rows']
+        self.dtypes = meta['columns']
+        self.header = meta['header']
+        self.dictionaries = meta['dictionaries']
+
+    def column(self, name):
+        """
+        Memory maps one column. Only the pages that are actually touched get read from disk.
+
+        :param name: Column name, see COLUMNS
+        :return: Read-only array of length self.rows
+        """
+        dtype = np.dtype(self.dtypes[name])
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=dtype, mode='r', shape=(self.rows,))
+
+    def frame_slice(self, start = None, stop = None):
+        """
+        Finds the rows of frames start <= frame < stop with a binary search, since frames are written in order.
+
+        :param start: First frame to include (optional)
+        :param stop: First frame to exclude (optional)
+        :return: slice of row indices
+        """
+        frames = self.column('frame')
+        lo = 0 if start is None else int(np.searchsorted(frames, start, side='left'))
+        hi = self.rows if stop is None else int(np.searchsorted(frames, stop, side='left'))
+        return slice(lo, hi)
+
+    def read(self, start = None, stop = None, columns = None):
+        """
+        Reads the given columns for a frame range into memory.
+
+        :param start: First frame to include (optional)
+        :param stop: First frame to exclude (optional)
+        :param columns: Column names to read, defaults to all of them
+        :return: dict of column name -> numpy array
+        """
+        rows = self.frame_slice(start, stop)
+        columns = columns or list(self.dtypes)
+        return {name: np.array(self.column(name)[rows]) for name in columns}
+
+    def decode(self, column, codes):
+        """
+        Turns dictionary codes back into strings (None for missing).
+        """
+        dictionary = self.dictionaries[column]
+        return [dictionary[code] if code >= 0 else None for code in codes]
+
+    def to_dataframe(self, start = None, stop = None):
+        """
+        Loads a frame range into a pandas dataframe with the same column names as the CSV output.
+        Dictionary columns become pandas categoricals.
+
+        :param start: First frame to include (optional)
+        :param stop: First frame to exclude (optional)
+        :return: pandas DataFrame
+        """
+        import pandas as pd
+
+        data = self.read(start, stop)
+        for name in DICTIONARY_COLUMNS:
+            data[name] = pd.Categorical.from_codes(data[name], categories=self.dictionaries[name])
+        return pd.DataFrame({self.header[name]: data[name] for name in self.dtypes})
+
+
+SINK_FORMATS = {'csv': CsvSink, 'columnar': ColumnarSink}
+
+
+def open_sink(fmt, path, flush_frames = 30, flush_seconds = 1.0):
+    """
+    Opens a sink of the given output format.
+
+    :param fmt: 'csv' or 'columnar'
+    :param path: CSV file or columnar log directory to write to
+    :param flush_frames: How many frames of rows to buffer before writing them out
+    :param flush_seconds: How long rows can sit in the buffer before writing them out
+    :return: DetectionSink
+    """
+    if fmt not in SINK_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    return SINK_FORMATS[fmt](path, flush_frames=flush_frames, flush_seconds=flush_seconds)
+
+
+def merge_logs(fmt, parts, path):
+    """
+    Concatenates detection logs of the same format into one, in the given order.
+    CSV files are copied without their headers. Columnar logs are copied column by column, with the
+    dictionary codes of every part mapped onto one shared dictionary.
+
+    :param fmt: 'csv' or 'columnar'
+    :param parts: Paths of the logs to merge, in order
+    :param path: CSV file or columnar log directory to write the merged log to
+    :return: None
+    """
+    if fmt not in SINK_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as merged:
+            csv.writer(merged).writerow(HEADER)
+            for part in parts:
+                with open(part, newline='') as file:
+                    file.readline()  # skip the header
+                    shutil.copyfileobj(file, merged)
+        return
+
+    sink = ColumnarSink(path)
+    try:
+        for part in parts:
+            log = ColumnarLog(part)
+            for name, dtype in COLUMNS:
+                values = np.asarray(log.column(name))
+                if name in DICTIONARY_COLUMNS:
+                    # code -1 (missing) stays -1, the lookup table is shifted by one for it
+                    mapping = np.array([-1] + [sink.encode(name, value) for value in log.dictionaries[name]],
+                                       dtype=dtype)
+                    values = mapping[values + 1]
+                sink.files[name].write(values.astype(dtype, copy=False).tobytes())
+            sink.rows += log.rows
+        for file in sink.files.values():
+            file.flush()
+        sink.write_meta()
+    finally:
+        sink.close()
@@ -0,0 +1,246 @@
+"""
+Object detector backends that all return plain NumPy arrays.
+
+FrameAnalyzer only needs the boxes, scores and classes of every frame. Each backend wraps one way of getting them
+behind the same call signature as an ultralytics YOLO model: call it with one frame or a list of frames, and it returns
+a list with one Detections per frame. Heavy libraries are only imported when their backend is built.
+- ultralytics: The original YOLO('models/yolov8n.pt') model, run by PyTorch.
+- onnx: A YOLOv8 model exported to ONNX (`yolo export model=models/yolov8n.pt format=onnx`), run by ONNX Runtime on
+  the CPU. It doesn't need torch at all, and starts and runs faster on machines without a GPU. Other ONNX Runtime
+  execution providers (e.g. OpenVINOExecutionProvider) can be passed in `providers`.
+- stub: Returns the same fixed boxes for every frame. Deterministic and needs no weights, for tests and benchmarks.
+
+Classes:
+- Detections: Boxes, scores and classes of one frame.
+- DetectorBackend: Base class, turns a single frame call into a batch call.
+- UltralyticsDetector: ultralytics YOLO backend.
+- OnnxDetector: ONNX Runtime backend with letterboxing and class-aware NMS.
+- StubDetector: Fixed detections.
+
+Attributes:
+- DETECTOR_BACKENDS (dict): Backend name -> class, used by the --detector flag of the entry points.
+- DEFAULT_WEIGHTS (dict): Backend name -> default model path.
+
+Functions:
+- load_detector(backend, weights=None, **kwargs): Build a backend by name.
+"""
+
+import ast
+import cv2
+import numpy as np
+
+
+class Detections:
+
+    def __init__(self, boxes, scores, classes, names):
+        """
+        :param boxes: (N, 4) [x1, y1, x2, y2] in frame pixels
+        :param scores: (N,) confidences
+        :param classes: (N,) class IDs
+        :param names: dict of class ID -> class name
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.classes = np.asarray(classes, dtype=np.int64).reshape(-1)
+        self.names = names
+
+    def __len__(self):
+        return len(self.scores)
+
+
+class DetectorBackend:
+    names = {}
+
+    def __call__(self, frames):
+        """
+        Detects objects like an ultralytics model: a single frame or a list of frames in, a list of results out.
+
+        :param frames: BGR frame or list of BGR frames
+        :return: List with one Detections per frame
+        """
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        if len(frames) == 0:
+            return []
+        return self.detect_batch(list(frames))
+
+    def detect_batch(self, frames):
+        """
+        Runs the model on a list of frames. Implemented by each backend.
+
+        :param frames: List of BGR frames
+        :return: List of Detections
+        """
+        raise NotImplementedError
+
+
+class UltralyticsDetector(DetectorBackend):
+
+    def __init__(self, weights = 'models/yolov8n.pt'):
+        """
+        Loads an ultralytics YOLO model.
+
+        :param weights: Path of the .pt weights
+        """
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.names = self.model.names
+
+    def detect_batch(self, frames):
+        detections = []
+        for result in self.model(frames):
+            boxes = result.boxes
+            detections.append(Detections(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                         boxes.cls.cpu().numpy(), result.names))
+        return detections
+
+
+class OnnxDetector(DetectorBackend):
+
+    def __init__(self, weights = 'models/yolov8n.onnx', conf_threshold = 0.25, iou_threshold = 0.7, max_det = 300,
+                 providers = None, threads = None, names = None):
+        """
+        Loads a YOLOv8 ONNX export into an ONNX Runtime session.
+
+        :param weights: Path of the .onnx model
+        :param conf_threshold: Minimum confidence of a box (ultralytics default 0.25)
+        :param iou_threshold: IoU above which NMS drops the weaker of two boxes of the same class (ultralytics default 0.7)
+        :param max_det: Maximum number of boxes per frame
+        :param providers: ONNX Runtime execution providers, defaults to the CPU provider
+        :param threads: Number of intra-op threads, ONNX Runtime picks if not given
+        :param names: Class ID -> name, read from the model's metadata if not given
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(weights, options, providers=providers or ['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # [batch, 3, height, width], dynamic dimensions are strings
+        batch, _, height, width = model_input.shape
+        self.input_size = (height if isinstance(height, int) else 640, width if isinstance(width, int) else 640)
+        self.dynamic_batch = not isinstance(batch, int)
+
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+
+        # ultralytics stores the class names as a dict literal in the metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = names or (ast.literal_eval(metadata['names']) if 'names' in metadata else {})
+
+    def letterbox(self, frame):
+        """
+        Resizes the frame to fit the model input without distorting it and pads the rest with gray.
+
+        :param frame: BGR frame
+        :return: padded frame, scale ratio, (x padding, y padding)
+        """
+        height, width = self.input_size
+        ratio = min(height / frame.shape[0], width / frame.shape[1])
+        new_w, new_h = round(frame.shape[1] * ratio), round(frame.shape[0] * ratio)
+        pad_x, pad_y = (width - new_w) / 2, (height - new_h) / 2
+
+        if (new_w, new_h) != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, left = round(pad_y - 0.1), round(pad_x - 0.1)
+        frame = cv2.copyMakeBorder(frame, top, height - new_h - top, left, width - new_w - left,
+                                   cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return frame, ratio, (left, top)
+
+    def detect_batch(self, frames):
+        letterboxed = [self.letterbox(frame) for frame in frames]
+        # NCHW float32 in [0, 1], RGB
+        blob = cv2.dnn.blobFromImages([padded for padded, _, _ in letterboxed], 1 / 255.0, swapRB=True)
+
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: blob})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: blob[i:i + 1]})[0]
+                                      for i in range(len(frames))])
+
+        return [self.postprocess(output, frame.shape, ratio, pad)
+                for output, frame, (_, ratio, pad) in zip(outputs, frames, letterboxed)]
+
+    def postprocess(self, output, shape, ratio, pad):
+        """
+        Turns the raw output of one frame into boxes in frame pixels.
+
+        :param output: (4 + classes, anchors) array of [cx, cy, w, h, class scores...]
+        :param shape: Shape of the original frame
+        :param ratio: Letterbox scale ratio
+        :param pad: Letterbox (x, y) padding
+        :return: Detections
+        """
+        predictions = output.T
+        class_scores = predictions[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(classes)), classes]
+
+        keep = scores > self.conf_threshold
+        predictions, classes, scores = predictions[keep], classes[keep], scores[keep]
+        if len(scores) == 0:
+            return Detections(np.empty((0, 4)), [], [], self.names)
+
+        # cx, cy, w, h in model input pixels -> x1, y1, x2, y2 in frame pixels
+        cx, cy, w, h = predictions[:, :4].T
+        boxes = np.column_stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2))
+        boxes = (boxes - np.array([pad[0], pad[1], pad[0], pad[1]])) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+
+        # class-aware NMS: shift every class far apart so boxes of different classes never overlap
+        offsets = classes[:, None] * (max(shape) + 1)
+        shifted = boxes + offsets
+        rects = np.column_stack((shifted[:, :2], shifted[:, 2:] - shifted[:, :2]))
+        indices = cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(), self.conf_threshold, self.iou_threshold)
+        indices = np.asarray(indices, dtype=int).reshape(-1)[:self.max_det]
+
+        return Detections(boxes[indices], scores[indices], classes[indices], self.names)
+
+
+class StubDetector(DetectorBackend):
+
+    def __init__(self, boxes = (), scores = None, classes = None, names = None):
+        """
+        Returns the same detections for every frame.
+
+        :param boxes: List of [x1, y1, x2, y2], empty by default so only the rail lines are analyzed
+        :param scores: Confidence of every box, 0.9 if not given
+        :param classes: Class ID of every box, 0 if not given
+        :param names: Class ID -> name, defaults to {0: 'person'}
+        """
+        n_boxes = len(boxes)
+        self.names = names or {0: 'person'}
+        self.detections = Detections(np.asarray(boxes, dtype=float).reshape(-1, 4),
+                                     [0.9] * n_boxes if scores is None else scores,
+                                     [0] * n_boxes if classes is None else classes,
+                                     self.names)
+
+    def detect_batch(self, frames):
+        return [self.detections] * len(frames)
+
+
+DETECTOR_BACKENDS = {'ultralytics': UltralyticsDetector, 'onnx': OnnxDetector, 'stub': StubDetector}
+
+DEFAULT_WEIGHTS = {'ultralytics': 'models/yolov8n.pt', 'onnx': 'models/yolov8n.onnx'}
+
+
+def load_detector(backend, weights = None, **kwargs):
+    """
+    Builds a detector backend by name.
+
+    :param backend: 'ultralytics', 'onnx' or 'stub'
+    :param weights: Model path, defaults to DEFAULT_WEIGHTS (ignored by the stub)
+    :param kwargs: Further arguments of the backend class
+    :return: DetectorBackend
+    """
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    if backend == 'stub':
+        return StubDetector(**kwargs)
+    return DETECTOR_BACKENDS[backend](weights or DEFAULT_WEIGHTS[backend], **kwargs)
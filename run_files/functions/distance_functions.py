@@ -2,32 +2,44 @@
 A class for estimating distance to an object from a camera based on train track perspective in an image.
 
 Attributes:
-- deque_length (int): Number of previous line calculations to average.
+- deque_length (int): Number of previous line calculations to smooth over.
 - dist_to_cam (float): Distance from camera to bottom of frame where tracks become visible.
 - left_line, right_line (list): Slope and intercept of left and right lines.
 - trajectory (str): Estimated direction of train tracks (left curve, right curve, straight track).
+- cluster_method (str): 'numpy' for the vectorized 2-means path, 'kmeans' for the sklearn KMeans path.
+- centroids (np.ndarray): [intercept, slope] centroids of the previous frame's clusters (numpy path only).
+- left_smoother, right_smoother (RingSmoother): Ring buffers of the previous frames' [intercept, slope].
 
 Methods:
-- __init__(self, deque_length=10, dist_to_cam=9.5): Initialize the DistanceEstimator class.
-- analyze_lines(self, lines): Apply k_cluster equation to hough lines if lines > 0.
-- k_cluster_lines(self, lines): Cluster lines into left and right lines using KMeans clustering.
+- __init__(self, deque_length=10, dist_to_cam=9.5, cluster_method='numpy', smoothing='mean', smoothing_alpha=0.3):
+  Initialize the DistanceEstimator class.
+- analyze_lines(self, lines, params=None): Apply k_cluster equation to hough lines if lines > 0.
+- k_cluster_lines(self, lines, params=None): Cluster lines into left and right lines (NumPy 2-means or sklearn KMeans).
+- kmeans_cluster_lines(self, lines): Original pandas/sklearn KMeans clustering path, kept for comparison.
+- two_means(self, X): Deterministic 2-means clustering warm started from the previous frame's centroids.
 - slope_intercept(self, line): Calculate slope and intercept of a line.
+- slope_intercepts(self, lines): Calculate slopes and intercepts of every line at once.
 - fit_line_equations(self): Update left and right lines based on previous frames' averages.
+- smooth_line(smoother, line): Add a detected line to its smoother and return the smoothed line.
+- get_state(self), set_state(self, state): Smoothed line state as a JSON serializable dict and back.
+- save_state(self, path), load_state(self, path): Write/read the line state to/from a JSON file for warm starts.
 - estimate_distance(self, y0, y1): Determine object distance based on track width at two y coordinates.
+- estimate_distances(self, y0, y_bottoms): Vectorized estimate_distance for all boxes of a frame, NaN if unknown.
 - calculate_x(self, line, y): Calculate x value of a point on the line given y value.
 - calculate_distance(self, w0, w1): Calculate object distance using the law of similar triangles.
 - turn_guesstimation(self): Estimate direction of train tracks based on slopes of left and right lines.
 """
 
 
-import pandas as pd
+import json
+import os
 import numpy as np
-from sklearn.cluster import KMeans
-from collections import deque
+from .smoothing import RingSmoother
 
 class DistanceEstimator:
 
-    def __init__(self, deque_length = 10, dist_to_cam = 9.5):
+    def __init__(self, deque_length = 10, dist_to_cam = 9.5, cluster_method = 'numpy',
+                 smoothing = 'mean', smoothing_alpha = 0.3):
         """
         Initiates the class.
         
@@ -35,46 +47,109 @@ class DistanceEstimator:
         taking the average of when calculating distance
         :param dist_to_cam: This is the distance from the camera to the bottom of the
         frame where the train tracks become visible
+        :param cluster_method: 'numpy' clusters the lines with a vectorized 2-means that is
+        warm started from the previous frame, 'kmeans' uses the original sklearn KMeans path
+        :param smoothing: How the lines of previous frames are combined: 'mean' (running average of the window),
+        'ewm' (exponentially weighted mean) or 'median'
+        :param smoothing_alpha: Weight of the newest line in 'ewm' smoothing
         """
-        # information for storing slopes and intercepts of previous frames
+        if cluster_method not in ('numpy', 'kmeans'):
+            raise ValueError(f"Unknown cluster_method: {cluster_method}")
+        # information for storing intercepts and slopes of previous frames
         self.left_line = [None,None]
-        self.left_intercepts = deque(maxlen = deque_length)
-        self.left_slopes = deque(maxlen=deque_length)
+        self.left_smoother = RingSmoother(deque_length, mode=smoothing, alpha=smoothing_alpha)
 
         self.right_line = [None,None]
-        self.right_intercepts = deque(maxlen=deque_length)
-        self.right_slopes = deque(maxlen=deque_length)
+        self.right_smoother = RingSmoother(deque_length, mode=smoothing, alpha=smoothing_alpha)
 
         self.trajectory = None
 
-        self.kmeans = KMeans(n_clusters=2, n_init=10)
+        self.cluster_method = cluster_method
+        self.kmeans = None
+        if cluster_method == 'kmeans':
+            # sklearn (and pandas) take a while to import, so only the kmeans path loads them
+            from sklearn.cluster import KMeans
+            self.kmeans = KMeans(n_clusters=2, n_init=10)
+
+        # centroids of the previous frame, used to warm start the numpy clustering
+        self.centroids = None
 
         # should be a *constant or relatively unchanging value
         self.d0 = dist_to_cam
 
-    def analyze_lines(self,lines):
+    def analyze_lines(self, lines, params = None):
         """
         Applies the k_cluster equation to the hough lines if lines > 0.
         
         inputs lines, kcluster them, fit them to self object, guess on left or right turn
         :param lines: list of [x1,y1,x2,y2]
+        :param params: (N, 2) [intercept, slope] of the lines if the detector already computed them (optional)
         :return: None
         """
         if len(lines) > 0:
-            self.k_cluster_lines(lines)
+            self.k_cluster_lines(lines, params)
             self.fit_line_equations()
             self.turn_guesstimation()
 
 
-    def k_cluster_lines(self, lines):
+    def k_cluster_lines(self, lines, params = None):
         """
         This is a function that will intake a vector of subvectors
         and then run k-means clustering on them to find the two lines
         that can be used to calculate the distance of an object.
         
         :param lines: vector of subvectors containing [x1,y1,x2,y2]
+        :param params: (N, 2) [intercept, slope] of the lines if already computed (optional)
         :return: slope and intercept for two values
         """
+        if self.cluster_method == 'kmeans':
+            return self.kmeans_cluster_lines(lines)
+
+        # calculate intercept and slope for every line at once (unless the detector did), columns are [intercept, slope]
+        X = np.asarray(params, dtype=float) if params is not None else self.slope_intercepts(lines)
+
+        # split the lines into two groups
+        groups = self.two_means(X)
+
+        left_mask = np.zeros(X.shape[0], dtype=bool)
+        right_mask = np.zeros(X.shape[0], dtype=bool)
+
+        # loop through each group
+        for group in np.unique(groups):
+            members = groups == group
+            slope = X[members, 1].mean()
+
+            # identify if group is the left line by having a negative slope
+            if slope < -0.05:
+                left_mask |= members
+            # positive slope = right line
+            elif slope > 0.05:
+                right_mask |= members
+
+        # failsafe
+        self.left_line = [None, None]
+        self.right_line = [None, None]
+
+        if left_mask.any():
+            intercept, slope = X[left_mask].mean(axis=0)
+            self.left_line = [float(intercept), float(slope)]
+
+        if right_mask.any():
+            intercept, slope = X[right_mask].mean(axis=0)
+            self.right_line = [float(intercept), float(slope)]
+
+
+    def kmeans_cluster_lines(self, lines):
+        """
+        This is the original clustering path. It fills a dataframe row by row and fits
+        a fresh sklearn KMeans every frame. It is slow, but kept so results can be
+        compared against the numpy path.
+        
+        :param lines: vector of subvectors containing [x1,y1,x2,y2]
+        :return: slope and intercept for two values
+        """
+        import pandas as pd
+
         # creating empty dataframe to store intercepts and slopes in
         X = pd.DataFrame(np.zeros(shape = (lines.shape[0], 3)))
         X.columns = ['intercept','slope','group']
@@ -118,6 +193,61 @@ class DistanceEstimator:
             self.right_line = [right_line['intercept'], right_line['slope']]
 
 
+    def two_means(self, X, max_iter = 10):
+        """
+        Splits the [intercept, slope] rows into two clusters with Lloyd's algorithm.
+        The first guess is the previous frame's centroids, since the rails barely move
+        between frames. With no history (or if a cluster comes out empty) the lines
+        with the smallest and largest slope are used instead, so the result is deterministic.
+
+        :param X: (N, 2) array of [intercept, slope]
+        :param max_iter: Maximum number of Lloyd iterations
+        :return: (N,) array of group labels (0 or 1)
+        """
+        if X.shape[0] < 2:
+            return np.zeros(X.shape[0], dtype=int)
+
+        labels, centroids = None, None
+        if self.centroids is not None:
+            labels, centroids = self._lloyd(X, self.centroids, max_iter)
+
+        # cold start if there is no history or the warm start collapsed to one cluster
+        if labels is None or np.unique(labels).size < 2:
+            order = np.argsort(X[:, 1], kind='stable')
+            labels, centroids = self._lloyd(X, X[[order[0], order[-1]]], max_iter)
+
+        self.centroids = centroids
+        return labels
+
+    @staticmethod
+    def _lloyd(X, centroids, max_iter):
+        """
+        Runs Lloyd iterations for two clusters starting from the given centroids.
+
+        :param X: (N, 2) array of [intercept, slope]
+        :param centroids: (2, 2) array of starting centroids
+        :param max_iter: Maximum number of iterations
+        :return: labels and final centroids
+        """
+        centroids = np.array(centroids, dtype=float)
+        labels = np.zeros(X.shape[0], dtype=int)
+        for _ in range(max_iter):
+            distances = ((X[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+            labels = distances.argmin(axis=1)
+
+            new_centroids = centroids.copy()
+            for k in range(2):
+                members = labels == k
+                if members.any():
+                    new_centroids[k] = X[members].mean(axis=0)
+
+            if np.allclose(new_centroids, centroids):
+                break
+            centroids = new_centroids
+
+        return labels, centroids
+
+
     def slope_intercept(self, line):
         """
         Calculates the slopes and intercepts of the line.
@@ -139,36 +269,100 @@ class DistanceEstimator:
         return intercept, slope
 
 
+    def slope_intercepts(self, lines):
+        """
+        Calculates the slopes and intercepts of every line in one shot.
+        Lines with y2 == y1 get a slope and intercept of 0, same as slope_intercept.
+
+        :param lines: (N, 1, 4) array of lines [[x1, y1, x2, y2]]
+        :return: (N, 2) array of [intercept, slope]
+        """
+        coords = np.asarray(lines, dtype=float).reshape(-1, 4)
+        x1, y1, x2, y2 = coords.T
+
+        dy = y2 - y1
+        valid = dy != 0
+
+        # calculate slope and intercept in terms of x = intercept + slope * y
+        slope = np.zeros(coords.shape[0])
+        slope[valid] = (x2[valid] - x1[valid]) / dy[valid]
+        intercept = np.where(valid, x1 - slope * y1, 0.0)
+
+        return np.column_stack((intercept, slope))
+
+
     def fit_line_equations(self):
         """
-        If we find a new line in this frame, then we append to a list of 10 previous lines and use them
-        to calculate distance. However, if we don't find a new line this frame, 
-        we utilize the average of the previous 10 lines.
+        If we find a new line in this frame, then we add it to the ring buffer of previous lines and use
+        the smoothed line to calculate distance. However, if we don't find a new line this frame,
+        we utilize the smoothed value of the previous lines.
 
-        :param left_line:
-        :param right_line:
-        :return:
+        :return: None
         """
+        self.left_line = self.smooth_line(self.left_smoother, self.left_line)
+        self.right_line = self.smooth_line(self.right_smoother, self.right_line)
 
+    @staticmethod
+    def smooth_line(smoother, line):
+        """
+        Adds a detected line to its smoother and returns the smoothed line.
 
-        # if lines were detected, append them to the lines of previous frames
-        if None not in self.left_line:
-            self.left_intercepts.append(self.left_line[0])
-            self.left_slopes.append(self.left_line[1])
+        :param smoother: RingSmoother of the left or right line
+        :param line: [intercept, slope] detected this frame, [None, None] if there was none
+        :return: Smoothed [intercept, slope], or line itself if nothing was ever detected
+        """
+        # if lines were detected, add them to the lines of previous frames
+        if None not in line:
+            smoother.push(line)
 
-        # set line values equal to the mean values of the previous 10 frames
-        if len(self.left_intercepts) > 0:
-            self.left_line[0] = sum(self.left_intercepts) / len(self.left_intercepts)
-            self.left_line[1] = sum(self.left_slopes) / len(self.left_intercepts)
+        # set line values equal to the smoothed values of the previous frames
+        smoothed = smoother.value()
+        if smoothed is None:
+            return line
+        return [float(smoothed[0]), float(smoothed[1])]
 
-        if None not in self.right_line:
-            self.right_intercepts.append(self.right_line[0])
-            self.right_slopes.append(self.right_line[1])
+    def get_state(self):
+        """
+        :return: JSON serializable dict with the smoothed line history and the clustering centroids
+        """
+        return {'left': self.left_smoother.get_state(),
+                'right': self.right_smoother.get_state(),
+                'centroids': None if self.centroids is None else np.asarray(self.centroids).tolist()}
 
-        if len(self.right_intercepts) > 0:
-            self.right_line[0] = sum(self.right_intercepts) / len(self.right_intercepts)
-            self.right_line[1] = sum(self.right_slopes) / len(self.right_intercepts)
+    def set_state(self, state):
+        """
+        Restores a state from get_state, so the lines start from where a previous run left off.
 
+        :param state: dict from get_state
+        """
+        self.left_smoother.set_state(state['left'])
+        self.right_smoother.set_state(state['right'])
+        if state.get('centroids') is not None:
+            self.centroids = np.asarray(state['centroids'], dtype=float)
+
+        self.left_line = self.smooth_line(self.left_smoother, [None, None])
+        self.right_line = self.smooth_line(self.right_smoother, [None, None])
+        self.turn_guesstimation()
+
+    def save_state(self, path):
+        """
+        Writes the line state to a JSON file.
+
+        :param path: Path of the JSON file
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.get_state(), file)
+        os.replace(tmp_path, path)
+
+    def load_state(self, path):
+        """
+        Reads the line state written by save_state.
+
+        :param path: Path of the JSON file
+        """
+        with open(path) as file:
+            self.set_state(json.load(file))
 
 
     def estimate_distance(self, y0, y1):
@@ -195,6 +389,32 @@ class DistanceEstimator:
         else:
             return "Error: No Lines Detected"
 
+    def estimate_distances(self, y0, y_bottoms):
+        """
+        Vectorized estimate_distance for every object in a frame. The track width at y0 is only
+        calculated once.
+
+        :param y0: yvalue at the bottom of the screen
+        :param y_bottoms: array of yvalues at the bottom of the bounding boxes
+        :return: float array of distances, NaN where the distance is unknown (no lines, or zero track width)
+        """
+        y_bottoms = np.asarray(y_bottoms, dtype=float)
+
+        # only calculate if left_line and right_line have information
+        if None in self.left_line or None in self.right_line:
+            return np.full(y_bottoms.shape, np.nan)
+
+        # width between the right and left line at the bottom of the screen and at every box
+        w0 = self.calculate_x(self.right_line, y0) - self.calculate_x(self.left_line, y0)
+        w1 = self.calculate_x(self.right_line, y_bottoms) - self.calculate_x(self.left_line, y_bottoms)
+
+        # law of similar triangles, see calculate_distance
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances = self.d0 * (w0 / w1)
+        distances = np.where(w1 == 0, np.nan, distances)
+
+        return np.maximum(0, distances)
+
     def calculate_x(self, line, y):
         '''
         Calculates the x value of a point on the line given the y value.
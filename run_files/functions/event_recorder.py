@@ -0,0 +1,241 @@
+"""
+A recorder that only saves what matters: short clips around the moments an object gets close to the train.
+
+EventRecorder keeps the last pre_seconds of raw (undrawn) frames and their detection rows in a ring buffer that is
+allocated once, on the first frame. When a relevant object (a person, a car, ...) is estimated closer than the
+distance threshold, an event starts: the buffered frames before it and the next post_seconds of frames are written to
+a clip, together with a CSV of their detection rows. Every new close object during the event extends it by
+post_seconds.
+
+The analysis loop never touches the disk. add() copies the frame into a ring slot, and the slots of an event are
+handed to a writer thread, which encodes them and frees them again. Slots waiting for the writer are pinned, so they
+are never overwritten while the clip is being written, and events close together can share frames. The ring is big
+enough to hold a whole event before the writer frees anything, so frames are only dropped from a clip when an event
+keeps being extended while the writer is behind, and those drops are counted instead of waiting for the writer. While
+the ring is stalled on a pinned slot, the frames it holds get older, so an event only takes frames from at most
+pre_seconds before its trigger as its pre-roll, and starts at the trigger frame if there are none.
+
+Attributes:
+- RELEVANT_CLASSES (tuple): Object names that can trigger an event by default.
+
+Classes:
+- EventRecorder: Ring buffer of recent frames and the clip writer thread.
+"""
+
+import math
+import os
+import queue
+import threading
+import numpy as np
+import cv2
+from .detection_sink import CsvSink
+
+
+# COCO classes that can end up on or next to the tracks
+RELEVANT_CLASSES = ('person', 'bicycle', 'car', 'motorcycle', 'bus', 'truck', 'train',
+                    'dog', 'horse', 'sheep', 'cow')
+
+
+class EventRecorder:
+
+    def __init__(self, fps = 30, pre_seconds = 5.0, post_seconds = 5.0, threshold = 25.0,
+                 classes = RELEVANT_CLASSES, output_dir = 'output/events', prefix = 'event'):
+        """
+        Initiates the recorder and starts its writer thread. The ring buffer is allocated on the first frame.
+
+        :param fps: Frame rate of the source, used for the buffer length and the clips
+        :param pre_seconds: Seconds of frames kept from before an event
+        :param post_seconds: Seconds of frames recorded after the last close object of an event
+        :param threshold: An event starts when a relevant object is closer than this, in the units of the
+        Distance column. The tracker's smoothed distance is used when there is one.
+        :param classes: Object names that can trigger an event, None for every class
+        :param output_dir: Directory the clips and their CSVs are written to
+        :param prefix: Start of the clip file names, '<prefix>_<first frame>.avi' and '.csv'
+        """
+        self.fps = fps or 30
+        self.pre_frames = max(0, int(round(pre_seconds * self.fps)))
+        self.post_frames = max(1, int(round(post_seconds * self.fps)))
+        self.threshold = threshold
+        self.classes = set(classes) if classes is not None else None
+        self.output_dir = output_dir
+        self.prefix = prefix
+
+        # ring buffer of the frames and their rows, big enough for a whole event
+        self.capacity = self.pre_frames + self.post_frames + 1
+        self.frames = None
+        self.rows = [None] * self.capacity
+        self.numbers = [None] * self.capacity
+        self.sequence = np.zeros(self.capacity, dtype=np.int64)  # index of every slot's frame among all added frames
+        self.pinned = np.zeros(self.capacity, dtype=int)  # clips waiting to write a slot, it must not be overwritten
+        self.lock = threading.Lock()
+        self.next_slot = 0
+        self.filled = 0
+        self.added = 0
+
+        # the event being recorded, if any
+        self.recording = False
+        self.post_left = 0
+
+        self.events = 0
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.clips = []
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_clips, name='event-writer', daemon=True)
+        self.writer.start()
+
+    def triggered(self, rows):
+        """
+        :param rows: Detection rows of a frame in HEADER order
+        :return: True if a relevant object in the rows is closer than the threshold
+        """
+        for row in rows:
+            object_name, distance, smoothed_distance = row[3], row[5], row[11]
+            if smoothed_distance is not None:
+                distance = smoothed_distance
+            if self.classes is not None and object_name not in self.classes:
+                continue
+            if distance is not None and not math.isnan(distance) and distance < self.threshold:
+                return True
+        return False
+
+    def add(self, frame, rows, n_frame = None):
+        """
+        Keeps a copy of the frame and its rows, and starts, extends or ends an event. Never waits for the disk.
+        Call it before anything is drawn onto the frame.
+
+        :param frame: Raw frame
+        :param rows: Detection rows of the frame in HEADER order
+        :param n_frame: Frame number of the frame
+        :return: None
+        """
+        if self.frames is None:
+            self.frames = np.empty((self.capacity, *frame.shape), dtype=frame.dtype)
+
+        near = self.triggered(rows)
+        sequence = self.added
+        self.added += 1
+        if n_frame is None:
+            n_frame = sequence
+
+        slot = self.next_slot
+        with self.lock:
+            busy = self.pinned[slot] > 0
+        if busy:
+            # the writer is still behind on this slot, the frame can't be kept
+            if self.recording:
+                self.frames_dropped += 1
+                self.count_down(near)
+            elif near:
+                # still record the event, from the recent frames buffered before this one
+                self.frames_dropped += 1
+                self.start_event((slot - 1) % self.capacity, sequence, n_frame)
+            return
+
+        np.copyto(self.frames[slot], frame)
+        self.rows[slot] = rows
+        self.numbers[slot] = n_frame
+        self.sequence[slot] = sequence
+        self.next_slot = (slot + 1) % self.capacity
+        self.filled = min(self.filled + 1, self.capacity)
+
+        if self.recording:
+            self.send(slot)
+            self.count_down(near)
+        elif near:
+            self.start_event(slot, sequence, n_frame)
+
+    def count_down(self, near):
+        """
+        Extends the event if an object is close, otherwise ends it once post_frames frames have passed.
+        """
+        self.post_left = self.post_frames if near else self.post_left - 1
+        if self.post_left <= 0:
+            self.end_event()
+
+    def start_event(self, slot, sequence, n_frame):
+        """
+        Opens a clip and sends it the buffered frames from before the event, up to and including slot. Frames from more
+        than pre_frames before the trigger, left in the ring while it was stalled, are not part of the event.
+
+        :param slot: Newest buffered slot
+        :param sequence: Index of the trigger frame among all added frames
+        :param n_frame: Frame number of the trigger frame, names the clip if no buffered frame is recent enough
+        """
+        n_before = min(self.filled, self.pre_frames + 1)
+        slots = [(slot - i) % self.capacity for i in range(n_before - 1, -1, -1)]
+        slots = [s for s in slots if self.sequence[s] >= sequence - self.pre_frames]
+
+        self.events += 1
+        self.recording = True
+        self.post_left = self.post_frames
+        first = self.numbers[slots[0]] if slots else n_frame
+        name = os.path.join(self.output_dir, f'{self.prefix}_{first}')
+        self.queue.put(('start', name))
+        for s in slots:
+            self.send(s)
+
+    def send(self, slot):
+        """
+        Pins a slot and hands it to the writer.
+        """
+        with self.lock:
+            self.pinned[slot] += 1
+        self.frames_recorded += 1
+        self.queue.put(('frame', slot))
+
+    def end_event(self):
+        """
+        Tells the writer to close the current clip.
+        """
+        self.recording = False
+        self.queue.put(('end', None))
+
+    def write_clips(self):
+        """
+        Writer thread: encodes the frames of every event into its clip and writes their rows, freeing each slot
+        once it is written.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        writer, sink = None, None
+        while True:
+            kind, value = self.queue.get()
+            if kind == 'start':
+                name = value
+                writer, sink = None, CsvSink(f'{name}.csv')
+            elif kind == 'frame':
+                frame = self.frames[value]
+                if writer is None:
+                    writer = cv2.VideoWriter(f'{name}.avi', cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), self.fps,
+                                             (frame.shape[1], frame.shape[0]))
+                writer.write(frame)
+                sink.write_frame(self.rows[value])
+                with self.lock:
+                    self.pinned[value] -= 1
+            elif kind == 'end':
+                if writer is not None:
+                    writer.release()
+                    self.clips.append(f'{name}.avi')
+                sink.close()
+                writer, sink = None, None
+            else:
+                break
+
+    def close(self):
+        """
+        Ends the current event, waits for the writer to finish every clip and stops it.
+
+        :return: None
+        """
+        if self.recording:
+            self.end_event()
+        self.queue.put(('stop', None))
+        self.writer.join()
+
+    def report(self):
+        """
+        :return: One line with the number of events, the frames recorded and dropped, and the clip directory
+        """
+        return (f"Recorded {self.events} events ({self.frames_recorded} frames, {self.frames_dropped} dropped) "
+                f"to {self.output_dir}")
@@ -1,32 +1,77 @@
 """
 A class for detecting lines in images or video frames using the Hough Line Transform.
 
+Attributes:
+- DILATE_KERNEL, ERODE_KERNEL: Morphology kernels of process_frame, built once instead of on every call.
+
 Methods:
-- __init__(self): Initialize the LineDetector class.
+- __init__(self, adaptive_roi=False, band_width=40, process_scale=1.0, reuse_buffers=False): Initialize the
+  LineDetector class.
 - crop_image(self, image): Crop the image to focus on a specific region of interest.
+- rail_band_roi(self, image, rail_lines): Crop tightly around the expected rails and mask everything but two bands.
 - detect_lines_image(self, image_path, crop=True): Detect lines in an image.
-- detect_lines_frame(self, frame, crop=True): Detect lines in a video frame.
+- detect_lines_frame(self, frame, crop=True, rail_lines=None, return_params=False): Detect lines in a video frame.
+- detect_lines_params(self, frame, crop=True, rail_lines=None): Detect lines and their [intercept, slope].
+- detect_in_region(self, roi, x_adj, y_adj, mask=None, check_intercept=True): Hough lines of a region, at process_scale.
+- filter_lines(self, lines, width, x_adj, y_adj, check_intercept=True, scale=1.0): Keep rail-like lines, in frame
+  coordinates, with masked array operations.
+- line_params(lines): Slope and intercept of every line at once.
 - detect_lines_video(self, video_path): Process a video file to detect lines.
-- process_frame(self, frame): Apply line detection and Hough Transform to a frame.
+- buffer(self, name): The kept intermediate image OpenCV can write into, with reuse_buffers.
+- keep(self, name, image): Keep an intermediate image for the next frame, with reuse_buffers.
+- process_frame(self, frame, mask=None, scale=1.0): Apply line detection and Hough Transform to a frame.
 
 Parameters:
 - image: Image data loaded through cv2.imread().
 - image_path: Path to an image file.
 - frame: Video frame data.
 - crop: Boolean indicating whether to crop the image/frame for focused analysis.
+- rail_lines: [left_line, right_line] as [intercept, slope] from the DistanceEstimator, used by the adaptive ROI.
 
 Returns:
 - Cropped image/frame if applicable.
-- List of coordinates of detected lines.
+- (N, 1, 4) array of coordinates of detected lines, optionally with their (N, 2) [intercept, slope].
 """
 
 import cv2
 import math
 import numpy as np
 
+# closing-like cleanup of the Canny edges in process_frame
+DILATE_KERNEL = np.ones((2, 3), dtype=np.uint8)
+ERODE_KERNEL = np.ones((3, 2), dtype=np.uint8)
+
 class LineDetector:
-    def __init__(self):
-        pass
+    def __init__(self, adaptive_roi = False, band_width = 40, process_scale = 1.0, reuse_buffers = False):
+        """
+        Initiates the class.
+
+        :param adaptive_roi: Look for the rails only in narrow bands around where they were in the previous frames,
+        instead of the fixed crop. Falls back to the fixed crop when there is no previous estimate or
+        nothing is found in the bands.
+        :param band_width: Half width in pixels of the band searched around each expected rail
+        :param process_scale: Scale the region of interest by this factor before Canny/Hough (e.g. 0.5 on 1080p/4K).
+        The pixel thresholds of the Hough transform scale with it, and the lines are mapped back to full frame
+        coordinates, so the DistanceEstimator sees the same geometry.
+        :param reuse_buffers: Keep the resized, gray, edge and morphology images between frames and let OpenCV write
+        into them (dst=), instead of allocating new ones on every frame. They are reallocated when the size changes.
+        """
+        self.adaptive_roi = adaptive_roi
+        self.band_width = band_width
+        self.process_scale = process_scale
+        self.reuse_buffers = reuse_buffers
+
+        # intermediate images of the last frame by name, only kept with reuse_buffers
+        self.buffers = {}
+
+        # Hough thresholds in full resolution pixels
+        self.min_line_length = 150
+        self.max_line_gap = 10
+        self.hough_threshold = 10
+
+        # how often the adaptive ROI found lines vs had to fall back to the fixed crop
+        self.adaptive_hits = 0
+        self.adaptive_fallbacks = 0
 
     def crop_image(self, image):
         '''
@@ -52,6 +97,42 @@ class LineDetector:
         roi = image[bottom_roi_height:bottom, roi_x:roi_x+roi_width]
 
         return roi, roi_x, bottom_roi_height
+
+    def rail_band_roi(self, image, rail_lines):
+        '''
+        Builds a tight region of interest around where the rails are expected, from the smoothed left and right lines
+        of the previous frames. Only the bottom half of the image is used, same as crop_image.
+
+        :param image: An image imported through cv2.imread()
+        :param rail_lines: [left_line, right_line], each [intercept, slope] with x = intercept + slope * y
+        :return: (roi, roi_x, roi_y, mask) where mask is 255 inside the two rail bands, or None if the rails are unknown
+        '''
+        if rail_lines is None or any(None in line for line in rail_lines):
+            return None
+
+        height, width = image.shape[:2]
+        top, bottom = height // 2, height
+        band = self.band_width
+
+        # x position of both rails at the top and bottom of the region
+        rails_x = [(intercept + slope * top, intercept + slope * bottom) for intercept, slope in rail_lines]
+        all_x = [x for xs in rails_x for x in xs]
+        roi_x = int(max(0, min(all_x) - band))
+        roi_right = int(min(width, max(all_x) + band))
+        if roi_right - roi_x <= 2 * band:
+            return None
+
+        roi = image[top:bottom, roi_x:roi_right]
+
+        # polygon covering band pixels on either side of each rail
+        mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+        for x_top, x_bottom in rails_x:
+            polygon = np.array([[x_top - band - roi_x, 0], [x_top + band - roi_x, 0],
+                                [x_bottom + band - roi_x, bottom - top], [x_bottom - band - roi_x, bottom - top]],
+                               dtype=np.int32)
+            cv2.fillPoly(mask, [polygon], 255)
+
+        return roi, roi_x, top, mask
     
     def detect_lines_image(self, image_path, crop=True):
         '''
@@ -65,14 +146,37 @@ class LineDetector:
         return self.detect_lines_frame(cv2.imread(image_path), crop)
 
 
-    def detect_lines_frame(self, frame, crop=True):
+    def detect_lines_frame(self, frame, crop=True, rail_lines=None, return_params=False):
         '''
         This function is responsible for detecting all lines that exist in a subset of a video frame.
         
         :param image_path: Path to image in your directory
         :param crop: Set to false if you want to detect lines in the whole image rather than subset for rails
-        :return: list of coordinates to the liens that were detected
+        :param rail_lines: Smoothed [left_line, right_line] of the previous frames, only used with adaptive_roi
+        :param return_params: Also return the (N, 2) [intercept, slope] of every line, in frame coordinates,
+        which DistanceEstimator.analyze_lines can use instead of recomputing them
+        :return: (N, 1, 4) array of coordinates to the lines that were detected
         '''
+        lines, params = self.detect_lines_params(frame, crop, rail_lines)
+        if return_params:
+            return lines, params
+        return lines
+
+    def detect_lines_params(self, frame, crop=True, rail_lines=None):
+        '''
+        Does the work of detect_lines_frame, always returning the lines together with their [intercept, slope].
+        '''
+        # Search only around the expected rails if we know where they are
+        if crop and self.adaptive_roi:
+            band_roi = self.rail_band_roi(frame, rail_lines)
+            if band_roi is not None:
+                # the mask already limits where the lines can be, so the intercept check doesn't apply here
+                filtered_lines, params = self.detect_in_region(*band_roi, check_intercept=False)
+                if len(filtered_lines) > 0:
+                    self.adaptive_hits += 1
+                    return filtered_lines, params
+            # lost track of the rails, fall back to the fixed crop
+            self.adaptive_fallbacks += 1
 
         # Initialize x adjustment values to 0
         # These values will be adjust the cropped coordinate system to the overall picture coordinate system
@@ -88,36 +192,86 @@ class LineDetector:
             y_adj += y_tmp
 
         # process the image and look for lines
-        processed_image, lines = self.process_frame(frame)
-        height, width, _ = frame.shape
+        return self.detect_in_region(frame, x_adj, y_adj)
 
-        filtered_lines = []
+    def detect_in_region(self, roi, x_adj, y_adj, mask=None, check_intercept=True):
+        '''
+        Runs the Hough Line Transform on a region of the frame, downscaled by process_scale, and
+        returns the rail-like lines in full frame coordinates.
+
+        :param roi: Region of the frame to search
+        :param x_adj: x offset of the region in the frame
+        :param y_adj: y offset of the region in the frame
+        :param mask: Only keep edges where the mask is non zero (optional)
+        :param check_intercept: Require the intercept to be in the middle third of the region
+        :return: (N, 1, 4) array of lines in frame coordinates and their (N, 2) [intercept, slope]
+        '''
+        scale = self.process_scale
+        if scale != 1.0:
+            roi = self.keep('resized', cv2.resize(roi, None, dst=self.buffer('resized'), fx=scale, fy=scale,
+                                                  interpolation=cv2.INTER_AREA))
+            if mask is not None:
+                mask = cv2.resize(mask, (roi.shape[1], roi.shape[0]), interpolation=cv2.INTER_NEAREST)
 
-        if lines is not None:
-            for line in lines:
-                x1, y1, x2, y2 = line[0]
-                slope = None
-                intercept = None
+        processed_image, lines = self.process_frame(roi, mask, scale)
 
-                if y2 - y1 != 0:
-                    slope = (x2 - x1) / (y2 - y1)
-                    intercept = x1 - slope * y1
+        # cv2.imwrite('hough_output_image.jpg', processed_image)
 
-                if slope is not None and intercept is not None:
-                    # print(slope, intercept)
-                    if np.abs(slope) < .8 and np.abs(slope) > .05 and intercept < width/3*2 and intercept > width/3:
+        return self.filter_lines(lines, roi.shape[1], x_adj, y_adj, check_intercept, scale)
 
-                        line[0][0] += x_adj
-                        line[0][1] += y_adj
-                        line[0][2] += x_adj
-                        line[0][3] += y_adj
+    def filter_lines(self, lines, width, x_adj, y_adj, check_intercept=True, scale=1.0):
+        '''
+        Keeps the lines that could be rails and moves them from the cropped to the full frame coordinate system.
+        All lines are checked at once with array operations.
+
+        :param lines: Output of cv2.HoughLinesP, coordinates relative to the crop
+        :param width: Width of the crop
+        :param x_adj: x offset of the crop in the frame
+        :param y_adj: y offset of the crop in the frame
+        :param check_intercept: Require the intercept to be in the middle third of the crop
+        :param scale: Scale the crop was processed at, the coordinates are divided by it
+        :return: (N, 1, 4) array of the remaining lines in frame coordinates and their (N, 2) [intercept, slope]
+        '''
+        if lines is None or len(lines) == 0:
+            return np.empty((0, 1, 4), dtype=np.int32), np.empty((0, 2))
 
-                        filtered_lines.append(line)
+        # slope and intercept of every line in terms of x = intercept + slope * y (crop coordinates)
+        slope, intercept, valid = self.line_params(lines)
 
-        # cv2.imwrite('hough_output_image.jpg', processed_image)
+        # keep lines that are steep enough but not too steep, and (optionally) start in the middle third of the crop
+        abs_slope = np.abs(slope)
+        keep = valid & (abs_slope < .8) & (abs_slope > .05)
+        if check_intercept:
+            keep &= (intercept < width/3*2) & (intercept > width/3)
+
+        filtered_lines = lines[keep]
+
+        # map back to the full resolution crop
+        if scale != 1.0:
+            filtered_lines = np.round(filtered_lines / scale).astype(lines.dtype)
+
+        # move from crop to frame coordinates
+        filtered_lines = filtered_lines + np.array([x_adj, y_adj, x_adj, y_adj], dtype=filtered_lines.dtype)
+
+        # slope and intercept again in frame coordinates, from the final (rounded) coordinates
+        slope, intercept, _ = self.line_params(filtered_lines)
 
-        return np.array(filtered_lines)
-        #return filtered_lines
+        return filtered_lines, np.column_stack((intercept, slope))
+
+    @staticmethod
+    def line_params(lines):
+        '''
+        Slope and intercept of every line, in terms of x = intercept + slope * y.
+
+        :param lines: (N, 1, 4) array of [[x1, y1, x2, y2]]
+        :return: slope, intercept and a mask of the lines that aren't horizontal (slope and intercept 0 where not)
+        '''
+        x1, y1, x2, y2 = lines.reshape(-1, 4).astype(float).T
+        dy = y2 - y1
+        valid = dy != 0
+        slope = np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=valid)
+        intercept = np.where(valid, x1 - slope * y1, 0.0)
+        return slope, intercept, valid
 
     def detect_lines_video(self, video_path):
         '''
@@ -146,30 +300,58 @@ class LineDetector:
         out.release()
         cv2.destroyAllWindows()
 
-    def process_frame(self, frame):
+    def buffer(self, name):
+        '''
+        :param name: Name of an intermediate image of process_frame
+        :return: The array kept under that name for OpenCV to write into, or None to let OpenCV allocate a new one
+        '''
+        return self.buffers.get(name) if self.reuse_buffers else None
+
+    def keep(self, name, image):
+        '''
+        Keeps an intermediate image for the next frame, if buffers are reused. OpenCV only writes into the given
+        buffer when its size and type fit, otherwise it returns a new array, which is kept from then on.
+
+        :param name: Name of the intermediate image
+        :param image: Output of the OpenCV call
+        :return: image
+        '''
+        if self.reuse_buffers:
+            self.buffers[name] = image
+        return image
+
+    def process_frame(self, frame, mask=None, scale=1.0):
         '''
         This function is used to actually apply the line detection and hough transform to the frames for each input type.
         
         :param frame: The frame that needs to be processed
+        :param mask: Only keep edges where the mask is non zero (optional)
+        :param scale: Scale the frame was resized by, the pixel thresholds of the Hough transform are scaled to match
         :return: The processed frame.
         '''
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = self.keep('gray', cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.buffer('gray')))
 
         ###########################
 
-        # MODIFY minLineLength and maxLineGap to tweak for the video/image you are running on
+        # MODIFY min_line_length and max_line_gap (set in __init__) to tweak for the video/image you are running on
         # This will adjust Hough so that it can detect either less lines, or more lines
 
         ###########################
 
 
-        edges = cv2.Canny(gray, 150, 250)
-        edges = cv2.dilate(edges, np.ones((2, 3), dtype=np.uint8))
-        edges = cv2.erode(edges, np.ones((3, 2), dtype=np.uint8))
+        edges = self.keep('edges', cv2.Canny(gray, 150, 250, edges=self.buffer('edges')))
+        edges = self.keep('dilated', cv2.dilate(edges, DILATE_KERNEL, dst=self.buffer('dilated')))
+        edges = self.keep('eroded', cv2.erode(edges, ERODE_KERNEL, dst=self.buffer('eroded')))
+
+        # mask after edge detection, so the mask border itself doesn't show up as an edge
+        if mask is not None:
+            edges = self.keep('masked', cv2.bitwise_and(edges, mask, dst=self.buffer('masked')))
 
-        lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi / 360, threshold=10,
-                                minLineLength=150, maxLineGap=10)
+        lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi / 360,
+                                threshold=max(1, round(self.hough_threshold * scale)),
+                                minLineLength=self.min_line_length * scale,
+                                maxLineGap=max(1, self.max_line_gap * scale))
 
 
         #if lines is not None:
@@ -0,0 +1,263 @@
+"""
+Functions for running the image analysis over a large set of images with a pool of worker processes.
+
+Every worker loads the object detector once, in the pool initializer, and then analyzes one image after another with a
+fresh LineDetector and DistanceEstimator per image. The workers send their rows back to the main process, which streams
+them into a single merged CSV log with the image path as its first column. Processed images are written by the workers
+under names derived from their paths, so images with the same file name in different folders don't overwrite each other.
+
+Progress is kept in a done.txt file next to the log. After every few images the log is flushed, and the paths of the
+images in it are appended to done.txt followed by a '#<log size>' line. With resume, only the paths that are followed by
+such a line count as done, and the log is cut back to the last recorded size. This drops the rows of images that were in
+flight when the previous run stopped, even if it stopped halfway through writing done.txt, and analyzes them again.
+
+Attributes:
+- IMAGE_EXTENSIONS (tuple): File extensions picked up from directories and globs.
+
+Functions:
+- find_images(inputs, exclude=None): Expand directories and globs into a sorted list of image paths.
+- output_names(paths, root=None): A unique output file name for every image path.
+- load_worker_detector(backend, weights): Load a single threaded detector in a worker process.
+- init_worker(backend, weights, image_dir): Pool initializer, loads the detector of the worker process.
+- analyze_image(task): Analyze one image in a worker process.
+- read_progress(path): Finished paths and the log size recorded in done.txt.
+- run_image_batch(inputs, output_dir='output/batch', backend='ultralytics', weights=None, workers=None,
+  resume=False, save_images=True, commit_every=50): Analyze every image with a process pool.
+"""
+
+import glob
+import multiprocessing
+import os
+import time
+from collections import Counter
+import cv2
+from .detection_sink import CsvSink, IMAGE_HEADER, MemorySink
+from .detectors import load_detector
+from .distance_functions import DistanceEstimator
+from .hough_functions import LineDetector
+from .run_frame import FrameAnalyzer
+
+
+IMAGE_EXTENSIONS = ('.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp')
+
+# state of a worker process, set by init_worker
+_worker = {}
+
+
+def find_images(inputs, exclude = None):
+    """
+    Expands directories (searched recursively) and glob patterns into image paths.
+
+    :param inputs: List of directories, glob patterns or image paths
+    :param exclude: Directory whose images are skipped, e.g. the output directory when it is inside an input
+    :return: Sorted list of image paths without duplicates
+    """
+    exclude = os.path.realpath(exclude) if exclude else None
+
+    def excluded(path):
+        if exclude is None:
+            return False
+        path = os.path.realpath(path)
+        return os.path.commonpath([path, exclude]) == exclude
+
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs[:] = [name for name in dirs if not excluded(os.path.join(root, name))]
+                paths.update(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.update(path for path in glob.glob(pattern, recursive=True)
+                         if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(path for path in paths if not excluded(path))
+
+
+def output_names(paths, root = None):
+    """
+    Names the output files of every image after its path relative to the folder all images share,
+    e.g. archive/2023/cam1/001.jpg -> 2023__cam1__001. Images that only differ in their extension keep it in the
+    name, e.g. cam1/001.jpg -> cam1__001_jpg and cam1/001.png -> cam1__001_png.
+
+    :param paths: List of image paths
+    :param root: Folder the names are relative to instead of the shared folder, e.g. the working directory for
+    paths that arrive one at a time
+    :return: dict of image path -> output name without extension
+    """
+    if not paths:
+        return {}
+    absolute = [os.path.abspath(path) for path in paths]
+    if root is not None:
+        root = os.path.abspath(root)
+    elif len(set(absolute)) == 1:
+        root = os.path.dirname(absolute[0])
+    else:
+        root = os.path.commonpath(absolute)
+    stems = {path: os.path.splitext(os.path.relpath(full, root)) for path, full in zip(paths, absolute)}
+    counts = Counter(stem for stem, _ in stems.values())
+
+    names = {}
+    for path, (stem, extension) in stems.items():
+        name = stem if counts[stem] == 1 else f'{stem}_{extension[1:]}'
+        names[path] = name.replace(os.sep, '__')
+    return names
+
+
+def load_worker_detector(backend, weights):
+    """
+    Loads the object detector of a worker process. Each worker runs single threaded, the pool provides
+    the parallelism, so OpenCV, ONNX Runtime and torch are limited to one thread.
+
+    :param backend: Detector backend name, see detectors.load_detector
+    :param weights: Model file of the backend (optional)
+    :return: DetectorBackend
+    """
+    cv2.setNumThreads(1)
+    kwargs = {}
+    if backend == 'onnx':
+        kwargs['threads'] = 1
+    elif backend == 'ultralytics':
+        import torch
+        torch.set_num_threads(1)
+    return load_detector(backend, weights, **kwargs)
+
+
+def init_worker(backend, weights, image_dir):
+    """
+    Pool initializer, loads the object detector once per worker process.
+
+    :param backend: Detector backend name, see detectors.load_detector
+    :param weights: Model file of the backend (optional)
+    :param image_dir: Directory the processed images are written to, None to not write them
+    """
+    _worker['yolo'] = load_worker_detector(backend, weights)
+    _worker['image_dir'] = image_dir
+
+
+def analyze_image(task):
+    """
+    Analyzes one image in a worker process and writes its processed image.
+
+    :param task: (image path, output name)
+    :return: (image path, rows in HEADER order), rows is None if the image couldn't be read
+    """
+    path, name = task
+    image = cv2.imread(path)
+    if image is None:
+        return path, None
+
+    fa = FrameAnalyzer(_worker['yolo'], LineDetector(), DistanceEstimator())
+    sink = MemorySink()
+    analyzed_image = fa.run_frame(image, sink=sink)
+
+    if _worker['image_dir'] is not None:
+        cv2.imwrite(os.path.join(_worker['image_dir'], f'{name}_processed.jpg'), analyzed_image)
+    return path, sink.rows
+
+
+def read_progress(path):
+    """
+    Reads done.txt. A group of image paths only counts as done once the '#<log size>' line after it was written.
+
+    :param path: Path of done.txt
+    :return: set of finished image paths and the last recorded log size (None if there is none)
+    """
+    done, log_size = set(), None
+    if os.path.exists(path):
+        group = []
+        with open(path) as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    break  # cut off mid-line
+                line = line[:-1]
+                if line.startswith('#'):
+                    done.update(group)
+                    group = []
+                    log_size = int(line[1:])
+                elif line:
+                    group.append(line)
+    return done, log_size
+
+
+def run_image_batch(inputs, output_dir = 'output/batch', backend = 'ultralytics', weights = None, workers = None,
+                    resume = False, save_images = True, commit_every = 50):
+    """
+    Analyzes every image found in the inputs with a pool of worker processes and merges the rows into one log.
+
+    :param inputs: List of directories, glob patterns or image paths
+    :param output_dir: Directory for image_objects.csv, done.txt and the processed images
+    :param backend: Detector backend name, see detectors.load_detector
+    :param weights: Model file of the backend (optional)
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param resume: Skip the images in done.txt and append to the existing log
+    :param save_images: Write a processed image for every image
+    :param commit_every: Number of images between flushing the log and recording them in done.txt
+    :return: dict with the number of images found, skipped, analyzed and failed
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    log_path = os.path.join(output_dir, 'image_objects.csv')
+    progress_path = os.path.join(output_dir, 'done.txt')
+    image_dir = os.path.join(output_dir, 'images') if save_images else None
+    if image_dir is not None:
+        os.makedirs(image_dir, exist_ok=True)
+
+    done, log_size = read_progress(progress_path) if resume else (set(), None)
+    if log_size is not None and os.path.exists(log_path):
+        # drop the rows of images that were written after the last recorded progress
+        with open(log_path, 'r+b') as file:
+            file.truncate(log_size)
+
+    paths = find_images(inputs, exclude=output_dir)  # never analyze our own outputs
+    names = output_names(paths)
+    tasks = [(path, names[path]) for path in paths if path not in done]
+    print(f"Found {len(paths)} images, {len(paths) - len(tasks)} already done, {len(tasks)} to analyze")
+
+    # the sink is flushed by commit(), together with done.txt
+    sink = CsvSink(log_path, flush_frames=float('inf'), flush_seconds=float('inf'), header=IMAGE_HEADER,
+                   append=log_size is not None)
+    # keep only the complete groups, so the paths of an unfinished group don't count as done later on
+    tmp_path = f'{progress_path}.tmp'
+    with open(tmp_path, 'w') as file:
+        if done:
+            file.writelines(f'{path}\n' for path in sorted(done))
+            file.write(f'#{log_size}\n')
+    os.replace(tmp_path, progress_path)
+    progress = open(progress_path, 'a')
+    pending, failed = [], []
+
+    def commit():
+        if not pending:
+            return
+        sink.flush()
+        progress.writelines(f'{path}\n' for path in pending)
+        progress.write(f'#{os.fstat(sink.file.fileno()).st_size}\n')
+        progress.flush()
+        pending.clear()
+
+    start = time.perf_counter()
+    analyzed = 0
+    try:
+        # spawn instead of fork, so workers never inherit threads or model state from the main process
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=init_worker, initargs=(backend, weights, image_dir)) as pool:
+            for path, rows in pool.imap_unordered(analyze_image, tasks, chunksize=4):
+                if rows is None:
+                    print(f"Error: Unable to read image {path}")
+                    failed.append(path)
+                    continue
+
+                sink.write_frame([[path] + row for row in rows])
+                pending.append(path)
+                analyzed += 1
+                if len(pending) >= commit_every:
+                    commit()
+                    elapsed = time.perf_counter() - start
+                    print(f"{analyzed}/{len(tasks)} images ({analyzed / elapsed:.1f} images/s)", flush=True)
+    finally:
+        commit()
+        sink.close()
+        progress.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {analyzed} images in {elapsed:.2f}s ({analyzed / max(elapsed, 1e-9):.1f} images/s), "
+          f"{len(failed)} could not be read. Log: {log_path}")
+    return {'found': len(paths), 'skipped': len(paths) - len(tasks), 'analyzed': analyzed, 'failed': len(failed)}
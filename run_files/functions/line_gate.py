@@ -0,0 +1,142 @@
+"""
+A cheap change detector that lets FrameAnalyzer skip the line detection on frames where the rails look the same.
+
+On long straight runs, or while the train is stopped, the region the rails are searched in barely changes from frame to
+frame, yet Canny, the morphology and HoughLinesP run on every frame. LineGate shrinks the fixed crop of the
+LineDetector (crop_image) to a small grayscale signature and compares it with the signature of the last frame the
+lines were actually detected on. If the mean absolute difference is below the threshold, the previous frame's lines
+are reused and DistanceEstimator.analyze_lines is skipped, so the smoothed rail lines stay where they are. Comparing
+with the last detected frame, instead of the previous frame, keeps slow drift from adding up unnoticed, and after
+max_reuse reused frames in a row the lines are detected again regardless.
+
+The gate counts its hits and measures what it costs and what a full line detection costs, so it can report the hit
+rate and the time saved.
+
+Classes:
+- LineGate: ROI signature comparison, reuse counting and statistics.
+
+Functions:
+- merge_stats(stats): Add up the stats of several gates, e.g. one per video chunk.
+- gate_report(stats): One line with the hit rate and the time saved.
+"""
+
+import time
+import cv2
+import numpy as np
+
+
+class LineGate:
+
+    def __init__(self, detector, threshold = 2.0, max_reuse = 5, size = (32, 16)):
+        """
+        Initiates the gate.
+
+        :param detector: LineDetector whose crop_image gives the region of interest
+        :param threshold: Largest mean absolute difference (in gray levels, 0-255) between the signatures of two frames
+        for the lines to be reused
+        :param max_reuse: Maximum number of frames in a row that reuse the lines before they are detected again
+        :param size: (width, height) of the signature
+        """
+        self.detector = detector
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.size = size
+
+        # signature of the last frame the lines were detected on
+        self.signature = None
+        self.reused_in_row = 0
+
+        self.frames = 0
+        self.hits = 0
+        self.gate_seconds = 0.0
+        self.refresh_seconds = 0.0
+        self.refreshes = 0
+
+    def roi_signature(self, frame):
+        """
+        :param frame: Frame to sign
+        :return: (height, width) float32 grayscale thumbnail of the frame's fixed rail crop
+        """
+        roi = self.detector.crop_image(frame)[0]
+        small = cv2.resize(roi, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+
+    def unchanged(self, frame):
+        """
+        Decides if the previous lines can be used for this frame. Frames where it says no become the new reference.
+
+        :param frame: Frame about to be analyzed
+        :return: True to reuse the previous frame's lines
+        """
+        start = time.perf_counter()
+        signature = self.roi_signature(frame)
+        reuse = (self.signature is not None and self.reused_in_row < self.max_reuse
+                 and signature.shape == self.signature.shape
+                 and float(np.mean(np.abs(signature - self.signature))) < self.threshold)
+
+        if reuse:
+            self.reused_in_row += 1
+            self.hits += 1
+        else:
+            self.signature = signature
+            self.reused_in_row = 0
+        self.frames += 1
+        self.gate_seconds += time.perf_counter() - start
+        return reuse
+
+    def reset(self):
+        """
+        Forgets the reference signature, so the next frame is always detected.
+        """
+        self.signature = None
+        self.reused_in_row = 0
+
+    def record_refresh(self, seconds):
+        """
+        Records how long the line detection and clustering of a frame that wasn't reused took.
+
+        :param seconds: Time spent, in seconds
+        """
+        self.refresh_seconds += seconds
+        self.refreshes += 1
+
+    def stats(self):
+        """
+        :return: dict with the frames seen, the reused frames, the hit rate, the time spent in the gate and the
+        estimated time saved (reused frames times the mean refresh time, minus the gate's own cost) in seconds
+        """
+        mean_refresh = self.refresh_seconds / self.refreshes if self.refreshes else 0.0
+        return {'frames': self.frames, 'hits': self.hits, 'hit_rate': self.hits / max(self.frames, 1),
+                'gate_seconds': self.gate_seconds,
+                'saved_seconds': self.hits * mean_refresh - self.gate_seconds}
+
+    def report(self):
+        """
+        :return: One line with the hit rate and the time saved
+        """
+        return gate_report(self.stats())
+
+
+def merge_stats(stats):
+    """
+    :param stats: List of LineGate.stats() dicts
+    :return: Their sums, in the same format
+    """
+    frames = sum(s['frames'] for s in stats)
+    hits = sum(s['hits'] for s in stats)
+    return {'frames': frames, 'hits': hits, 'hit_rate': hits / max(frames, 1),
+            'gate_seconds': sum(s['gate_seconds'] for s in stats),
+            'saved_seconds': sum(s['saved_seconds'] for s in stats)}
+
+
+def gate_report(stats):
+    """
+    :param stats: LineGate.stats() dict
+    :return: One line with the hit rate and the time saved
+    """
+    per_frame = stats['gate_seconds'] / max(stats['frames'], 1)
+    return (f"Line gate: reused the rail lines on {stats['hits']}/{stats['frames']} frames "
+            f"({100 * stats['hit_rate']:.1f}%), saved {1000 * stats['saved_seconds']:.1f} ms net "
+            f"(gate cost {1000 * per_frame:.3f} ms per frame)")
@@ -0,0 +1,181 @@
+"""
+Classes for a low-latency live mode that always works on the freshest camera frame.
+
+When processing is slower than the camera, cv2.VideoCapture keeps queueing frames and the displayed distances fall
+further and further behind reality. LatestFrameCapture reads the camera on its own thread and only keeps the newest
+frame, every frame that gets replaced before it was processed is dropped and counted. DetectionScheduler decides per
+frame whether there is enough time left to run YOLO, or whether to reuse the previous detections and only update the
+rail lines.
+
+With reuse_buffers, LatestFrameCapture reads into three preallocated frames in turn instead of a new array per frame
+(triple buffering): one is being read into, one holds the newest frame and one is held by the analyzer. The capture
+thread only ever reads into the third, so a frame returned by read() is never overwritten before the next read().
+
+Classes:
+- LatestFrameCapture: Capture thread that holds only the most recent frame.
+- DetectionScheduler: Skips YOLO on frames that would miss the target latency.
+
+Functions:
+- latency_summary(latencies): p50/p95/p99/max of a list of latencies in seconds, formatted in ms.
+"""
+
+import threading
+import time
+import numpy as np
+
+
+class LatestFrameCapture(threading.Thread):
+
+    def __init__(self, cap, reuse_buffers = False):
+        """
+        Initiates the capture thread. Call start() to begin reading.
+
+        :param cap: Opened cv2.VideoCapture
+        :param reuse_buffers: Read into three preallocated frames in turn. A frame returned by read() is then only
+        valid until the next read(), so the caller must be done with it (drawn, shown, written) by then.
+        """
+        super().__init__(name='capture', daemon=True)
+        self.cap = cap
+        self.condition = threading.Condition()
+        self.running = True
+        self.ended = False
+
+        # the newest frame, when it was captured, and whether the analyzer already took it
+        self.frame = None
+        self.captured = None
+        self.consumed = True
+
+        # with reuse_buffers: the three frame buffers, which one holds the newest frame and which one the analyzer has
+        self.buffers = [None] * 3 if reuse_buffers else None
+        self.latest_buffer = None
+        self.held_buffer = None
+
+        self.frames_captured = 0
+        self.frames_dropped = 0
+
+    def run(self):
+        while self.running:
+            index = None
+            if self.buffers is None:
+                success, frame = self.cap.read()
+            else:
+                # read into the buffer that neither holds the newest frame nor is held by the analyzer
+                with self.condition:
+                    index = next(i for i in range(3) if i != self.latest_buffer and i != self.held_buffer)
+                success, frame = self.cap.read(self.buffers[index])
+                if success:
+                    self.buffers[index] = frame
+            captured = time.perf_counter()
+
+            with self.condition:
+                if not success:
+                    self.ended = True
+                    self.condition.notify_all()
+                    break
+
+                # the previous frame was never processed, it is stale now
+                if not self.consumed:
+                    self.frames_dropped += 1
+
+                self.frame, self.captured, self.consumed = frame, captured, False
+                self.latest_buffer = index
+                self.frames_captured += 1
+                self.condition.notify_all()
+
+    def read(self):
+        """
+        Waits for a frame that hasn't been returned yet and returns it.
+
+        :return: (success, frame, captured) where captured is the perf_counter time the frame was read
+        """
+        with self.condition:
+            while self.consumed and not self.ended:
+                self.condition.wait()
+            if self.consumed:
+                return False, None, None
+
+            self.consumed = True
+            self.held_buffer = self.latest_buffer
+            return True, self.frame, self.captured
+
+    def stop(self):
+        """
+        Stops the capture thread and waits for it to exit, which takes up to one camera frame since a read in
+        progress is finished first. Only then can the caller release the camera, releasing it under a read crashes
+        some backends. Safe to call more than once.
+        """
+        self.running = False
+        if self.is_alive():
+            self.join()
+
+
+class DetectionScheduler:
+
+    def __init__(self, target_latency = None, target_fps = None, max_skip = 3, smoothing = 0.2):
+        """
+        Initiates the scheduler. With neither target set, YOLO runs on every frame.
+
+        :param target_latency: Capture-to-display latency to stay under, in seconds
+        :param target_fps: Frame rate to keep up with, used as a 1/target_fps latency budget if no target_latency
+        :param max_skip: Maximum number of frames in a row that can skip YOLO, so detections never get too old
+        :param smoothing: Weight of the newest measurement in the running processing-time estimates
+        """
+        if target_latency is None and target_fps:
+            target_latency = 1.0 / target_fps
+        self.target_latency = target_latency
+        self.max_skip = max_skip
+        self.smoothing = smoothing
+
+        # running estimates of how long a frame takes with and without YOLO
+        self.full_seconds = None
+        self.lines_seconds = None
+
+        self.skipped_in_row = 0
+        self.frames_skipped = 0
+
+    def should_detect(self, frame_age):
+        """
+        Decides if YOLO should run on a frame.
+
+        :param frame_age: Seconds since the frame was captured
+        :return: True to run YOLO, False to reuse the previous detections
+        """
+        if self.target_latency is None or self.full_seconds is None or self.skipped_in_row >= self.max_skip:
+            detect = True
+        else:
+            detect = frame_age + self.full_seconds <= self.target_latency
+
+        if detect:
+            self.skipped_in_row = 0
+        else:
+            self.skipped_in_row += 1
+            self.frames_skipped += 1
+        return detect
+
+    def record(self, detected, seconds):
+        """
+        Updates the processing-time estimate of the kind of frame that was just processed.
+
+        :param detected: Whether YOLO ran on the frame
+        :param seconds: How long processing the frame took
+        """
+        name = 'full_seconds' if detected else 'lines_seconds'
+        previous = getattr(self, name)
+        if previous is None:
+            setattr(self, name, seconds)
+        else:
+            setattr(self, name, (1 - self.smoothing) * previous + self.smoothing * seconds)
+
+
+def latency_summary(latencies):
+    """
+    Formats latency percentiles.
+
+    :param latencies: List of latencies in seconds
+    :return: String with p50, p95, p99 and max in ms
+    """
+    if len(latencies) == 0:
+        return 'no frames'
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return f'p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, max {ms.max():.1f} ms'
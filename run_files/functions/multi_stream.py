@@ -0,0 +1,319 @@
+"""
+Classes for analyzing several camera streams in one process with one shared object detector.
+
+Every stream keeps its own rail line state (LineDetector, DistanceEstimator and optionally ObjectTracker in its own
+FrameAnalyzer), its own detection log and optionally its own annotated video, so the streams never influence each
+other's results. Only the detector is shared: it is loaded once, and frames of different streams that arrive close
+together are sent through it as a single batch.
+
+Every stream is read by its own StreamReader thread into a small per-stream buffer. The runner collects a batch by
+taking one frame from every stream that has one, round-robin, until max_batch frames are taken. If some streams have
+nothing buffered yet, it waits up to max_wait seconds for them, so cameras that capture at the same time share a batch
+even though their frames arrive a little apart. The frames of a batch are analyzed in the order they were taken, so
+every stream still sees its own frames in order.
+
+A camera drops its oldest buffered frame when the runner falls behind, so the runner always gets recent frames and
+the latency can't keep growing. Cameras deliver frames at their own rate, so their reads are never paced. Files can
+stand in for cameras. By default a file is read as fast as the runner consumes it and no frame is lost. With
+realtime=True it is replayed at its own frame rate and drops its oldest buffered frame like a camera.
+
+Classes:
+- StreamReader: Thread that reads one source into a bounded buffer.
+- Stream: Reader, analyzer, sink and counters of one stream.
+- MultiStreamRunner: Collects cross-stream batches, runs the shared detector and analyzes every frame.
+
+Functions:
+- is_camera(source): Whether a source is a camera index.
+- open_source(source): Open a camera index or a file with cv2.VideoCapture.
+"""
+
+import threading
+import time
+from collections import deque
+import cv2
+from .live_capture import latency_summary
+
+
+def is_camera(source):
+    """
+    :param source: Camera index (int or digit string) or path of a video file
+    :return: True for camera indices
+    """
+    return isinstance(source, int) or (isinstance(source, str) and source.isdigit())
+
+
+def open_source(source):
+    """
+    Opens a camera or a video file. Sources that are digits are treated as camera indices.
+
+    :param source: Camera index (int or digit string) or path of a video file
+    :return: cv2.VideoCapture
+    """
+    return cv2.VideoCapture(int(source) if is_camera(source) else source)
+
+
+class StreamReader(threading.Thread):
+
+    def __init__(self, name, cap, buffer_size = 4, realtime = False, live = False):
+        """
+        Initiates the reader. MultiStreamRunner sets the shared condition and starts it.
+
+        :param name: Name of the stream
+        :param cap: Opened cv2.VideoCapture
+        :param buffer_size: Maximum number of frames waiting to be analyzed
+        :param realtime: For files, pace the reads at the file's frame rate and drop the oldest frame when the buffer
+        is full, like a live camera. Otherwise the reader waits for room in the buffer, so no frame is lost.
+        :param live: The source is a camera. It always drops the oldest frame when the buffer is full, and its reads
+        are never paced since the camera delivers frames at its own rate.
+        """
+        super().__init__(name=f'reader-{name}', daemon=True)
+        self.cap = cap
+        self.condition = None  # shared by all readers and the runner, notified whenever a buffer changes
+        self.buffer_size = buffer_size
+        self.pace = realtime and not live
+        self.drop_oldest = realtime or live
+        self.frame_seconds = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30)
+
+        # (n_frame, frame, captured) waiting to be analyzed
+        self.frames = deque()
+        self.running = True
+        self.ended = False
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+    def run(self):
+        n_frame = 0
+        start = time.perf_counter()
+        while self.running:
+            if self.pace:
+                # replay at the source frame rate
+                delay = start + n_frame * self.frame_seconds - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            success, frame = self.cap.read()
+            captured = time.perf_counter()
+
+            with self.condition:
+                if not success:
+                    break
+                if not self.drop_oldest:
+                    while len(self.frames) >= self.buffer_size and self.running:
+                        self.condition.wait()
+                elif len(self.frames) >= self.buffer_size:
+                    # the oldest frame was never analyzed, it is stale now
+                    self.frames.popleft()
+                    self.frames_dropped += 1
+
+                self.frames.append((n_frame, frame, captured))
+                self.frames_read += 1
+                self.condition.notify_all()
+            n_frame += 1
+
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    @property
+    def done(self):
+        """
+        :return: True once the source has ended and every buffered frame was taken
+        """
+        return self.ended and not self.frames
+
+    def stop(self):
+        """
+        Stops the reader thread and waits for it to exit, so the caller can release the capture without a read still
+        running on it. Safe to call more than once.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join()
+
+
+class Stream:
+
+    def __init__(self, name, reader, analyzer, sink = None, writer = None):
+        """
+        Holds everything that belongs to one stream.
+
+        :param name: Name of the stream, used in the report and as the window title
+        :param reader: StreamReader of the stream
+        :param analyzer: FrameAnalyzer with the stream's own line detector, estimator and tracker
+        :param sink: Open DetectionSink for the stream's rows (optional)
+        :param writer: cv2.VideoWriter for the stream's annotated frames (optional)
+        """
+        self.name = name
+        self.reader = reader
+        self.analyzer = analyzer
+        self.sink = sink
+        self.writer = writer
+
+        self.frames = 0
+        self.first_frame = None
+        self.last_frame = None
+        self.latencies = []
+
+    def stats(self):
+        """
+        :return: dict with the frames analyzed and dropped, the frame rate and the capture-to-result latencies
+        """
+        seconds = (self.last_frame - self.first_frame) if self.frames > 1 else 0.0
+        return {'stream': self.name, 'frames': self.frames, 'dropped': self.reader.frames_dropped,
+                'fps': (self.frames - 1) / seconds if seconds > 0 else 0.0,
+                'latency': latency_summary(self.latencies)}
+
+
+class MultiStreamRunner:
+
+    def __init__(self, yolo, streams, max_batch = 8, max_wait = 0.005, show = False, report_every = 10.0):
+        """
+        Initiates the runner.
+
+        :param yolo: Object detector shared by every stream, a DetectorBackend
+        :param streams: List of Stream, their readers are started by run()
+        :param max_batch: Maximum number of frames sent through the detector in one call
+        :param max_wait: Seconds to wait for streams without a buffered frame before running a batch
+        :param show: Show every stream's annotated frames in its own window ('q' quits)
+        :param report_every: Seconds between throughput reports while running, None to only report at the end
+        """
+        self.yolo = yolo
+        self.streams = streams
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.show = show
+        self.report_every = report_every
+        self.condition = threading.Condition()
+        for stream in streams:
+            stream.reader.condition = self.condition
+
+        self.batches = 0
+        self.detected_frames = 0
+        self.start_time = None
+        self.elapsed = 0.0
+
+    def collect(self):
+        """
+        Takes the next batch of frames, one per stream at a time in round-robin order.
+
+        :return: List of (stream, n_frame, frame, captured), empty once every stream is done
+        """
+        batch = []
+        with self.condition:
+            # wait for the first frame of any stream
+            while not any(stream.reader.frames for stream in self.streams):
+                if all(stream.reader.done for stream in self.streams):
+                    return batch
+                self.condition.wait()
+
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                # one round, a frame from every stream that has one
+                took = False
+                for stream in self.streams:
+                    if stream.reader.frames and len(batch) < self.max_batch:
+                        batch.append((stream, *stream.reader.frames.popleft()))
+                        took = True
+                if took:
+                    continue
+
+                # nothing buffered, wait a little for the streams that have no frame in this batch yet
+                in_batch = set(id(stream) for stream, _, _, _ in batch)
+                missing = [stream for stream in self.streams
+                           if id(stream) not in in_batch and not stream.reader.done]
+                remaining = deadline - time.perf_counter()
+                if not missing or remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            self.condition.notify_all()  # readers may be waiting for room in their buffers
+        return batch
+
+    def process(self, batch):
+        """
+        Runs the shared detector once on the frames that need it, then analyzes every frame with its stream's
+        analyzer and writes its rows and annotated frame.
+
+        :param batch: List of (stream, n_frame, frame, captured) from collect()
+        :return: False if 'q' was pressed in a window
+        """
+        due = [stream.analyzer.detection_due() or stream.analyzer.last_result is None for stream, _, _, _ in batch]
+        frames = [frame for (_, _, frame, _), d in zip(batch, due) if d]
+        start = time.perf_counter()
+        results = iter(self.yolo(frames) if frames else [])
+        if frames:
+            self.batches += 1
+            self.detected_frames += len(frames)
+            per_frame = (time.perf_counter() - start) / len(frames)
+
+        keep_running = True
+        for (stream, n_frame, frame, captured), detected in zip(batch, due):
+            fa = stream.analyzer
+            if detected:
+                fa.last_result = next(results)
+                if fa.profiler.enabled:
+                    fa.profiler.record('yolo', per_frame)
+
+            analyzed_frame = fa.analyze_result(frame, fa.last_result, n_frame=n_frame, sink=stream.sink,
+                                               detected=detected)
+            done = time.perf_counter()
+            if stream.first_frame is None:
+                stream.first_frame = done
+            stream.last_frame = done
+            stream.frames += 1
+            stream.latencies.append(done - captured)
+
+            if analyzed_frame is not None:
+                if stream.writer is not None:
+                    with fa.profiler.stage('encode'):
+                        stream.writer.write(analyzed_frame)
+                if self.show:
+                    cv2.imshow(stream.name, analyzed_frame)
+
+        if self.show and cv2.waitKey(1) & 0xFF == ord('q'):
+            keep_running = False
+        return keep_running
+
+    def run(self):
+        """
+        Starts the readers and analyzes frames until every stream has ended or 'q' is pressed.
+        """
+        self.start_time = time.perf_counter()
+        last_report = self.start_time
+        for stream in self.streams:
+            stream.reader.start()
+
+        try:
+            while True:
+                batch = self.collect()
+                if not batch or not self.process(batch):
+                    break
+
+                if self.report_every is not None and time.perf_counter() - last_report >= self.report_every:
+                    last_report = time.perf_counter()
+                    print(self.throughput(), flush=True)
+        finally:
+            for stream in self.streams:
+                stream.reader.stop()
+            self.elapsed = time.perf_counter() - self.start_time
+
+    def throughput(self):
+        """
+        :return: One line with the aggregate frame rate and the mean batch size
+        """
+        elapsed = max((self.elapsed or time.perf_counter() - self.start_time), 1e-9)
+        frames = sum(stream.frames for stream in self.streams)
+        mean_batch = self.detected_frames / max(self.batches, 1)
+        return (f"{len(self.streams)} streams: {frames} frames in {elapsed:.2f}s ({frames / elapsed:.2f} FPS total), "
+                f"{self.batches} detector calls, {mean_batch:.2f} frames per call")
+
+    def report(self):
+        """
+        :return: Aggregate throughput and a per-stream table of frames, drops, frame rate and latency
+        """
+        lines = [self.throughput(), f"{'stream':<16}{'frames':>8}{'dropped':>9}{'FPS':>9}  capture-to-result latency"]
+        for s in [stream.stats() for stream in self.streams]:
+            lines.append(f"{s['stream']:<16}{s['frames']:>8}{s['dropped']:>9}{s['fps']:>9.2f}  {s['latency']}")
+        return '\n'.join(lines)
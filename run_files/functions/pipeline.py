@@ -0,0 +1,235 @@
+"""
+Classes for running the frame analysis as a multi-stage threaded pipeline.
+
+Every stage runs in its own thread and hands frames to the next stage through a bounded queue:
+
+    decode -> detect (YOLO) -> lines (LineDetector/DistanceEstimator) -> annotate -> encode (sink + VideoWriter)
+
+OpenCV and torch release the GIL while they work, so the stages overlap and the pipeline runs about as fast as its
+slowest stage instead of the sum of all of them. Each stage is a single thread and the queues are FIFO, so frames
+come out in order and the stateful DistanceEstimator sees them in the same order as in the sequential loop.
+
+Classes:
+- PipelineStage: A thread that applies one function to every item of its input queue.
+- SourceStage: The decoder thread, reads frames and feeds them to the first stage.
+- FramePipeline: Wires the stages together around a FrameAnalyzer and yields the finished frames in order.
+
+Methods:
+- FramePipeline.run(self): Start the threads and yield every finished item in frame order.
+- FramePipeline.stop(self): Stop reading new frames, the frames already in flight are still finished.
+- FramePipeline.stats(self): Per-stage frame count, latency and input queue depth.
+- FramePipeline.report(self): The stats formatted as a table.
+"""
+
+import queue
+import threading
+import time
+
+
+# marks the end of the stream, passed from stage to stage
+_END = object()
+
+
+class PipelineStage(threading.Thread):
+
+    def __init__(self, name, fn, in_queue, out_queue, stop_event):
+        """
+        Initiates the stage.
+
+        :param name: Name used in the stats
+        :param fn: Function applied to every item, receives and returns the item dict
+        :param in_queue: Queue the items are taken from
+        :param out_queue: Queue the processed items are put on
+        :param stop_event: Event that is set to stop the decoder when this stage fails
+        """
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stop_event = stop_event
+
+        # stats
+        self.frames = 0
+        self.busy_seconds = 0.0
+        self.max_seconds = 0.0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.error = None
+
+    def run(self):
+        while True:
+            depth = self.in_queue.qsize()
+            item = self.in_queue.get()
+            if item is _END:
+                break
+            # after a failure keep draining so the stages before this one never block on a full queue
+            if self.error is not None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                item = self.fn(item)
+            except Exception as error:
+                # stop the decoder, the error is raised again by FramePipeline.run()
+                self.error = error
+                self.stop_event.set()
+                continue
+            self.record(time.perf_counter() - start, depth)
+
+            self.out_queue.put(item)
+
+        self.out_queue.put(_END)
+
+    def record(self, seconds, depth):
+        """
+        Records the latency of one item and the depth of the input queue when it was taken.
+        """
+        self.frames += 1
+        self.busy_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def stats(self):
+        """
+        :return: dict with the frame count, mean/max latency in ms and mean/max input queue depth
+        """
+        frames = max(self.frames, 1)
+        return {'stage': self.name,
+                'frames': self.frames,
+                'mean_ms': 1000 * self.busy_seconds / frames,
+                'max_ms': 1000 * self.max_seconds,
+                'queue_depth': self.in_queue.qsize(),
+                'mean_queue_depth': self.depth_total / frames,
+                'max_queue_depth': self.max_depth}
+
+
+class SourceStage(PipelineStage):
+
+    def __init__(self, read_frame, out_queue, stop_event):
+        """
+        Initiates the decoder stage.
+
+        :param read_frame: Function returning (success, frame), e.g. cv2.VideoCapture.read
+        :param out_queue: Queue the decoded frames are put on
+        :param stop_event: Event that stops the decoder when set
+        """
+        super().__init__('decode', None, queue.Queue(), out_queue, stop_event)
+        self.read_frame = read_frame
+
+    def run(self):
+        n_frame = 0
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                success, frame = self.read_frame()
+            except Exception as error:
+                self.error = error
+                break
+            if not success:
+                break
+            self.record(time.perf_counter() - start, 0)
+
+            self.out_queue.put({'n_frame': n_frame, 'frame': frame, 'captured': time.perf_counter()})
+            n_frame += 1
+
+        self.out_queue.put(_END)
+
+
+class FramePipeline:
+
+    def __init__(self, analyzer, read_frame, sink = None, writer = None, queue_size = 8, annotate = True):
+        """
+        Builds the stages. Nothing runs until run() is called.
+
+        :param analyzer: FrameAnalyzer used for detection, line analysis and drawing
+        :param read_frame: Function returning (success, frame), e.g. cv2.VideoCapture.read
+        :param sink: Open DetectionSink the rows are written to (optional)
+        :param writer: cv2.VideoWriter the annotated frames are written to (optional), only the frames the analyzer's
+        renderer drew are written
+        :param queue_size: Maximum number of frames waiting between two stages
+        :param annotate: Set to false to skip drawing on the frames
+        """
+        self.analyzer = analyzer
+        self.sink = sink
+        self.writer = writer
+        self.annotate = annotate
+        self.stop_event = threading.Event()
+
+        # the decoder feeds the first queue, the main thread drains the last one
+        stage_fns = [('detect', self.detect), ('lines', self.lines),
+                     ('annotate', self.draw), ('encode', self.encode)]
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stage_fns) + 1)]
+        self.stages = [PipelineStage(name, fn, self.queues[i], self.queues[i + 1], self.stop_event)
+                       for i, (name, fn) in enumerate(stage_fns)]
+        self.decoder = SourceStage(read_frame, self.queues[0], self.stop_event)
+
+    def detect(self, item):
+        with self.analyzer.profiler.stage('yolo'):
+            item['result'] = self.analyzer.yolo(item['frame'])[0]
+        return item
+
+    def lines(self, item):
+        item['rows'], item['lines'] = self.analyzer.analyze(item['frame'], item['result'], item['n_frame'])
+        self.analyzer.record(item['frame'], item['rows'], item['n_frame'])  # before the draw stage changes the frame
+        return item
+
+    def draw(self, item):
+        # the frame is drawn on in place, 'rendered' says whether the renderer wanted it
+        item['rendered'] = (self.annotate and self.analyzer.draw(item['frame'], item['rows'], item['lines'],
+                                                                 item['n_frame']) is not None)
+        return item
+
+    def encode(self, item):
+        if self.sink is not None:
+            with self.analyzer.profiler.stage('write'):
+                self.sink.write_frame(item['rows'])
+        if self.writer is not None and item['rendered']:
+            with self.analyzer.profiler.stage('encode'):
+                self.writer.write(item['frame'])
+        self.analyzer.profiler.tick()
+        return item
+
+    def run(self):
+        """
+        Starts every stage and yields the finished items in frame order. Each item is a dict with
+        'n_frame', 'frame' (annotated), 'rendered' (whether it was drawn on), 'rows', 'lines' and 'captured'
+        (perf_counter time it was read).
+        The caller should keep iterating after stop() until the generator ends, so the stages can drain.
+        """
+        self.decoder.start()
+        for stage in self.stages:
+            stage.start()
+
+        while True:
+            item = self.queues[-1].get()
+            if item is _END:
+                break
+            yield item
+
+        for stage in [self.decoder] + self.stages:
+            stage.join()
+            if stage.error is not None:
+                raise stage.error
+
+    def stop(self):
+        """
+        Stops reading new frames. Frames already in the pipeline still come out of run().
+        """
+        self.stop_event.set()
+
+    def stats(self):
+        """
+        :return: list of per-stage stats dicts, in pipeline order
+        """
+        return [stage.stats() for stage in [self.decoder] + self.stages]
+
+    def report(self):
+        """
+        :return: Per-stage stats as a printable table. The stage with the highest mean latency is the bottleneck.
+        """
+        lines = [f"{'stage':<10}{'frames':>8}{'mean ms':>10}{'max ms':>10}{'mean queue':>12}{'max queue':>11}"]
+        for s in self.stats():
+            lines.append(f"{s['stage']:<10}{s['frames']:>8}{s['mean_ms']:>10.2f}{s['max_ms']:>10.2f}"
+                         f"{s['mean_queue_depth']:>12.2f}{s['max_queue_depth']:>11}")
+        return '\n'.join(lines)
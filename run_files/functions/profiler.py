@@ -0,0 +1,177 @@
+"""
+Classes for timing the stages of the frame analysis.
+
+FrameAnalyzer wraps each of its stages (YOLO, line detection, clustering, distance estimation, writing the log and
+drawing) in `with profiler.stage(name):`. StageProfiler times them with time.perf_counter and keeps the most recent
+timings of every stage, so it can report rolling p50/p95/p99 latencies. Summaries are printed, or written to a JSON
+stats file, every few seconds and once more at the end of a run. When profiling is off the analyzer uses
+NULL_PROFILER. Its stage() returns one shared no-op context manager, so an unprofiled frame only pays for a few empty
+`with` blocks.
+
+Classes:
+- StageProfiler: Collects per-stage timings and reports rolling percentiles.
+- NullProfiler: Drop-in replacement that records nothing.
+
+Attributes:
+- NULL_PROFILER (NullProfiler): Shared instance used when profiling is disabled.
+
+Methods:
+- StageProfiler.stage(self, name): Context manager that times one run of a stage.
+- StageProfiler.record(self, name, seconds): Record a timing measured elsewhere.
+- StageProfiler.tick(self): Count a finished frame and write a summary if one is due.
+- StageProfiler.summary(self): Per-stage count, mean, p50, p95, p99 and max in ms.
+- StageProfiler.report(self): The summary formatted as a table.
+- StageProfiler.write_stats(self, path): Write the summary to a JSON file.
+"""
+
+import contextlib
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+
+class _StageTimer:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class StageProfiler:
+    enabled = True
+
+    def __init__(self, window = 1000, report_every = 10.0, stats_path = None):
+        """
+        Initiates the profiler.
+
+        :param window: Number of most recent timings per stage the percentiles are computed over
+        :param report_every: Seconds between periodic summaries, None to only report at the end
+        :param stats_path: JSON file the periodic summaries are written to. The summaries are printed if not given.
+        """
+        self.window = window
+        self.report_every = report_every
+        self.stats_path = stats_path
+
+        # stage name -> recent timings in seconds, and the total count/time since the start
+        self.timings = {}
+        self.counts = {}
+        self.totals = {}
+
+        self.frames = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def stage(self, name):
+        """
+        :param name: Name of the stage
+        :return: Context manager that records how long its block took
+        """
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds):
+        """
+        Records one timing of a stage. deque.append is atomic, so stages on other threads can record too.
+
+        :param name: Name of the stage
+        :param seconds: How long the stage took
+        """
+        timings = self.timings.get(name)
+        if timings is None:
+            timings = self.timings.setdefault(name, deque(maxlen=self.window))
+        timings.append(seconds)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    def tick(self):
+        """
+        Counts a finished frame and writes a periodic summary if report_every seconds have passed.
+        """
+        self.frames += 1
+        if self.report_every is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_every:
+            self.last_report = now
+            if self.stats_path is not None:
+                self.write_stats(self.stats_path)
+            else:
+                print(self.report())
+
+    def summary(self):
+        """
+        :return: dict of stage name -> count, total seconds, and mean/p50/p95/p99/max of the recent timings in ms
+        """
+        summary = {}
+        for name, timings in list(self.timings.items()):
+            ms = np.array(timings) * 1000
+            if ms.size == 0:
+                continue
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            summary[name] = {'count': self.counts[name], 'total_s': self.totals[name],
+                             'mean_ms': float(ms.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95),
+                             'p99_ms': float(p99), 'max_ms': float(ms.max())}
+        return summary
+
+    def report(self):
+        """
+        :return: The summary as a printable table, plus the frame count and rate
+        """
+        elapsed = time.perf_counter() - self.started
+        lines = [f"{'stage':<12}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<12}{s['count']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+                         f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+        lines.append(f"{self.frames} frames in {elapsed:.2f}s ({self.frames / max(elapsed, 1e-9):.2f} FPS)")
+        return '\n'.join(lines)
+
+    def write_stats(self, path):
+        """
+        Writes the summary to a JSON file, replacing it atomically so a reader never sees half a file.
+
+        :param path: Path of the JSON file
+        """
+        stats = {'frames': self.frames, 'elapsed_s': time.perf_counter() - self.started, 'stages': self.summary()}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(stats, file, indent=2)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        """
+        Writes the final summary, to the stats file if there is one, and prints it.
+        """
+        if self.stats_path is not None:
+            self.write_stats(self.stats_path)
+        print(self.report())
+
+
+class NullProfiler:
+    enabled = False
+
+    # a single reusable no-op context manager, so a disabled stage doesn't allocate anything
+    _NULL_STAGE = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._NULL_STAGE
+
+    def record(self, name, seconds):
+        pass
+
+    def tick(self):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,92 @@
+"""
+A class for drawing the analysis of a frame (boxes, labels, distances and Hough lines) onto it.
+
+Drawing is kept apart from the analysis, so runs that only need the detection log can skip it. A renderer can also
+draw only a subset of the frames: every Nth frame, only the frames with detections, or both.
+
+Attributes:
+- every (int): Draw every Nth frame, 0 to never draw.
+- only_detections (bool): Only draw frames that have at least one object.
+- enabled (bool): False if the renderer never draws.
+- NULL_RENDERER (FrameRenderer): Shared renderer that never draws, for headless runs.
+
+Methods:
+- __init__(self, every=1, only_detections=False): Initialize the class.
+- due(self, n_frame, rows): Whether the frame should be drawn.
+- draw(self, frame, rows, lines): Draw boxes, object information and lines onto the frame.
+"""
+
+import math
+import cv2
+
+
+class FrameRenderer:
+
+    def __init__(self, every = 1, only_detections = False):
+        """
+        Initiates the class.
+
+        :param every: Draw every Nth frame (by frame number), 0 to never draw
+        :param only_detections: Only draw frames with at least one object
+        """
+        self.every = every
+        self.only_detections = only_detections
+
+    @property
+    def enabled(self):
+        return self.every > 0
+
+    def due(self, n_frame, rows):
+        """
+        :param n_frame: Frame number
+        :param rows: Rows of the frame, see FrameAnalyzer.analyze
+        :return: True if the frame should be drawn
+        """
+        if not self.enabled or (self.only_detections and not rows):
+            return False
+        return n_frame % self.every == 0
+
+    def draw(self, frame, rows, lines):
+        """
+        Draws the bounding boxes, object information and Hough lines onto the frame.
+
+        :param frame: Frame to draw on, changed in place
+        :param rows: Rows returned by FrameAnalyzer.analyze
+        :param lines: Hough lines returned by FrameAnalyzer.analyze
+        :return: Altered frame
+        """
+        # Draw bounding boxes and display object information on the frame
+        for row in rows:
+            object_name, conf, object_distance = row[3:6]
+            x1, y1, x2, y2 = (int(v) for v in row[6:10])
+            track_id, smoothed_distance = row[10:12]
+
+            # Draw bounding box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+            # Display class name and confidence, plus the track ID if we are tracking
+            label = object_name if track_id is None else f'{object_name} #{track_id}'
+            cv2.putText(frame, f'{label}: {conf:.2f}', (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+            # Display distance information, smoothed over the track if there is one
+            if smoothed_distance is not None:
+                object_distance = smoothed_distance
+            if not math.isnan(object_distance):
+                distance = float(object_distance)
+                cv2.putText(frame, f'Distance: {distance:.2f}', (x1, y2 + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            else:
+                cv2.putText(frame, f'Distance: Unknown', (x1, y2 + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+
+        # Draw lines detected by Hough Line Transform
+        for line in lines:
+            x1, y1, x2, y2 = line[0]
+            cv2.line(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+        return frame
+
+
+NULL_RENDERER = FrameRenderer(every=0)
@@ -2,115 +2,348 @@
 A class for analyzing frames by applying YOLO object detection and Hough Line Transform.
 
 Attributes:
-- yolo: YOLO object detection model.
+- yolo: Object detector, a DetectorBackend (see detectors.py) or an ultralytics YOLO model.
 - detector: Detector for applying Hough Line Transform.
 - estimator: DistanceEstimator object for estimating distances.
+- last_result: YOLO result of the last frame YOLO ran on.
+- tracker: ObjectTracker for stable IDs and smoothed distances (optional).
+- profiler: StageProfiler timing every stage, NULL_PROFILER when profiling is off.
+- renderer: FrameRenderer that draws the analysis onto the frames, NULL_RENDERER for headless runs.
+- recorder: EventRecorder that keeps the raw frames and saves clips around close objects (optional).
+- line_gate: LineGate that reuses the previous lines on frames where the rails look the same (optional).
+- lines_reused: True if the last detect_lines call reused the previous frame's lines.
 
 Methods:
-- __init__(self, yolo, detector, estimator): Initialize the FrameAnalyzer class.
-- run_frame(self, frame, csv_path=None, n_frame=None): Analyze a frame, write detected objects to CSV,
+- __init__(self, yolo, detector, estimator, parallel_lines=False, tracker=None, detect_every=1, profiler=None,
+  renderer=None, recorder=None, line_gate=None): Initialize the class.
+- close(self): Shut down the line detection worker thread.
+- run_frame(self, frame, csv_path=None, n_frame=None, sink=None, detect=True): Analyze a frame, write detected objects to CSV,
   and return the analyzed frame.
+- run_batch(self, frames, first_frame=0, sink=None): Run YOLO once on a batch of frames, then analyze them in order.
+- detection_due(self): Count a frame and say whether YOLO should run on it.
+- analyze_result(self, frame, result, csv_path=None, n_frame=None, sink=None, lines=None, detected=True): Everything after
+  YOLO for one frame.
+- analyze(self, frame, result, n_frame=None, lines=None, detected=True): Detect lines, track objects and estimate
+  distances, return the output rows and lines.
+- object_rows(self, frame, result, n_frame=None, detected=True): Track objects and estimate their distances.
+- detect_lines(self, frame): Hough lines of the frame together with their [intercept, slope], or the previous
+  frame's if the line gate says the rails look the same.
+- rail_lines(self): The estimator's smoothed left and right lines, for the detector's adaptive ROI.
+- read_detections(self, result): Pull (class_id, object_name, conf, box) out of a Detections or YOLO result.
+- record(self, frame, rows, n_frame=None): Give the raw frame and its rows to the event recorder.
+- draw(self, frame, rows, lines, n_frame=None): Draw boxes, object information and lines onto the frame if the
+  renderer wants this frame.
 
 Parameters:
 - frame: Frame in image or video format to analyze.
 - csv_path: Path to write CSV output (optional).
 - n_frame: Frame number for logging (optional).
+- sink: DetectionSink kept open across frames (optional).
 
 Returns:
-- Altered analyzed frame.
+- Altered analyzed frame, or None if the renderer skipped it.
 """
 
-import csv
-import cv2
-import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .detection_sink import CsvSink
+from .detectors import Detections
+from .profiler import NULL_PROFILER
+from .renderer import FrameRenderer
 
 class FrameAnalyzer:
-    def __init__(self, yolo, detector, estimator):
+    def __init__(self, yolo, detector, estimator, parallel_lines = False, tracker = None, detect_every = 1,
+                 profiler = None, renderer = None, recorder = None, line_gate = None):
+        """
+        Initiates the class.
+
+        :param yolo: Object detector, a DetectorBackend or an ultralytics YOLO model
+        :param detector: LineDetector for applying the Hough Line Transform
+        :param estimator: DistanceEstimator for estimating distances
+        :param parallel_lines: Run line detection on a worker thread while YOLO runs in run_frame.
+        They don't depend on each other until distance estimation, and both release the GIL,
+        so the frame takes about as long as the slower of the two instead of their sum.
+        :param tracker: ObjectTracker that gives objects stable IDs, smoothed distances and closing speeds (optional)
+        :param detect_every: Only run YOLO on every Nth frame. In between, the tracker's predicted boxes are used if
+        there is a tracker, otherwise the previous frame's boxes are reused.
+        :param profiler: StageProfiler that times yolo, lines, cluster, distances, write and draw (optional)
+        :param renderer: FrameRenderer that decides which frames are drawn, defaults to drawing every frame.
+        Pass NULL_RENDERER to skip drawing altogether.
+        :param recorder: EventRecorder that is given every raw frame and its rows before drawing (optional)
+        :param line_gate: LineGate that lets visually unchanged frames reuse the previous lines and skip the
+        clustering (optional)
+        """
         self.yolo = yolo
         self.detector = detector
         self.estimator = estimator
+        self.tracker = tracker
+        self.detect_every = max(1, detect_every)
+        self.frames_seen = 0
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        self.renderer = renderer if renderer is not None else FrameRenderer()
+        self.recorder = recorder
+        self.line_gate = line_gate
+
+        self.line_executor = ThreadPoolExecutor(max_workers=1) if parallel_lines else None
+
+        # YOLO result of the last frame it ran on, reused by run_frame(detect=False)
+        self.last_result = None
+
+        # lines of the last frame they were detected on, reused by the line gate, and how long that took
+        self.last_lines = None
+        self.lines_reused = False
+        self.lines_seconds = 0.0
+
+    def close(self):
+        """
+        Shuts down the line detection worker thread, if there is one.
+        """
+        if self.line_executor is not None:
+            self.line_executor.shutdown()
+            self.line_executor = None
 
-    def run_frame(self, frame, csv_path=None, n_frame = None):
+    def run_frame(self, frame, csv_path=None, n_frame = None, sink = None, detect = True):
         """
         Analyze a frame (image or video frame), write detected objects to CSV,
         and return the altered analyzed frame.
         
         :param frame: Frame in image or video format to analyze
-        :param csv_path: Path to write CSV output (optional)
-        :return: Altered analyzed frame
+        :param csv_path: Path to write CSV output for a single frame (optional, overwritten every call)
+        :param n_frame: Frame number written in the Frame column (optional, defaults to 0)
+        :param sink: Open DetectionSink that the rows are appended to (optional, preferred for videos)
+        :param detect: Set to false to skip YOLO and reuse the boxes of the previous frame (or the tracker's
+        predictions). The lines and distances are still updated for this frame.
+        :return: Altered analyzed frame, or None if the renderer skipped it
         """
-        # Apply the YOLO object detection model
-        results = self.yolo(frame)
-        detected_objects = results[0].boxes
-        object_names = results[0].names
+        # Start the Hough Line Transform on the worker thread so it overlaps with YOLO
+        lines = None
+        if self.line_executor is not None:
+            lines = self.line_executor.submit(self.detect_lines, frame)
 
-        # Apply the Hough Line Transform
-        lines = self.detector.detect_lines_frame(frame)
-        self.estimator.analyze_lines(lines)
+        # Apply the YOLO object detection model, unless we are reusing the previous frame's detections
+        detected = (self.detection_due() and detect) or self.last_result is None
+        if detected:
+            with self.profiler.stage('yolo'):
+                self.last_result = self.yolo(frame)[0]
 
-        object_distances = []
-        
-        # Check if csv_path is provided and if the file exists, clear its contents
-        if csv_path:
-            if os.path.exists(csv_path):
-                open(csv_path, 'w').close() 
-
-        with open(csv_path, mode='a', newline='') as file:
-            writer = csv.writer(file)
-
-            if csv_path is not None and n_frame is None:
-                writer.writerow(['Trajectory','Class ID', 'Object Name',
-                                 'Confidence', 'Distance', 'X1', 'Y1', 'X2', 'Y2'])
-            elif csv_path is not None and n_frame == 0:
-                writer.writerow(['Frame','Trajectory','Class ID', 'Object Name',
-                                 'Confidence', 'Distance', 'X1', 'Y1', 'X2', 'Y2', ])
-
-            # Loop through each detected object and write its information to CSV
-            for box in detected_objects:
-                class_id = box.cls[0].item()
-                conf = box.conf[0].item()
-                cords = box.xyxy[0].tolist()  # formatted as [x1, y1, x2, y2]
-                object_name = object_names.get(class_id, 'Unknown')
-
-                # Estimate distance using frame shape and object coordinates
-                distance = self.estimator.estimate_distance(frame.shape[0], cords[3])
-                object_distances.append(distance)
-
-                if csv_path is not None and n_frame is None:
-                    writer.writerow([self.estimator.trajectory, class_id, object_name,
-                                     conf, distance, *cords])
-                elif csv_path is not None:
-                    writer.writerow([n_frame, self.estimator.trajectory, class_id, object_name,
-                                     conf, distance, *cords])
-
-        # Draw bounding boxes and display object information on the frame
-        for idx, box in enumerate(detected_objects):
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            class_id = box.cls[0].item()
-            conf = box.conf[0].item()
-            object_name = object_names.get(class_id, 'Unknown')
+        # Wait for the line detection before estimating distances
+        if lines is not None:
+            lines = lines.result()
 
-            # Draw bounding box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        return self.analyze_result(frame, self.last_result, csv_path, n_frame, sink, lines, detected)
 
-            # Display class name and confidence
-            cv2.putText(frame, f'{object_name}: {conf:.2f}', (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    def run_batch(self, frames, first_frame = 0, sink = None):
+        """
+        Analyze a batch of video frames with a single YOLO call. The line detection, distance estimation
+        and drawing still run one frame at a time in frame order, so the estimator's smoothing behaves
+        exactly as if run_frame had been called on every frame.
+
+        :param frames: List of frames to analyze
+        :param first_frame: Frame number of the first frame in the batch
+        :param sink: Open DetectionSink that the rows are appended to (optional)
+        :return: List of altered analyzed frames, None for the frames the renderer skipped
+        """
+        # Apply the YOLO object detection model at once to every frame of the batch that needs it
+        due = [self.detection_due() or (self.last_result is None and i == 0) for i in range(len(frames))]
+        start = time.perf_counter()
+        results = iter(self.yolo([frame for frame, d in zip(frames, due) if d]) if any(due) else [])
 
-            # Display distance information
-            if isinstance(object_distances[idx], (int, float)):
-                distance = float(object_distances[idx])
-                cv2.putText(frame, f'Distance: {distance:.2f}', (x1, y2 + 20),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            else:
-                cv2.putText(frame, f'Distance: Unknown', (x1, y2 + 20),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        # profile YOLO per frame, so the numbers compare to run_frame whatever the batch size
+        if self.profiler.enabled and any(due):
+            per_frame = (time.perf_counter() - start) / sum(due)
+            for _ in range(sum(due)):
+                self.profiler.record('yolo', per_frame)
 
+        analyzed_frames = []
+        for i, (frame, detected) in enumerate(zip(frames, due)):
+            if detected:
+                self.last_result = next(results)
+            analyzed_frames.append(self.analyze_result(frame, self.last_result, n_frame=first_frame + i,
+                                                       sink=sink, detected=detected))
+        return analyzed_frames
 
-        # Draw lines detected by Hough Line Transform
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            cv2.line(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    def detection_due(self):
+        """
+        Counts a frame and says whether YOLO is due on it according to detect_every.
 
+        :return: True if YOLO should run on this frame
+        """
+        due = self.frames_seen % self.detect_every == 0
+        self.frames_seen += 1
+        return due
+
+    def analyze_result(self, frame, result, csv_path=None, n_frame = None, sink = None, lines = None,
+                       detected = True):
+        """
+        Runs everything after YOLO on one frame: line detection, distance estimation,
+        writing the detections, recording events and drawing on the frame.
+
+        :param frame: Frame that YOLO was run on
+        :param result: YOLO result for this frame
+        :param csv_path: Path to write CSV output for a single frame (optional, overwritten every call)
+        :param n_frame: Frame number written in the Frame column (optional, defaults to 0)
+        :param sink: Open DetectionSink that the rows are appended to (optional)
+        :param lines: (lines, params) already detected for this frame by detect_lines (optional, detected here if not given)
+        :param detected: False if result is left over from an earlier frame
+        :return: Altered analyzed frame, or None if the renderer skipped it
+        """
+        rows, lines = self.analyze(frame, result, n_frame, lines, detected)
+
+        # Write the rows to the sink, or to a one-off sink if only a csv_path was given
+        with self.profiler.stage('write'):
+            if sink is not None:
+                sink.write_frame(rows)
+            elif csv_path is not None:
+                with CsvSink(csv_path) as one_off_sink:
+                    one_off_sink.write_frame(rows)
+
+        # Keep the raw frame for event clips, before anything is drawn onto it
+        self.record(frame, rows, n_frame)
+
+        frame = self.draw(frame, rows, lines, n_frame)
+        self.profiler.tick()
         return frame
+
+    def analyze(self, frame, result, n_frame = None, lines = None, detected = True):
+        """
+        Detects the rail lines, updates the estimator and estimates the distance to every detected object.
+        The frame is not changed.
+
+        :param frame: Frame that YOLO was run on
+        :param result: YOLO result for this frame
+        :param n_frame: Frame number written in the Frame column (optional, defaults to 0)
+        :param lines: (lines, params) already detected for this frame by detect_lines (optional, detected here if not given)
+        :param detected: False if result is left over from an earlier frame. With a tracker the tracks are
+        propagated instead of updated from it.
+        :return: rows for the output log (in DetectionSink.HEADER order) and the detected Hough lines
+        """
+        # Apply the Hough Line Transform
+        if lines is None:
+            lines = self.detect_lines(frame)
+        lines, line_params = lines
+
+        # Reused lines were already clustered into the estimator's current lines
+        if not self.lines_reused:
+            start = time.perf_counter()
+            with self.profiler.stage('cluster'):
+                self.estimator.analyze_lines(lines, line_params)
+            if self.line_gate is not None:
+                self.line_gate.record_refresh(self.lines_seconds + time.perf_counter() - start)
+
+        with self.profiler.stage('distances'):
+            rows = self.object_rows(frame, result, n_frame, detected)
+
+        return rows, lines
+
+    def object_rows(self, frame, result, n_frame = None, detected = True):
+        """
+        Tracks the objects (if there is a tracker) and estimates their distances with the estimator's current lines.
+
+        :param frame: Frame that YOLO was run on
+        :param result: YOLO result for this frame
+        :param n_frame: Frame number written in the Frame column (optional, defaults to 0)
+        :param detected: False if result is left over from an earlier frame
+        :return: rows for the output log (in DetectionSink.HEADER order)
+        """
+        # Get the objects of this frame, with their tracks if we are tracking
+        if self.tracker is None:
+            detections = self.read_detections(result)
+            tracks = [None] * len(detections)
+        elif detected:
+            detections = self.read_detections(result)
+            tracks = self.tracker.update(detections)
+        else:
+            tracks = self.tracker.predict()
+            detections = [(t.class_id, t.object_name, t.conf, t.box.tolist()) for t in tracks]
+
+        # Estimate the distance of every object at once using frame shape and the bottom of the boxes (NaN if unknown)
+        distances = self.estimator.estimate_distances(frame.shape[0], [cords[3] for _, _, _, cords in detections])
+
+        rows = []
+
+        # Loop through each object and build its row for the output log
+        for (class_id, object_name, conf, cords), track, distance in zip(detections, tracks, distances.tolist()):
+            # Smooth the distance over the object's track
+            track_id, smoothed_distance, closing_speed = None, None, None
+            if track is not None:
+                track_id = track.track_id
+                smoothed_distance, closing_speed = self.tracker.update_distance(track, distance)
+
+            rows.append([n_frame or 0, self.estimator.trajectory, class_id, object_name,
+                         conf, distance, *cords, track_id, smoothed_distance, closing_speed])
+
+        return rows
+
+    def detect_lines(self, frame):
+        """
+        Applies the Hough Line Transform, guided by the estimator's current rail lines.
+
+        :param frame: Frame to detect the lines in
+        :return: (N, 1, 4) lines and their (N, 2) [intercept, slope] in frame coordinates
+        """
+        # Skip the Hough transform if the rail region looks like the last frame it ran on
+        if self.line_gate is not None:
+            with self.profiler.stage('gate'):
+                self.lines_reused = self.line_gate.unchanged(frame) and self.last_lines is not None
+            if self.lines_reused:
+                return self.last_lines
+
+        start = time.perf_counter()
+        with self.profiler.stage('lines'):
+            self.last_lines = self.detector.detect_lines_frame(frame, rail_lines=self.rail_lines(), return_params=True)
+        self.lines_seconds = time.perf_counter() - start
+        return self.last_lines
+
+    def rail_lines(self):
+        """
+        :return: Copy of the estimator's smoothed [left_line, right_line], used by the detector's adaptive ROI
+        """
+        return [list(self.estimator.left_line), list(self.estimator.right_line)]
+
+    def read_detections(self, result):
+        """
+        Pulls the detections out of a detector result.
+
+        :param result: Detections of a DetectorBackend, or an ultralytics result, for one frame
+        :return: List of (class_id, object_name, conf, [x1, y1, x2, y2])
+        """
+        if isinstance(result, Detections):
+            return [(float(class_id), result.names.get(class_id, 'Unknown'), conf, cords)
+                    for class_id, conf, cords in zip(result.classes.tolist(), result.scores.tolist(),
+                                                     result.boxes.tolist())]
+
+        # ultralytics result, the boxes are torch tensors
+        detections = []
+        for box in result.boxes:
+            class_id = box.cls[0].item()
+            conf = box.conf[0].item()
+            cords = box.xyxy[0].tolist()  # formatted as [x1, y1, x2, y2]
+            detections.append((class_id, result.names.get(class_id, 'Unknown'), conf, cords))
+        return detections
+
+    def record(self, frame, rows, n_frame = None):
+        """
+        Hands the raw frame and its rows to the event recorder, if there is one.
+
+        :param frame: Frame before anything is drawn onto it
+        :param rows: rows of the frame (in DetectionSink.HEADER order)
+        :param n_frame: Frame number of the frame
+        """
+        if self.recorder is not None:
+            with self.profiler.stage('record'):
+                self.recorder.add(frame, rows, n_frame)
+
+    def draw(self, frame, rows, lines, n_frame = None):
+        """
+        Draws the bounding boxes, object information and Hough lines onto the frame, if the renderer wants it.
+
+        :param frame: Frame to draw on
+        :param rows: Rows returned by analyze
+        :param lines: Hough lines returned by analyze
+        :param n_frame: Frame number, used to draw only every Nth frame (optional, defaults to 0)
+        :return: Altered frame, or None if the renderer skipped it
+        """
+        if not self.renderer.due(n_frame or 0, rows):
+            return None
+        with self.profiler.stage('draw'):
+            return self.renderer.draw(frame, rows, lines)
@@ -0,0 +1,395 @@
+"""
+An asyncio service that keeps the frame analysis warm and answers requests over a local socket.
+
+Clients POST an encoded frame (JPEG, PNG or anything else cv2.imdecode reads) with a stream ID, and get the detected
+objects, their distances and the track trajectory back as JSON. The server speaks a small subset of HTTP/1.1
+(keep-alive, Content-Length bodies) over TCP or a Unix socket, so curl, http.client or any HTTP library can talk to it.
+
+Every stream ID gets its own FrameAnalyzer (line detector, estimator and optionally tracker), created on its first
+frame, so the rail lines of one camera never mix with another's. The object detector is loaded once and shared.
+
+Requests go into a bounded queue. A batching task takes the first waiting request, waits up to max_wait seconds for
+more (up to max_batch), and hands the batch to a single worker thread. The worker decodes the frames, runs the detector
+once on all of them and then analyzes them in arrival order, so the frames of a stream are always analyzed in the order
+they were sent. Under light load a request is handled on its own and only pays the max_wait delay; under heavy load
+the batches fill up. When the queue is full, new requests are rejected with 503 and a Retry-After header instead of
+queueing without bound (backpressure).
+
+Per-request latency (arrival to response), queue wait, decoding and every analysis stage are recorded in a
+StageProfiler and served as rolling percentiles on GET /metrics.
+
+Endpoints:
+- POST /analyze?stream=<id>[&frame=<n>]: Analyze one encoded frame. The frame number defaults to a per-stream counter.
+- GET /metrics: Request counts, batch sizes and latency percentiles.
+- GET /health: {"status": "ok"} once the model is loaded.
+- DELETE /streams/<id>: Forget the state of a stream.
+
+Classes:
+- AnalysisService: Per-stream analyzers, the request queue, the batching task and the metrics.
+
+Functions:
+- row_to_json(row): One detection row as a JSON serializable dict.
+- parse_count(text): A non-negative integer from a header or query value, None if it isn't one.
+- serve(service, host='127.0.0.1', port=8765, unix_path=None): Run the HTTP server until cancelled or SIGTERM.
+"""
+
+import asyncio
+import json
+import math
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import cv2
+import numpy as np
+from .detection_sink import HEADER
+from .line_gate import merge_stats
+from .profiler import StageProfiler
+
+
+# largest request body accepted, a 4K PNG is well below this
+MAX_BODY = 64 * 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def row_to_json(row):
+    """
+    :param row: Detection row in HEADER order
+    :return: dict keyed by snake_case HEADER names, NaN distances become None
+    """
+    obj = {}
+    for name, value in zip(HEADER, row):
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        obj[name.lower().replace(' ', '_')] = value
+    obj['box'] = [obj.pop('x1'), obj.pop('y1'), obj.pop('x2'), obj.pop('y2')]
+    return obj
+
+
+def parse_count(text):
+    """
+    :param text: Header or query value, e.g. a Content-Length or a frame number
+    :return: The value as an int, None if it isn't a non-negative integer
+    """
+    text = text.strip()
+    return int(text) if text.isascii() and text.isdigit() else None
+
+
+class AnalysisService:
+
+    def __init__(self, yolo, make_analyzer, max_batch = 8, max_wait = 0.005, queue_size = 64):
+        """
+        Initiates the service. Call start() from the event loop before serving.
+
+        :param yolo: Object detector shared by every stream, a DetectorBackend
+        :param make_analyzer: Function returning a new FrameAnalyzer for a stream, given the service's profiler
+        :param max_batch: Maximum number of frames sent through the detector in one call
+        :param max_wait: Seconds the batching task waits for more requests after the first one
+        :param queue_size: Maximum number of requests waiting, more are rejected with 503
+        """
+        self.yolo = yolo
+        self.make_analyzer = make_analyzer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue_size = queue_size
+
+        self.metrics = StageProfiler(report_every=None)
+        # stream ID -> [FrameAnalyzer, next frame number], only touched by the worker thread
+        self.streams = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analysis')
+        self.queue = None
+        self.batcher = None
+
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_frames = 0
+
+    def start(self):
+        """
+        Creates the request queue and starts the batching task on the running event loop.
+        """
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.batcher = asyncio.get_running_loop().create_task(self.run_batches())
+
+    async def stop(self):
+        """
+        Stops the batching task and the worker thread.
+        """
+        if self.batcher is not None:
+            self.batcher.cancel()
+            try:
+                await self.batcher
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown()
+
+    async def analyze(self, stream_id, data, n_frame = None):
+        """
+        Queues one encoded frame and waits for its analysis.
+
+        :param stream_id: ID of the stream the frame belongs to
+        :param data: Encoded image bytes
+        :param n_frame: Frame number for the rows (optional, a per-stream counter if not given)
+        :return: Result dict, see analyze_batch
+        :raises asyncio.QueueFull: When the queue is full
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((stream_id, data, n_frame, time.perf_counter(), future))
+        return await future
+
+    async def run_batches(self):
+        """
+        Forever: waits for a request, collects more for up to max_wait, and analyzes them on the worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.analyze_batch, batch)
+            except Exception as error:
+                results = [error] * len(batch)
+            for (_, _, _, _, future), result in zip(batch, results):
+                if future.done():
+                    continue  # the client went away
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def analyze_batch(self, batch):
+        """
+        Runs on the worker thread. Decodes the frames, runs the detector once on those that need it and analyzes
+        every frame with its stream's analyzer, in arrival order.
+
+        :param batch: List of (stream_id, data, n_frame, arrived, future)
+        :return: List with a result dict (or an exception for frames that couldn't be decoded) per request
+        """
+        started = time.perf_counter()
+        self.batches += 1
+        self.batched_frames += len(batch)
+
+        items = []
+        for stream_id, data, n_frame, arrived, _ in batch:
+            self.metrics.record('queue', started - arrived)
+            with self.metrics.stage('decode'):
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                items.append((stream_id, None, None, False))
+                continue
+
+            state = self.streams.get(stream_id)
+            if state is None:
+                state = self.streams[stream_id] = [self.make_analyzer(self.metrics), 0]
+            if n_frame is None:
+                n_frame = state[1]
+            state[1] = n_frame + 1
+
+            fa = state[0]
+            detected = fa.detection_due() or fa.last_result is None
+            items.append((stream_id, frame, n_frame, detected))
+
+        # one detector call for every frame of the batch that needs it
+        frames = [frame for _, frame, _, detected in items if frame is not None and detected]
+        start = time.perf_counter()
+        detections = iter(self.yolo(frames) if frames else [])
+        if frames:
+            per_frame = (time.perf_counter() - start) / len(frames)
+            for _ in frames:
+                self.metrics.record('yolo', per_frame)
+
+        results = []
+        for stream_id, frame, n_frame, detected in items:
+            if frame is None:
+                results.append(ValueError('Could not decode the frame'))
+                continue
+
+            fa = self.streams[stream_id][0]
+            if detected:
+                fa.last_result = next(detections)
+            rows, _ = fa.analyze(frame, fa.last_result, n_frame, detected=detected)
+            self.metrics.tick()
+
+            estimator = fa.estimator
+            results.append({'stream': stream_id, 'frame': n_frame, 'trajectory': estimator.trajectory,
+                            'left_line': estimator.left_line, 'right_line': estimator.right_line,
+                            'detected': detected, 'batch_size': len(batch),
+                            'objects': [row_to_json(row) for row in rows]})
+        return results
+
+    def reset_stream(self, stream_id):
+        """
+        Forgets the state of a stream. Runs on the worker thread, so it never races a batch.
+
+        :return: True if the stream existed
+        """
+        return self.streams.pop(stream_id, None) is not None
+
+    def summary(self):
+        """
+        :return: dict with the request counters, the mean batch size, the number of streams, the latency
+        percentiles of every stage and, if the streams have line gates, their combined hit rate
+        """
+        summary = {'requests': self.requests, 'rejected': self.rejected, 'failed': self.failed,
+                   'queued': self.queue.qsize() if self.queue is not None else 0,
+                   'batches': self.batches, 'mean_batch_size': self.batched_frames / max(self.batches, 1),
+                   'streams': len(self.streams), 'frames': self.metrics.frames,
+                   'latency': self.metrics.summary()}
+        gates = [fa.line_gate.stats() for fa, _ in list(self.streams.values()) if fa.line_gate is not None]
+        if gates:
+            summary['line_gate'] = merge_stats(gates)
+        return summary
+
+    async def handle(self, method, target, body):
+        """
+        Routes one HTTP request.
+
+        :param method: HTTP method
+        :param target: Request target, path and query
+        :param body: Request body bytes
+        :return: (status, JSON serializable response, extra headers)
+        """
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path == '/analyze':
+            if method != 'POST':
+                return 405, {'error': 'Use POST'}, {}
+            stream_id = query.get('stream', ['default'])[0]
+            n_frame = None
+            if 'frame' in query:
+                n_frame = parse_count(query['frame'][0])
+                if n_frame is None:
+                    return 400, {'error': 'frame must be a non-negative integer'}, {}
+
+            arrived = time.perf_counter()
+            self.requests += 1
+            try:
+                result = await self.analyze(stream_id, body, n_frame)
+            except asyncio.QueueFull:
+                self.rejected += 1
+                return 503, {'error': 'Too many requests queued, retry later'}, {'Retry-After': '1'}
+            except ValueError as error:
+                self.failed += 1
+                return 400, {'error': str(error)}, {}
+            latency = time.perf_counter() - arrived
+            self.metrics.record('request', latency)
+            result['latency_ms'] = latency * 1000
+            return 200, result, {}
+
+        if url.path == '/metrics' and method == 'GET':
+            return 200, self.summary(), {}
+
+        if url.path == '/health' and method == 'GET':
+            return 200, {'status': 'ok'}, {}
+
+        if url.path.startswith('/streams/') and method == 'DELETE':
+            stream_id = url.path[len('/streams/'):]
+            existed = await asyncio.get_running_loop().run_in_executor(self.executor, self.reset_stream, stream_id)
+            return (200, {'reset': stream_id}, {}) if existed else (404, {'error': f'Unknown stream {stream_id}'}, {})
+
+        return 404, {'error': f'Unknown endpoint {method} {url.path}'}, {}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the HTTP requests of one connection until the client closes it or asks to.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Malformed request line'}, {}, close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = parse_count(headers.get('content-length', '0'))
+                if length is None:
+                    await self.respond(writer, 400, {'error': 'Invalid Content-Length'}, {}, close=True)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'Frame too large'}, {}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, response, extra = await self.handle(method.upper(), target, body)
+                except Exception as error:
+                    status, response, extra = 500, {'error': repr(error)}, {}
+                close = headers.get('connection', '').lower() == 'close'
+                await self.respond(writer, status, response, extra, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, response, extra, close = False):
+        """
+        Writes one JSON response.
+        """
+        body = json.dumps(response).encode()
+        head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', 'Content-Type: application/json',
+                f'Content-Length: {len(body)}', f'Connection: {"close" if close else "keep-alive"}']
+        head += [f'{name}: {value}' for name, value in extra.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(service, host = '127.0.0.1', port = 8765, unix_path = None):
+    """
+    Runs the HTTP server until the task is cancelled (e.g. by Ctrl+C) or the process gets SIGTERM.
+
+    :param service: AnalysisService to serve
+    :param host: Address to listen on, localhost by default
+    :param port: TCP port
+    :param unix_path: Listen on this Unix socket instead of TCP (optional)
+    """
+    service.start()
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_path)
+        print(f"Listening on {unix_path}", flush=True)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        print(f"Listening on http://{host}:{port}", flush=True)
+
+    # stop cleanly on SIGTERM too, e.g. from a service manager
+    stopped = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    except NotImplementedError:
+        pass  # not available on Windows
+
+    try:
+        async with server:
+            await stopped.wait()
+    finally:
+        await service.stop()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
@@ -0,0 +1,123 @@
+"""
+A ring buffer smoother for the rail line estimates of the DistanceEstimator.
+
+Values are stored in a preallocated NumPy array. The mean mode keeps a running sum, so a new value costs the same
+no matter how large the window is. The sum is recomputed from the buffer once every `window` pushes so floating point
+error can't build up. The smoother can also follow an exponentially weighted mean or the median of the window.
+Its state can be saved and restored, so a restarted process can start from its previous line estimates instead of
+taking a full window of frames to converge.
+
+Attributes:
+- MODES (tuple): Supported smoothing modes.
+
+Methods:
+- __init__(self, window=10, width=2, mode='mean', alpha=0.3): Initialize the RingSmoother class.
+- push(self, values): Add one set of values, e.g. [intercept, slope].
+- value(self): The smoothed values, None if nothing was pushed yet.
+- get_state(self): JSON serializable state.
+- set_state(self, state): Restore a state from get_state.
+"""
+
+import numpy as np
+
+
+MODES = ('mean', 'ewm', 'median')
+
+
+class RingSmoother:
+
+    def __init__(self, window = 10, width = 2, mode = 'mean', alpha = 0.3):
+        """
+        Initiates the class.
+
+        :param window: Number of previous values to smooth over (mean and median modes)
+        :param width: Number of values pushed at a time, e.g. 2 for [intercept, slope]
+        :param mode: 'mean', 'ewm' (exponentially weighted mean) or 'median'
+        :param alpha: Weight of the newest value in ewm mode
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown smoothing mode: {mode}")
+        self.window = window
+        self.width = width
+        self.mode = mode
+        self.alpha = alpha
+
+        self.buffer = np.zeros((window, width))
+        self.total = np.zeros(width)
+        self.ewm = None
+        self.count = 0      # number of values in the buffer
+        self.position = 0   # where the next value goes
+        self.pushes = 0     # pushes since the running sum was last recomputed
+
+    def __len__(self):
+        return self.count
+
+    def push(self, values):
+        """
+        Adds one set of values, replacing the oldest one once the window is full.
+
+        :param values: Sequence of `width` numbers
+        """
+        values = np.asarray(values, dtype=float)
+
+        if self.count == self.window:
+            self.total -= self.buffer[self.position]
+        else:
+            self.count += 1
+        self.buffer[self.position] = values
+        self.total += values
+        self.position = (self.position + 1) % self.window
+
+        # recompute the running sum every now and then so rounding errors don't accumulate
+        self.pushes += 1
+        if self.pushes >= self.window:
+            self.total = self.buffer[:self.count].sum(axis=0)
+            self.pushes = 0
+
+        self.ewm = values if self.ewm is None else self.alpha * values + (1 - self.alpha) * self.ewm
+
+    def value(self):
+        """
+        :return: Smoothed values as an array of length `width`, None if nothing was pushed yet
+        """
+        if self.count == 0:
+            return None
+        if self.mode == 'ewm':
+            return self.ewm.copy()
+        if self.mode == 'median':
+            return np.median(self.buffer[:self.count], axis=0)
+        return self.total / self.count
+
+    def ordered(self):
+        """
+        :return: (count, width) array of the values in the buffer, oldest first
+        """
+        if self.count < self.window:
+            return self.buffer[:self.count].copy()
+        return np.roll(self.buffer, -self.position, axis=0)
+
+    def get_state(self):
+        """
+        :return: JSON serializable dict with the buffered values and the ewm state
+        """
+        return {'mode': self.mode,
+                'window': self.window,
+                'values': self.ordered().tolist(),
+                'ewm': None if self.ewm is None else self.ewm.tolist()}
+
+    def set_state(self, state):
+        """
+        Restores the values of get_state. The window and mode of this smoother are kept, if the saved window
+        was larger only its newest values are used.
+
+        :param state: dict from get_state
+        """
+        self.buffer[:] = 0
+        self.total[:] = 0
+        self.count = self.position = self.pushes = 0
+        self.ewm = None
+
+        for values in state['values'][-self.window:]:
+            self.push(values)
+        if state.get('ewm') is not None:
+            self.ewm = np.asarray(state['ewm'], dtype=float)
@@ -0,0 +1,224 @@
+"""
+A lightweight object tracker that sits between YOLO and the DistanceEstimator.
+
+Detections are matched to existing tracks by IoU (same class only, greedy from the best overlap down), so every object
+keeps a stable ID across frames. Each track runs two alpha-beta filters: one on its bounding box, so the box can be
+propagated on frames where YOLO is skipped, and one on its distance, which gives a smoothed distance and a closing
+speed (positive when the object gets closer).
+
+Classes:
+- Track: State of one tracked object.
+- ObjectTracker: Associates detections with tracks and ages out lost tracks.
+
+Methods:
+- ObjectTracker.update(self, detections): Match a frame's detections to the tracks, returns the matching tracks.
+- ObjectTracker.predict(self): Propagate every track one frame without detections, returns the tracks that matched a
+  detection the last time YOLO ran.
+- ObjectTracker.update_distance(self, track, distance): Feed a measured distance into the track's filter.
+- box_iou(boxes_a, boxes_b): IoU matrix between two sets of [x1, y1, x2, y2] boxes.
+"""
+
+import math
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Calculates the intersection over union of every pair of boxes.
+
+    :param boxes_a: (N, 4) array of [x1, y1, x2, y2]
+    :param boxes_b: (M, 4) array of [x1, y1, x2, y2]
+    :return: (N, M) array of IoU values
+    """
+    boxes_a = np.asarray(boxes_a, dtype=float).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=float).reshape(-1, 4)
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+
+    def __init__(self, track_id, class_id, object_name, conf, box):
+        """
+        Starts a track from its first detection.
+
+        :param track_id: Unique ID of the track
+        :param class_id: YOLO class ID
+        :param object_name: YOLO class name
+        :param conf: Confidence of the detection
+        :param box: [x1, y1, x2, y2]
+        """
+        self.track_id = track_id
+        self.class_id = class_id
+        self.object_name = object_name
+        self.conf = conf
+
+        self.box = np.asarray(box, dtype=float)
+        self.box_velocity = np.zeros(4)
+
+        # distance filter, None until the first measured distance
+        self.distance = None
+        self.speed = 0.0
+        self.frames_since_distance = 0
+        self.distance_updates = 0
+
+        self.hits = 1
+        self.missed = 0
+
+    @property
+    def closing_speed(self):
+        """
+        How fast the object is getting closer, in distance units per second. None until the speed is known.
+        """
+        if self.distance is None or self.distance_updates < 2:
+            return None
+        return -self.speed
+
+    def predict(self):
+        """
+        Moves the box one frame ahead with its velocity.
+        """
+        self.box = self.box + self.box_velocity
+        self.frames_since_distance += 1
+
+
+class ObjectTracker:
+
+    def __init__(self, iou_threshold = 0.3, max_missed = 5, alpha = 0.5, beta = 0.1, fps = 30.0):
+        """
+        Initiates the tracker.
+
+        :param iou_threshold: Minimum IoU between a track and a detection to match them
+        :param max_missed: Number of frames a track can go without a matching detection before it is dropped
+        :param alpha: Alpha-beta filter position gain (0-1, higher follows measurements more closely)
+        :param beta: Alpha-beta filter velocity gain (0-1, higher reacts faster to speed changes)
+        :param fps: Frame rate of the source, used to turn per-frame changes into speeds
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.alpha = alpha
+        self.beta = beta
+        self.dt = 1.0 / fps
+
+        self.tracks = []
+        self.next_id = 0
+
+    def update(self, detections):
+        """
+        Matches the detections of a frame to the tracks, updates the matched tracks, starts tracks for the
+        unmatched detections and ages the tracks that got no detection.
+
+        :param detections: List of (class_id, object_name, conf, [x1, y1, x2, y2])
+        :return: List with the track of every detection, in the same order as detections
+        """
+        for track in self.tracks:
+            track.predict()
+
+        matches = self.associate(detections)
+
+        assigned = []
+        for d, (class_id, object_name, conf, box) in enumerate(detections):
+            track = matches.get(d)
+            if track is None:
+                track = Track(self.next_id, class_id, object_name, conf, box)
+                self.next_id += 1
+                self.tracks.append(track)
+            else:
+                # alpha-beta update of the box
+                residual = np.asarray(box, dtype=float) - track.box
+                track.box = track.box + self.alpha * residual
+                track.box_velocity = track.box_velocity + self.beta * residual
+                track.conf = conf
+                track.hits += 1
+                track.missed = 0
+            assigned.append(track)
+
+        # age the tracks that didn't get a detection and drop the ones that have been lost too long
+        matched = set(id(track) for track in assigned)
+        for track in self.tracks:
+            if id(track) not in matched:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        return assigned
+
+    def predict(self):
+        """
+        Propagates every track one frame for a frame where YOLO didn't run. Tracks that missed their detection the
+        last time YOLO ran are kept until they are dropped or matched again, but aren't returned, so objects that are
+        already lost aren't reported on the frames in between.
+
+        :return: List of the tracks that matched a detection the last time YOLO ran
+        """
+        for track in self.tracks:
+            track.predict()
+        return [track for track in self.tracks if track.missed == 0]
+
+    def associate(self, detections):
+        """
+        Greedily matches detections to tracks of the same class, best IoU first.
+
+        :param detections: List of (class_id, object_name, conf, [x1, y1, x2, y2])
+        :return: dict of detection index -> Track
+        """
+        if not self.tracks or not detections:
+            return {}
+
+        iou = box_iou([d[3] for d in detections], [t.box for t in self.tracks])
+
+        # only objects of the same class can match
+        det_classes = np.array([d[0] for d in detections])
+        track_classes = np.array([t.class_id for t in self.tracks])
+        iou[det_classes[:, None] != track_classes[None, :]] = 0
+
+        matches = {}
+        used_tracks = set()
+        for flat in np.argsort(-iou, axis=None, kind='stable'):
+            d, t = (int(i) for i in np.unravel_index(flat, iou.shape))
+            if iou[d, t] < self.iou_threshold:
+                break
+            if d in matches or t in used_tracks:
+                continue
+            matches[d] = self.tracks[t]
+            used_tracks.add(t)
+        return matches
+
+    def update_distance(self, track, distance):
+        """
+        Feeds a measured distance into the track's alpha-beta filter. Unknown distances (None/NaN)
+        only advance the prediction.
+
+        :param track: Track the distance belongs to
+        :param distance: Measured distance, or None/NaN if it couldn't be estimated
+        :return: (smoothed distance, closing speed), None for values that aren't known yet
+        """
+        measured = distance is not None and not math.isnan(distance)
+
+        if track.distance is None:
+            if measured:
+                track.distance = float(distance)
+                track.frames_since_distance = 0
+                track.distance_updates = 1
+            return track.distance, None
+
+        dt = self.dt * max(track.frames_since_distance, 1)
+        predicted = track.distance + track.speed * dt
+
+        if measured:
+            residual = float(distance) - predicted
+            track.distance = predicted + self.alpha * residual
+            track.speed = track.speed + self.beta * residual / dt
+            track.distance_updates += 1
+        else:
+            track.distance = predicted
+        track.frames_since_distance = 0
+
+        return track.distance, track.closing_speed
@@ -0,0 +1,394 @@
+"""
+Functions for processing one long video with a pool of worker processes, one frame range (chunk) at a time.
+
+The video is split into equal frame ranges. Every worker loads the object detector once and analyzes whole chunks
+with its own FrameAnalyzer, LineDetector and DistanceEstimator, writing a detection log and an annotated video segment
+per chunk. The rail lines are smoothed over the previous frames, so a chunk can't simply start cold: every chunk but
+the first begins a few frames (the warm-up) before its range and runs the line detection on them without writing
+anything. If both rails haven't filled their smoothing windows by the first frame of the range, e.g. because a rail
+wasn't visible during the warm-up, the warm-up starts over further back, up to a maximum number of frames so a long
+stretch without rails doesn't make every later chunk re-analyze most of the video. A chunk that hits the maximum starts
+with unsettled rails, which is reported. With tracking on, the warm-up frames also go
+through YOLO and the tracker, so the tracks are established as well.
+
+The result is close to a single process run, but not always identical. A single process carries everything it has
+seen so far: a rail line it saw long before the warm-up, the previous frame's clustering centroids and adaptive ROI,
+the exponentially weighted mean (which never forgets its start completely) and the tracks. Near the start of a chunk
+the distances and trajectories can therefore differ slightly from a single process run.
+
+When every chunk is done, the logs and segments are merged in frame order. Segments are joined by ffmpeg without
+re-encoding if it is installed, otherwise they are decoded and written again with OpenCV.
+
+Since the chunks don't share anything, this scales with the number of cores. The cost is the warm-up of every chunk
+and the merge at the end.
+
+Attributes:
+- TRACK_ID_STRIDE (int): Track IDs of chunk k start at k * TRACK_ID_STRIDE, so they are unique in the merged log.
+
+Functions:
+- plan_chunks(n_frames, n_chunks, warmup): Split the frames into chunks with their warm-up start.
+- open_at(video_path, frame): Open a video and position it at a frame.
+- init_worker(backend, weights): Pool initializer, loads the detector of the worker process.
+- build_analyzer(task, fps): The FrameAnalyzer of a chunk.
+- settled(estimator): Whether both rails have full smoothing windows.
+- warm_up(fa, reader, warmup_start, start): Analyze the frames before a chunk without writing them.
+- process_chunk(task): Analyze one chunk in a worker process.
+- merge_videos(parts, path, fps, size): Join video segments in order.
+- run_video_chunks(video_path, log_path, video_output_path, output_format='csv', backend='ultralytics', weights=None,
+  workers=None, chunks=None, warmup=30, warmup_max=300, ...): Analyze a video in parallel chunks and merge the results.
+  With headless=True only the logs are written and merged.
+"""
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import cv2
+from .detection_sink import merge_logs, open_sink
+from .buffer_pool import FramePool
+from .distance_functions import DistanceEstimator
+from .hough_functions import LineDetector
+from .image_batch import load_worker_detector
+from .line_gate import LineGate, gate_report, merge_stats
+from .renderer import FrameRenderer, NULL_RENDERER
+from .run_frame import FrameAnalyzer
+from .tracker import ObjectTracker
+
+
+TRACK_ID_STRIDE = 1_000_000
+
+# state of a worker process, set by init_worker
+_worker = {}
+
+
+def plan_chunks(n_frames, n_chunks, warmup):
+    """
+    Splits the frames of a video into contiguous chunks of about the same length.
+
+    :param n_frames: Number of frames in the video
+    :param n_chunks: Number of chunks, fewer if there aren't enough frames
+    :param warmup: Number of frames analyzed before every chunk (except the first) without writing them
+    :return: List of (start, stop, warmup_start) frame numbers, stop is None for the last chunk so it reads
+    to the end even if the frame count of the container is off
+    """
+    n_chunks = max(1, min(n_chunks, n_frames))
+    bounds = [round(i * n_frames / n_chunks) for i in range(n_chunks + 1)]
+    return [(start, stop if i < n_chunks - 1 else None, max(0, start - warmup))
+            for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+def open_at(video_path, frame):
+    """
+    Opens a video positioned at the given frame. If the backend can't seek there exactly, the frames before it
+    are decoded and skipped instead.
+
+    :param video_path: Path of the video
+    :param frame: Number of the first frame to read
+    :return: cv2.VideoCapture
+    """
+    cap = cv2.VideoCapture(video_path)
+    if frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != frame:
+            cap.release()
+            cap = cv2.VideoCapture(video_path)
+            for _ in range(frame):
+                if not cap.grab():
+                    break
+    return cap
+
+
+def init_worker(backend, weights):
+    """
+    Pool initializer, loads the object detector once per worker process.
+
+    :param backend: Detector backend name, see detectors.load_detector
+    :param weights: Model file of the backend (optional)
+    """
+    _worker['yolo'] = load_worker_detector(backend, weights)
+
+
+def build_analyzer(task, fps):
+    """
+    Builds the FrameAnalyzer of a chunk with its own line detector, estimator, tracker and line gate.
+
+    :param task: dict of the chunk, see process_chunk
+    :param fps: Frame rate of the video
+    :return: (FrameAnalyzer, FrameRenderer or NULL_RENDERER of the chunk's frames)
+    """
+    detector = LineDetector(adaptive_roi=task['adaptive_roi'], process_scale=task['line_scale'],
+                            reuse_buffers=task['reuse_buffers'])
+    estimator = DistanceEstimator(smoothing=task['smoothing'])
+    if task['load_state'] and os.path.exists(task['load_state']):
+        estimator.load_state(task['load_state'])  # Warm start the first chunk from a previous run
+    tracker = None
+    if task['track']:
+        tracker = ObjectTracker(fps=fps)
+        tracker.next_id = task['index'] * TRACK_ID_STRIDE
+    renderer = NULL_RENDERER if task['headless'] else FrameRenderer(task['render_every'], task['render_detections'])
+    line_gate = None
+    if task['line_gate'] is not None:
+        line_gate = LineGate(detector, threshold=task['line_gate'], max_reuse=task['line_gate_max_reuse'])
+    fa = FrameAnalyzer(_worker['yolo'], detector, estimator, tracker=tracker, detect_every=task['detect_every'],
+                       renderer=renderer, line_gate=line_gate)
+    return fa, renderer
+
+
+def settled(estimator):
+    """
+    :param estimator: DistanceEstimator
+    :return: True once both rails are known and their smoothing windows are full, so the estimator no longer
+    depends on how far back the analysis started (exactly in the mean and median modes, roughly in the ewm mode)
+    """
+    left, right = estimator.left_smoother, estimator.right_smoother
+    return len(left) == left.window and len(right) == right.window
+
+
+def warm_up(fa, reader, warmup_start, start):
+    """
+    Analyzes the frames before a chunk without writing or drawing anything. Only the line detection runs, unless the
+    tracker needs the detections too.
+
+    :param fa: FrameAnalyzer of the chunk
+    :param reader: Capture positioned at warmup_start
+    :param warmup_start: Number of the first warm-up frame
+    :param start: Number of the chunk's first frame
+    :return: None
+    """
+    fa.frames_seen = warmup_start
+    for _ in range(start - warmup_start):
+        success, frame = reader.read()
+        if not success:
+            break
+        if fa.tracker is None:
+            lines = fa.detect_lines(frame)
+            if not fa.lines_reused:
+                fa.estimator.analyze_lines(*lines)
+        else:
+            fa.run_frame(frame)
+    fa.frames_seen = start  # Keep YOLO on the same frames as a single process with --detect-every
+
+
+def process_chunk(task):
+    """
+    Analyzes one chunk in a worker process: the warm-up frames first, then the frames of the chunk, which are written
+    to the chunk's detection log and video segment.
+
+    The warm-up starts task['warmup_start'] frames early. If the rails aren't settled by the chunk's first frame (see
+    settled), e.g. because they weren't visible during the warm-up, it starts over twice as far back, up to the start
+    of the video or task['warmup_max'] frames before the chunk. At that limit the chunk goes on with unsettled rails.
+
+    :param task: dict with the video path, the chunk index, start, stop and warm-up start, the part paths and the
+    options of the analysis (see run_video_chunks)
+    :return: (chunk index, number of frames written, seconds taken, line gate stats or None, frames warmed up,
+    False if the warm-up limit left the rails unsettled)
+    """
+    start_time = time.perf_counter()
+    start, stop = task['start'], task['stop']
+    warmup_start = task['warmup_start']
+    warmup_max = max(task['warmup_max'], start - warmup_start)
+    while True:
+        cap = open_at(task['video'], warmup_start)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        reader = FramePool(cap, task['batch_size']) if task['reuse_buffers'] else cap
+
+        # Every attempt starts from a fresh analyzer, nothing is drawn during the warm-up
+        fa, renderer = build_analyzer(task, fps)
+        fa.renderer = NULL_RENDERER
+        warm_up(fa, reader, warmup_start, start)
+        fa.renderer = renderer
+        # From the start of the video the chunk has the same history as a single process, settled or not
+        rails_settled = warmup_start == 0 or settled(fa.estimator)
+        if rails_settled or start - warmup_start >= warmup_max:
+            break
+        cap.release()
+        warmup_start = max(0, start - min(2 * max(start - warmup_start, 1), warmup_max))
+    estimator, line_gate = fa.estimator, fa.line_gate
+
+    sink = open_sink(task['format'], task['log'], flush_frames=task['flush_frames'],
+                     flush_seconds=task['flush_seconds'])
+    out = None
+    if not task['headless']:
+        out = cv2.VideoWriter(task['segment'], cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'),
+                              fps / task['render_every'], size)
+
+    frame_idx = start
+    try:
+        while stop is None or frame_idx < stop:
+            # Read up to batch_size frames, without going past the end of the chunk
+            batch = []
+            while len(batch) < task['batch_size'] and (stop is None or frame_idx + len(batch) < stop):
+                success, frame = reader.read()
+                if not success:
+                    break
+                batch.append(frame)
+
+            if not batch:
+                break
+
+            for analyzed_frame in fa.run_batch(batch, first_frame=frame_idx, sink=sink):
+                if analyzed_frame is not None:
+                    out.write(analyzed_frame)
+            frame_idx += len(batch)
+    finally:
+        sink.close()
+        if out is not None:
+            out.release()
+        cap.release()
+        if task['save_state']:
+            estimator.save_state(task['save_state'])  # The last chunk keeps the rail lines for the next run
+
+    gate_stats = line_gate.stats() if line_gate is not None else None
+    return (task['index'], frame_idx - start, time.perf_counter() - start_time, gate_stats, start - warmup_start,
+            rails_settled)
+
+
+def merge_videos(parts, path, fps, size):
+    """
+    Joins video segments in order. ffmpeg copies the encoded frames if it is installed, otherwise every frame is
+    decoded and written again.
+
+    :param parts: Paths of the segments, in order
+    :param path: Path of the merged video
+    :param fps: Frame rate of the merged video
+    :param size: (width, height) of the frames
+    :return: None
+    """
+    if shutil.which('ffmpeg'):
+        list_path = f'{path}.parts.txt'
+        with open(list_path, 'w') as file:
+            file.writelines(f"file '{os.path.abspath(part)}'\n" for part in parts)
+        try:
+            result = subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                     '-i', list_path, '-c', 'copy', path])
+        finally:
+            os.remove(list_path)
+        if result.returncode == 0:
+            return
+
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), fps, size)
+    for part in parts:
+        cap = cv2.VideoCapture(part)
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            out.write(frame)
+        cap.release()
+    out.release()
+
+
+def run_video_chunks(video_path, log_path, video_output_path, output_format = 'csv', backend = 'ultralytics',
+                     weights = None, workers = None, chunks = None, warmup = 30, warmup_max = 300, batch_size = 1,
+                     track = False,
+                     detect_every = 1, adaptive_roi = False, line_scale = 1.0, smoothing = 'mean', line_state = None,
+                     flush_frames = 30, flush_seconds = 1.0, headless = False, render_every = 1,
+                     render_detections = False, line_gate = None, line_gate_max_reuse = 5, reuse_buffers = False):
+    """
+    Analyzes a video in chunks with a pool of worker processes and merges the logs and segments in frame order.
+
+    :param video_path: Path of the input video
+    :param log_path: CSV file or columnar log directory of the merged detection log
+    :param video_output_path: Path of the merged annotated video
+    :param output_format: Detection log format, 'csv' or 'columnar'
+    :param backend: Detector backend name, see detectors.load_detector
+    :param weights: Model file of the backend (optional)
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param chunks: Number of chunks, defaults to the number of workers
+    :param warmup: Frames analyzed before every chunk to settle the rail line smoothing, more if the rails haven't
+    settled by then
+    :param warmup_max: Maximum frames analyzed before a chunk, a chunk whose rails haven't settled by then starts with
+    unsettled rails
+    :param batch_size: Frames sent through YOLO in one call (at least 1)
+    :param track: Track objects, track IDs are unique per chunk (see TRACK_ID_STRIDE)
+    :param detect_every: Only run YOLO on every Nth frame
+    :param adaptive_roi: Search for the rails in bands around the previous lines
+    :param line_scale: Processing scale of the line detection
+    :param smoothing: Rail line smoothing, 'mean', 'ewm' or 'median'
+    :param line_state: JSON file the first chunk warm starts from and the last chunk saves the rail lines to
+    :param flush_frames: Frames of detections buffered before a chunk's log is written
+    :param flush_seconds: Seconds detections stay buffered before a chunk's log is written
+    :param headless: Only write the detection log, no annotated video
+    :param render_every: Only draw and encode every Nth frame (at least 1), the video plays at the source frame rate / N
+    :param render_detections: Only draw and encode frames with detected objects
+    :param line_gate: Reuse the rail lines on frames whose ROI differs less than this from the last detected one
+    (optional, see LineGate)
+    :param line_gate_max_reuse: Maximum frames in a row that reuse the rail lines
+    :param reuse_buffers: Read into a frame pool and reuse the line detection's intermediate images
+    :return: dict with the number of frames, chunks and workers, the seconds taken and the number of chunks that
+    started with unsettled rails
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, not {batch_size}")
+    if render_every < 1:
+        raise ValueError(f"render_every must be at least 1, not {render_every}")
+    cap = cv2.VideoCapture(video_path)
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+    if n_frames <= 0:
+        raise ValueError(f"Can't split {video_path} into chunks, its frame count is unknown")
+
+    workers = workers or os.cpu_count()
+    plan = plan_chunks(n_frames, chunks or workers, warmup)
+    extension = '.csv' if output_format == 'csv' else ''
+    part_dir = tempfile.mkdtemp(prefix='chunks_', dir=os.path.dirname(os.path.abspath(video_output_path)))
+
+    tasks = []
+    for index, (start, stop, warmup_start) in enumerate(plan):
+        tasks.append({'video': video_path, 'index': index, 'start': start, 'stop': stop,
+                      'warmup_start': warmup_start, 'warmup_max': warmup_max,
+                      'log': os.path.join(part_dir, f'part_{index:04d}{extension}'),
+                      'segment': os.path.join(part_dir, f'part_{index:04d}.avi'),
+                      'format': output_format, 'flush_frames': flush_frames, 'flush_seconds': flush_seconds,
+                      'batch_size': batch_size, 'track': track, 'detect_every': detect_every,
+                      'adaptive_roi': adaptive_roi, 'line_scale': line_scale, 'smoothing': smoothing,
+                      'load_state': line_state if index == 0 else None,
+                      'save_state': line_state if index == len(plan) - 1 else None,
+                      'headless': headless, 'render_every': render_every, 'render_detections': render_detections,
+                      'line_gate': line_gate, 'line_gate_max_reuse': line_gate_max_reuse,
+                      'reuse_buffers': reuse_buffers})
+    print(f"Splitting {n_frames} frames into {len(tasks)} chunks over {min(workers, len(tasks))} workers, "
+          f"{warmup} warm-up frames per chunk")
+
+    start_time = time.perf_counter()
+    frames = 0
+    gate_stats = []
+    unsettled = 0
+    try:
+        # spawn instead of fork, so workers never inherit threads or model state from the main process
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(min(workers, len(tasks)), initializer=init_worker, initargs=(backend, weights)) as pool:
+            for result in pool.imap_unordered(process_chunk, tasks):
+                index, chunk_frames, seconds, chunk_gate_stats, warmed_up, rails_settled = result
+                frames += chunk_frames
+                if chunk_gate_stats is not None:
+                    gate_stats.append(chunk_gate_stats)
+                extended = f", warm-up extended to {warmed_up} frames" if warmed_up > warmup else ""
+                if not rails_settled:
+                    unsettled += 1
+                    extended += f", rails not settled after {warmed_up} warm-up frames"
+                print(f"Chunk {index + 1}/{len(tasks)}: {chunk_frames} frames in {seconds:.2f}s "
+                      f"({chunk_frames / max(seconds, 1e-9):.2f} FPS){extended}", flush=True)
+        analyzed = time.perf_counter() - start_time
+
+        # Merge the chunks in frame order
+        merge_logs(output_format, [task['log'] for task in tasks], log_path)
+        if not headless:
+            merge_videos([task['segment'] for task in tasks], video_output_path, fps / render_every, size)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {frames} frames in {elapsed:.2f}s ({frames / max(elapsed, 1e-9):.2f} FPS), "
+          f"merging took {elapsed - analyzed:.2f}s")
+    if gate_stats:
+        print(gate_report(merge_stats(gate_stats)))
+    if unsettled:
+        print(f"{unsettled} chunks started with unsettled rails, raise --chunk-warmup-max to warm them up further")
+    return {'frames': frames, 'chunks': len(tasks), 'workers': min(workers, len(tasks)), 'seconds': elapsed,
+            'unsettled_chunks': unsettled}
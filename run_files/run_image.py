@@ -6,62 +6,192 @@ Description: This script provides a comprehensive pipeline for detecting objects
 
 Requirements:
 - OpenCV: For image processing and manipulation.
-- Ultralytics YOLO: For object detection tasks.
+- Ultralytics YOLO or ONNX Runtime: For object detection tasks.
 - Custom Modules:
   - distance_functions: Contains the DistanceEstimator class for estimating distances to detected objects.
   - hough_functions: Contains the LineDetector class for line detection using Hough Transform.
   - run_frame: Contains the FrameAnalyzer class that integrates object detection, line detection, and distance estimation.
 
 Usage:
-The script accepts an image file path as an input argument.
+The script accepts an image file path as an input argument. To process many images without paying for the imports and
+the model load every time, pass a file with one image path per line to --image-list, or '-' to read paths from stdin
+as they arrive. The model stays loaded for the whole list, and each image gets its own output files named after it.
+For large archives, --batch takes directories or glob patterns and analyzes the images with a pool of worker processes
+that each load the model once (see functions/image_batch.py).
 
 Command Line Arguments:
 - --image, -i: Path to the input image file. Default is 'inputs/straight_object.png'.
+- --profile, --profile-stats, --detector, --weights: Defined in functions/arguments.py, shared with the other scripts.
+- --image-list: File with one image path per line, or '-' for stdin. Replaces --image.
+- --startup-time: Print how long the imports, the model load, the first image and the remaining images took.
+- --batch: Directories (searched recursively) or glob patterns of images to analyze with a process pool.
+- --workers: Number of worker processes in batch mode. Default is the number of CPUs.
+- --output-dir: Output directory of batch mode. Default is 'output/batch'. Images inside it are never analyzed, even if
+  it is inside one of the --batch directories.
+- --resume: In batch mode, skip the images that a previous run already finished and append to its log.
+- --no-images: In batch mode, only write the detection log, no processed images.
 
 Output:
 - A CSV file ('output/csvs/image_objects.csv') containing details of the detected objects.
-- A processed image ('output/videos_images/processed_image.jpg') showing the detected objects and lines.
+- A processed image ('output/processed_image.jpg') showing the detected objects and lines.
+- With --image-list, 'output/csvs/<name>_objects.csv' and 'output/<name>_processed.jpg' for every image. The name
+  is derived from the image's path like in batch mode, e.g. 'cam1__001' for cam1/001.jpg.
+- With --batch, one merged log ('<output dir>/image_objects.csv') with the image path in its first column, a processed
+  image per image in '<output dir>/images', and the progress used by --resume in '<output dir>/done.txt'.
 
 """
 
 
-# Import necessary modules
+# Import necessary modules, timed for --startup-time. The heavy ones (torch, sklearn, pandas) are only imported
+# by the code paths that need them
+import time
+IMPORT_START = time.perf_counter()
+
 import cv2
 import argparse
+import os
+import sys
+from functions.arguments import add_profile_arguments, add_detector_arguments
+from functions.detection_sink import CsvSink
+from functions.detectors import load_detector
 from functions.distance_functions import DistanceEstimator
 from functions.hough_functions import LineDetector
+from functions.image_batch import output_names, run_image_batch
+from functions.profiler import StageProfiler
 from functions.run_frame import FrameAnalyzer
-from ultralytics import YOLO
-
-def main(image_path):
-    # Build YOLO, detector, and estimator
-    yolo_model = YOLO('models/yolov8n.pt')
-    detector = LineDetector()
-    estimator = DistanceEstimator()
-    fa = FrameAnalyzer(yolo_model, detector, estimator)
 
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+
+def read_image_paths(image_list):
+    """
+    Yields image paths from a file with one path per line, or from stdin as they arrive if image_list is '-'.
+    Blank lines and lines starting with # are skipped.
+    """
+    file = sys.stdin if image_list == '-' else open(image_list)
+    try:
+        for line in file:
+            path = line.strip()
+            if path and not path.startswith('#'):
+                yield path
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+def image_list_names(image_list):
+    """
+    Yields every path of an image list with the name of its output files, see image_batch.output_names, so images
+    with the same file name in different folders don't overwrite each other's outputs. A list file is named as a
+    whole, like batch mode. Paths from stdin are named as they arrive, relative to the working directory, and keep
+    their extension in the name if an earlier image already took it.
+    """
+    if image_list != '-':
+        paths = list(read_image_paths(image_list))
+        names = output_names(paths)
+        for path in paths:
+            yield path, names[path]
+        return
+
+    names, used = {}, set()
+    for path in read_image_paths(image_list):
+        if path not in names:
+            name = output_names([path], root=os.getcwd())[path]
+            if name in used:
+                name = f'{name}_{os.path.splitext(path)[1][1:]}'
+            names[path] = name
+            used.add(name)
+        yield path, names[path]
+
+def process_image(yolo_model, image_path, csv_file_name, image_output_path, profiler=None):
+    """
+    Runs the frame analyzer on one image and writes its CSV and processed image.
+    Every image gets a fresh LineDetector and DistanceEstimator, so the rail lines of one image never leak into
+    the next. Only the object detector is shared.
+
+    :return: True if the image was processed, False if it couldn't be read
+    """
     # Load the image
     image = cv2.imread(image_path)
+    if image is None:
+        print(f"Error: Unable to read image {image_path}")
+        return False
 
-    # Establish output file paths
-    csv_file_name = 'output/csvs/image_objects.csv'
-    image_output_path = 'output/processed_image.jpg'
+    fa = FrameAnalyzer(yolo_model, LineDetector(), DistanceEstimator(), profiler=profiler)
 
     # Run the frame analyzer on the image
-    analyzed_image = fa.run_frame(image, csv_file_name)
+    with CsvSink(csv_file_name) as sink:
+        analyzed_image = fa.run_frame(image, sink=sink)
 
     # Write the altered image to the output path
     cv2.imwrite(image_output_path, analyzed_image)
+    return True
+
+def main(args):
+    """
+    Analyzes the image, image list or batch with the options of the command line.
+
+    :param args: Parsed command line arguments, see the module docstring
+    """
+    if args.batch:
+        # Every worker process loads its own model, nothing is loaded here
+        run_image_batch(args.batch, args.output_dir, backend=args.detector, weights=args.weights,
+                        workers=args.workers, resume=args.resume, save_images=not args.no_images)
+        return
+
+    # Build the object detector, the line detector and estimator are built per image
+    load_start = time.perf_counter()
+    yolo_model = load_detector(args.detector, args.weights)
+    load_seconds = time.perf_counter() - load_start
+    profiler = StageProfiler(stats_path=args.profile_stats) if args.profile or args.profile_stats else None
+
+    image_seconds = []
+    if args.image_list is None:
+        # Establish output file paths
+        csv_file_name = 'output/csvs/image_objects.csv'
+        image_output_path = 'output/processed_image.jpg'
+
+        start = time.perf_counter()
+        process_image(yolo_model, args.image, csv_file_name, image_output_path, profiler)
+        image_seconds.append(time.perf_counter() - start)
+    else:
+        # Warm mode, the model stays loaded and every image gets output files named after it
+        for path, name in image_list_names(args.image_list):
+            image_output_path = f'output/{name}_processed.jpg'
+            start = time.perf_counter()
+            if process_image(yolo_model, path, f'output/csvs/{name}_objects.csv', image_output_path, profiler):
+                image_seconds.append(time.perf_counter() - start)
+                print(f"{path} -> {image_output_path}", flush=True)
+
+    if profiler is not None:
+        profiler.close()  # Report the per-stage latencies
+
+    if args.startup_time:
+        print(f"Imports: {IMPORT_SECONDS * 1000:.0f} ms, model load: {load_seconds * 1000:.0f} ms")
+        if image_seconds:
+            print(f"First image: {image_seconds[0] * 1000:.0f} ms")
+        if len(image_seconds) > 1:
+            rest = image_seconds[1:]
+            print(f"Remaining {len(rest)} images: {1000 * sum(rest) / len(rest):.1f} ms per image")
 
 if __name__ == '__main__':
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description='Detect objects in an image and save results to a CSV file.')
     parser.add_argument('--image', '-i', type=str, default='inputs/straight_object.png',
                         help='Path to the input image file')
+    add_profile_arguments(parser)
+    add_detector_arguments(parser)
+    parser.add_argument('--image-list', type=str, default=None,
+                        help="File with one image path per line, or '-' for stdin, processed with one loaded model")
+    parser.add_argument('--startup-time', action='store_true', help='Print import, model load and per-image times')
+    parser.add_argument('--batch', nargs='+', default=None,
+                        help='Directories or glob patterns of images to analyze with a process pool')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes in batch mode')
+    parser.add_argument('--output-dir', type=str, default='output/batch', help='Output directory of batch mode')
+    parser.add_argument('--resume', action='store_true', help='Skip images a previous batch run already finished')
+    parser.add_argument('--no-images', action='store_true', help='Only write the detection log in batch mode')
     args = parser.parse_args()
 
-    # Call the main function with the specified image path
-    main(args.image)
+    # Call the main function with the parsed arguments
+    main(args)
 
 
 
@@ -5,7 +5,7 @@ Description: This script implements a real-time video processing pipeline to det
 
 Requirements:
 - OpenCV: For capturing and processing video frames from a live camera feed.
-- Ultralytics YOLO: For real-time object detection.
+- Ultralytics YOLO or ONNX Runtime: For real-time object detection.
 - Custom Modules:
   - distance_functions: Contains the DistanceEstimator class for estimating distances to detected objects.
   - hough_functions: Contains the LineDetector class for line detection using Hough Transform.
@@ -14,28 +14,66 @@ Requirements:
 Usage:
 The script continuously captures video frames from the default or specified camera, processes each frame to detect objects, estimate their distances, and detect lines, and displays the processed video in real time. The results are optionally saved in a CSV file and an output video file.
 
+Command Line Arguments:
+- --flush-frames, --flush-seconds, --format, --track, --detect-every, --adaptive-roi, --line-scale, --smoothing,
+  --line-gate, --line-gate-max-reuse, --profile, --profile-stats, --detector, --weights: Defined in
+  functions/arguments.py, shared with the other scripts.
+- --pipeline: Run capture, detect, lines, annotate and encode as a threaded pipeline and print per-stage stats on exit.
+- --queue-size: Maximum number of frames waiting between two pipeline stages. Default is 2 to keep latency low.
+- --parallel-lines: Detect rail lines on a worker thread while YOLO runs on the same frame, so the per-frame latency is
+  the slower of the two instead of their sum.
+- --low-latency: A capture thread keeps only the freshest frame. Stale frames are dropped and counted, and
+  capture-to-display latency percentiles are printed on exit. Takes precedence over --pipeline.
+- --target-latency-ms / --target-fps: In low latency mode, skip YOLO (reusing the previous boxes, or propagating the
+  tracks with --track) on frames that would miss this budget. The rail lines and distances are still updated on those
+  frames.
+- --max-skip: Maximum number of frames in a row that can skip YOLO. Default is 3.
+- --reuse-buffers: Read the frames into preallocated buffers (three in turn with --low-latency) and let the line
+  detection write into the same intermediate images every frame, instead of allocating new arrays per frame.
+  Ignored with --pipeline.
+- --line-state: JSON file the smoothed rail lines are restored from at start (if it exists) and saved to at exit, so
+  a restarted run doesn't need a window of frames to converge again.
+- --record-events: Keep the last seconds of raw frames in memory and save a clip around every moment a relevant
+  object (person, vehicle, animal) is closer than --event-distance, see functions/event_recorder.py.
+- --event-distance: Distance below which an event is recorded, in the units of the Distance column. Default is 25.
+- --pre-event-seconds: Seconds of frames saved from before an event. Default is 5.
+- --post-event-seconds: Seconds of frames saved after the last close object of an event. Default is 5.
+
 Output:
 - A CSV file ('output/csvs/live_video_objects.csv') containing details of the detected objects for each frame.
+  With --format columnar this is a columnar log directory ('output/logs/live_video_objects') instead, read it with
+  functions.detection_sink.ColumnarLog.
 - An output video ('output/videos_images/output_live_video.avi') showing the detected objects and lines for each frame (optional).
+- With --record-events, a clip and a CSV of its detections per event ('output/events/live_<first frame>.avi/.csv').
 
 Controls:
 - Press 'q' to quit the live video feed and close the application.
 """
 
 import cv2
-import csv
+import os
+import time
+import argparse
+from functions.arguments import add_log_arguments, add_analysis_arguments, add_profile_arguments, add_detector_arguments
+from functions.detection_sink import open_sink
+from functions.buffer_pool import FramePool
+from functions.detectors import load_detector
+from functions.event_recorder import EventRecorder
 from functions.distance_functions import DistanceEstimator
 from functions.hough_functions import LineDetector
+from functions.line_gate import LineGate
+from functions.profiler import StageProfiler
+from functions.live_capture import DetectionScheduler, LatestFrameCapture, latency_summary
+from functions.pipeline import FramePipeline
 from functions.run_frame import FrameAnalyzer
-from ultralytics import YOLO
+from functions.tracker import ObjectTracker
 
-def main():
-    # Build YOLO, detector, and estimator
-    yolo_model = YOLO('models/yolov8n.pt')
-    detector = LineDetector()
-    estimator = DistanceEstimator()
-    fa = FrameAnalyzer(yolo_model, detector, estimator)
+def main(args):
+    """
+    Analyzes the camera feed with the options of the command line.
 
+    :param args: Parsed command line arguments, see the module docstring
+    """
     # Open camera device (default camera or specify a camera index)
     cap = cv2.VideoCapture(0)  # Use 0 for default camera
 
@@ -43,11 +81,34 @@ def main():
         print("Error: Unable to open camera")
         return
 
-    # Define output CSV file
-    csv_file_name = "output/csvs/live_video_objects.csv"
-    with open(csv_file_name, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Frame', 'Class ID', 'Object Name', 'Confidence', 'X1', 'Y1', 'X2', 'Y2', 'Distance'])
+    # Build the object detector, line detector, estimator and (optionally) tracker
+    yolo_model = load_detector(args.detector, args.weights)
+    detector = LineDetector(adaptive_roi=args.adaptive_roi, process_scale=args.line_scale,
+                            reuse_buffers=args.reuse_buffers)
+    estimator = DistanceEstimator(smoothing=args.smoothing)
+    if args.line_state and os.path.exists(args.line_state):
+        estimator.load_state(args.line_state)  # Warm start the rail lines from a previous run
+    tracker = ObjectTracker(fps=cap.get(cv2.CAP_PROP_FPS) or 30) if args.track else None
+    profiler = StageProfiler(stats_path=args.profile_stats) if args.profile or args.profile_stats else None
+    gate = None
+    if args.line_gate is not None:
+        gate = LineGate(detector, threshold=args.line_gate, max_reuse=args.line_gate_max_reuse)
+    # Keep recent raw frames in memory and only save clips around close objects, the disk is written on a thread
+    recorder = None
+    if args.record_events:
+        recorder = EventRecorder(cap.get(cv2.CAP_PROP_FPS) or 30, pre_seconds=args.pre_event_seconds,
+                                 post_seconds=args.post_event_seconds, threshold=args.event_distance, prefix='live')
+    fa = FrameAnalyzer(yolo_model, detector, estimator, parallel_lines=args.parallel_lines,
+                       tracker=tracker, detect_every=args.detect_every, profiler=profiler, recorder=recorder,
+                       line_gate=gate)
+
+    # Define output detection log, kept open for the whole stream
+    if args.format == 'csv':
+        output_path = "output/csvs/live_video_objects.csv"
+    else:
+        output_path = "output/logs/live_video_objects"
+    sink = open_sink(args.format, output_path, flush_frames=args.flush_frames,
+                     flush_seconds=args.flush_seconds)
 
     # Set up a video writer for output (optional)
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -55,30 +116,99 @@ def main():
   #  out = cv2.VideoWriter('output/output_live_video.avi', cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30, (frame_width, frame_height))
 
     frame_idx = 0  # Frame index
-
-    # Process each frame from the camera feed
-    while True:
-        ret, frame = cap.read()  # Read a frame from the camera
-
-        if not ret:
-            print("Error: Failed to capture frame from camera")
-            break
-
-        # Analyze the frame using FrameAnalyzer
-        analyzed_frame = fa.run_frame(frame, csv_file_name, frame_idx)
-
-        # Display the analyzed frame (optional)
-        cv2.imshow('Live Video Feed', analyzed_frame)
-
-        # Write the analyzed frame to the output video (optional)
- #       if out is not None:
- #           out.write(analyzed_frame)
-
-        # Break the loop if 'q' is pressed
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-        frame_idx += 1  # Increment frame index
+    capture = None
+
+    try:
+        if args.low_latency:
+            # Capture on a separate thread that only keeps the freshest frame
+            capture = LatestFrameCapture(cap, reuse_buffers=args.reuse_buffers)
+            target_latency = args.target_latency_ms / 1000 if args.target_latency_ms else None
+            scheduler = DetectionScheduler(target_latency=target_latency, target_fps=args.target_fps,
+                                           max_skip=args.max_skip)
+            latencies = []
+            capture.start()
+
+            while True:
+                ret, frame, captured = capture.read()  # Wait for a frame newer than the last one
+
+                if not ret:
+                    print("Error: Failed to capture frame from camera")
+                    break
+
+                # Skip YOLO if this frame would miss the target latency, the rail lines are always updated
+                start = time.perf_counter()
+                detect = scheduler.should_detect(start - captured)
+                analyzed_frame = fa.run_frame(frame, n_frame=frame_idx, sink=sink, detect=detect)
+                scheduler.record(detect, time.perf_counter() - start)
+
+                cv2.imshow('Live Video Feed', analyzed_frame)
+                latencies.append(time.perf_counter() - captured)
+
+                # Break the loop if 'q' is pressed
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+                frame_idx += 1  # Increment frame index
+
+            capture.stop()  # Stop reading before the counters are reported
+            print(f"Processed {frame_idx} frames, dropped {capture.frames_dropped} stale frames, "
+                  f"skipped YOLO on {scheduler.frames_skipped} frames")
+            print(f"Capture-to-display latency: {latency_summary(latencies)}")
+
+        elif args.pipeline:
+            # Run capture, detect, lines, annotate and encode as overlapping threads
+            frame_pipeline = FramePipeline(fa, cap.read, sink=sink, queue_size=args.queue_size)
+            for item in frame_pipeline.run():
+                # Display the analyzed frame, this has to happen on the main thread
+                cv2.imshow('Live Video Feed', item['frame'])
+
+                # Stop capturing if 'q' is pressed, the frames already in flight are still written
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    frame_pipeline.stop()
+            print(frame_pipeline.report())
+
+        else:
+            # Read into a preallocated frame, it is shown before it is read into again
+            reader = FramePool(cap, 1) if args.reuse_buffers else cap
+
+            # Process each frame from the camera feed
+            while True:
+                ret, frame = reader.read()  # Read a frame from the camera
+
+                if not ret:
+                    print("Error: Failed to capture frame from camera")
+                    break
+
+                # Analyze the frame using FrameAnalyzer
+                analyzed_frame = fa.run_frame(frame, n_frame=frame_idx, sink=sink)
+
+                # Display the analyzed frame (optional)
+                cv2.imshow('Live Video Feed', analyzed_frame)
+
+                # Write the analyzed frame to the output video (optional)
+                #if out is not None:
+                #    out.write(analyzed_frame)
+
+                # Break the loop if 'q' is pressed
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+                frame_idx += 1  # Increment frame index
+    finally:
+        if capture is not None:
+            capture.stop()  # Wait for the capture thread to exit, also on errors, before the camera is released
+        sink.close()  # Write any buffered rows and close the detection log, also on 'q'
+        fa.close()  # Stop the line detection worker thread
+        if gate is not None:
+            print(gate.report())
+        if recorder is not None:
+            recorder.close()  # Finish writing the event clips
+            print(recorder.report())
+        if profiler is not None:
+            profiler.close()  # Report the final per-stage latencies
+        if args.line_state:
+            # Last, so a failing save can't keep the outputs above from being closed
+            estimator.save_state(args.line_state)  # Keep the rail lines for the next run
 
     # Clean up
     cap.release()  # Release the camera
@@ -87,4 +217,33 @@ def main():
     cv2.destroyAllWindows()  # Close any open windows
 
 if __name__ == '__main__':
-    main()
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Detect objects in a live camera feed and save results to a CSV file.')
+    add_log_arguments(parser)
+    add_analysis_arguments(parser)
+    add_profile_arguments(parser)
+    add_detector_arguments(parser)
+    parser.add_argument('--pipeline', action='store_true', help='Run the stages as a threaded pipeline')
+    parser.add_argument('--queue-size', type=int, default=2, help='Frames that can wait between two pipeline stages')
+    parser.add_argument('--parallel-lines', action='store_true',
+                        help='Detect rail lines on a worker thread while YOLO runs on the same frame')
+    parser.add_argument('--low-latency', action='store_true',
+                        help='Always process the freshest frame, dropping stale ones, and report latency percentiles')
+    parser.add_argument('--target-latency-ms', type=float, default=None,
+                        help='Skip YOLO on frames that would exceed this capture-to-display latency (low latency mode)')
+    parser.add_argument('--target-fps', type=float, default=None,
+                        help='Skip YOLO on frames that would fall behind this frame rate (low latency mode)')
+    parser.add_argument('--max-skip', type=int, default=3, help='Maximum frames in a row that can skip YOLO')
+    parser.add_argument('--reuse-buffers', action='store_true',
+                        help='Read frames into preallocated buffers and reuse the line detection images')
+    parser.add_argument('--line-state', type=str, default=None,
+                        help='JSON file to warm start the rail lines from and save them to on exit')
+    parser.add_argument('--record-events', action='store_true',
+                        help='Save clips of the frames around relevant objects closer than --event-distance')
+    parser.add_argument('--event-distance', type=float, default=25.0, help='Distance that triggers an event clip')
+    parser.add_argument('--pre-event-seconds', type=float, default=5.0, help='Seconds saved from before an event')
+    parser.add_argument('--post-event-seconds', type=float, default=5.0, help='Seconds saved after an event')
+    args = parser.parse_args()
+
+    # Run the main function with the parsed arguments
+    main(args)
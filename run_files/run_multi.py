@@ -0,0 +1,165 @@
+"""
+
+File: run_multi.py
+
+Description: This script runs the object detection, line detection and distance estimation pipeline on several camera streams at once in a single process, e.g. the front, rear and side cameras of a locomotive. The object detector is loaded once and shared by all streams, and frames of different streams that arrive close together are sent through it as one batch. Every stream keeps its own line detector, distance estimator and detection log.
+
+Requirements:
+- OpenCV: For capturing and processing video frames.
+- Ultralytics YOLO or ONNX Runtime: For object detection tasks.
+- Custom Modules:
+  - distance_functions: Contains the DistanceEstimator class for estimating distances to detected objects.
+  - hough_functions: Contains the LineDetector class for line detection using Hough Transform.
+  - run_frame: Contains the FrameAnalyzer class that integrates object detection, line detection, and distance estimation.
+  - multi_stream: Contains the MultiStreamRunner class that reads the streams and batches their frames.
+
+Usage:
+Pass every stream to --sources, either a camera index or a video file. Video files can stand in for cameras, with
+--realtime they are replayed at their own frame rate like a live feed.
+
+python run_multi.py --sources 0 1 2
+python run_multi.py --sources front.mp4 rear.mp4 side.mp4 --realtime
+
+Command Line Arguments:
+- --sources: Camera indices or video files, one per stream. Default is camera 0.
+- --names: Name of every stream, used for its output files. Defaults to 'camera<index>' or the file name.
+- --max-batch: Maximum number of frames sent through the detector in one call. Default is 8.
+- --max-wait-ms: How long to wait for streams without a frame before running a batch. Default is 5.
+- --buffer-size: Frames that can wait per stream. Default is 4.
+- --realtime: Replay video files at their frame rate and drop frames the runner can't keep up with, like cameras.
+- --show: Show every stream in its own window. Press 'q' in a window to quit.
+- --save-video: Write an annotated video per stream.
+- --report-every: Seconds between throughput reports. Default is 10.
+- --flush-frames, --flush-seconds, --format, --track, --detect-every, --adaptive-roi, --line-scale, --smoothing,
+  --line-gate, --line-gate-max-reuse, --profile, --profile-stats, --detector, --weights: Defined in
+  functions/arguments.py, shared with the other scripts.
+
+Output:
+- A CSV file per stream ('output/csvs/multi_<name>_objects.csv') containing details of the detected objects for each
+  frame. With --format columnar this is a columnar log directory ('output/logs/multi_<name>_objects') instead.
+- With --save-video, an annotated video per stream ('output/multi_<name>.avi') at the stream's frame rate.
+- The aggregate and per-stream frame rates, drops and latencies, printed periodically and at the end.
+"""
+
+import cv2
+import os
+import argparse
+from functions.arguments import add_log_arguments, add_analysis_arguments, add_profile_arguments, add_detector_arguments
+from functions.detection_sink import open_sink
+from functions.detectors import load_detector
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+from functions.line_gate import LineGate
+from functions.multi_stream import MultiStreamRunner, Stream, StreamReader, is_camera, open_source
+from functions.profiler import StageProfiler
+from functions.renderer import FrameRenderer, NULL_RENDERER
+from functions.run_frame import FrameAnalyzer
+from functions.tracker import ObjectTracker
+
+def stream_names(sources, names=None):
+    """
+    Names every stream, 'camera<index>' for cameras and the file name for videos, made unique with a suffix.
+    """
+    if names:
+        if len(names) != len(sources):
+            raise ValueError("Give one name per source")
+        return list(names)
+
+    result = []
+    for source in sources:
+        name = f'camera{source}' if source.isdigit() else os.path.splitext(os.path.basename(source))[0]
+        if name in result:
+            name = f'{name}_{len(result)}'
+        result.append(name)
+    return result
+
+def main(args):
+    """
+    Analyzes the streams with the options of the command line.
+
+    :param args: Parsed command line arguments, see the module docstring
+    """
+    # Load the object detector once, it is shared by every stream
+    yolo_model = load_detector(args.detector, args.weights)
+    profiler = StageProfiler(stats_path=args.profile_stats) if args.profile or args.profile_stats else None
+    renderer = FrameRenderer() if args.show or args.save_video else NULL_RENDERER
+
+    # Build every stream with its own line detector, estimator, tracker, log and video
+    streams = []
+    for source, name in zip(args.sources, stream_names(args.sources, args.names)):
+        cap = open_source(source)
+        if not cap.isOpened():
+            print(f"Error: Unable to open {source}")
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+        detector = LineDetector(adaptive_roi=args.adaptive_roi, process_scale=args.line_scale)
+        gate = None
+        if args.line_gate is not None:
+            gate = LineGate(detector, threshold=args.line_gate, max_reuse=args.line_gate_max_reuse)
+        fa = FrameAnalyzer(yolo_model, detector, DistanceEstimator(smoothing=args.smoothing),
+                           tracker=ObjectTracker(fps=fps) if args.track else None, detect_every=args.detect_every,
+                           profiler=profiler, renderer=renderer, line_gate=gate)
+
+        if args.format == 'csv':
+            output_path = f"output/csvs/multi_{name}_objects.csv"
+        else:
+            output_path = f"output/logs/multi_{name}_objects"
+        sink = open_sink(args.format, output_path, flush_frames=args.flush_frames,
+                         flush_seconds=args.flush_seconds)
+
+        writer = None
+        if args.save_video:
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            writer = cv2.VideoWriter(f'output/multi_{name}.avi', cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), fps, size)
+
+        # Cameras always drop their oldest frame when the runner falls behind, files only with --realtime
+        reader = StreamReader(name, cap, args.buffer_size, args.realtime, live=is_camera(source))
+        streams.append(Stream(name, reader, fa, sink, writer))
+
+    if not streams:
+        return
+
+    runner = MultiStreamRunner(yolo_model, streams, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+                               show=args.show, report_every=args.report_every)
+    try:
+        runner.run()
+    finally:
+        # Close every stream's log and video, also on 'q' or an error
+        for stream in streams:
+            stream.sink.close()
+            if stream.writer is not None:
+                stream.writer.release()
+            stream.reader.cap.release()
+        if profiler is not None:
+            profiler.close()  # Report the final per-stage latencies
+
+    print(runner.report())
+    for stream in streams:
+        if stream.analyzer.line_gate is not None:
+            print(f"{stream.name}: {stream.analyzer.line_gate.report()}")
+    if args.show:
+        cv2.destroyAllWindows()  # Close the stream windows
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Detect objects in several camera streams with one shared detector.')
+    parser.add_argument('--sources', nargs='+', default=['0'], help='Camera indices or video files, one per stream')
+    parser.add_argument('--names', nargs='+', default=None, help='Name of every stream, used for its output files')
+    parser.add_argument('--max-batch', type=int, default=8, help='Maximum frames sent through the detector at once')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='How long to wait for streams without a frame before running a batch')
+    parser.add_argument('--buffer-size', type=int, default=4, help='Frames that can wait per stream')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Replay video files at their frame rate and drop frames like a live camera')
+    parser.add_argument('--show', action='store_true', help='Show every stream in its own window')
+    parser.add_argument('--save-video', action='store_true', help='Write an annotated video per stream')
+    parser.add_argument('--report-every', type=float, default=10.0, help='Seconds between throughput reports')
+    add_log_arguments(parser)
+    add_analysis_arguments(parser)
+    add_profile_arguments(parser)
+    add_detector_arguments(parser)
+    args = parser.parse_args()
+
+    # Run the main function with the parsed arguments
+    main(args)
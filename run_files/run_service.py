@@ -0,0 +1,95 @@
+"""
+
+File: run_service.py
+
+Description: This script runs the object detection, line detection and distance estimation pipeline as an always-warm local service. The model is loaded once, and other programs send it encoded frames over HTTP on localhost (or a Unix socket) and get the detected objects, their distances and the track trajectory back as JSON. Every stream ID keeps its own rail line state, and requests that arrive together are batched through the object detector.
+
+Requirements:
+- OpenCV: For decoding the frames.
+- Ultralytics YOLO or ONNX Runtime: For object detection tasks.
+- Custom Modules:
+  - distance_functions: Contains the DistanceEstimator class for estimating distances to detected objects.
+  - hough_functions: Contains the LineDetector class for line detection using Hough Transform.
+  - run_frame: Contains the FrameAnalyzer class that integrates object detection, line detection, and distance estimation.
+  - service: Contains the AnalysisService class and the HTTP server.
+
+Usage:
+python run_service.py --detector onnx --weights models/yolov8n.onnx
+curl --data-binary @inputs/bus.jpg 'http://127.0.0.1:8765/analyze?stream=front'
+curl http://127.0.0.1:8765/metrics
+
+benchmarks/service_client.py replays a video against the service from several streams at once and reports latencies.
+
+Command Line Arguments:
+- --host: Address to listen on. Default is '127.0.0.1', only local programs can connect.
+- --port: TCP port. Default is 8765.
+- --unix: Listen on this Unix socket path instead of TCP.
+- --max-batch: Maximum number of frames sent through the detector in one call. Default is 8.
+- --max-wait-ms: How long the first request of a batch waits for more. Default is 5.
+- --queue-size: Requests that can wait, more are rejected with 503 until the queue drains. Default is 64.
+- --track, --detect-every, --adaptive-roi, --line-scale, --smoothing, --line-gate, --line-gate-max-reuse, --detector,
+  --weights: Defined in functions/arguments.py, shared with the other scripts.
+
+Output:
+- JSON responses, see functions/service.py for the endpoints.
+- The request and latency summary, printed on exit (Ctrl+C or SIGTERM).
+"""
+
+import asyncio
+import argparse
+import json
+from functions.arguments import add_analysis_arguments, add_detector_arguments
+from functions.detectors import load_detector
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+from functions.line_gate import LineGate
+from functions.renderer import NULL_RENDERER
+from functions.run_frame import FrameAnalyzer
+from functions.service import AnalysisService, serve
+from functions.tracker import ObjectTracker
+
+def main(args):
+    """
+    Serves the frame analysis with the options of the command line.
+
+    :param args: Parsed command line arguments, see the module docstring
+    """
+    # Load the object detector once, it is shared by every stream
+    yolo_model = load_detector(args.detector, args.weights)
+
+    def make_analyzer(profiler):
+        # A new stream gets its own line detector, estimator, tracker and line gate. Nothing is drawn
+        detector = LineDetector(adaptive_roi=args.adaptive_roi, process_scale=args.line_scale)
+        gate = None
+        if args.line_gate is not None:
+            gate = LineGate(detector, threshold=args.line_gate, max_reuse=args.line_gate_max_reuse)
+        return FrameAnalyzer(yolo_model, detector, DistanceEstimator(smoothing=args.smoothing),
+                             tracker=ObjectTracker() if args.track else None, detect_every=args.detect_every,
+                             profiler=profiler, renderer=NULL_RENDERER, line_gate=gate)
+
+    service = AnalysisService(yolo_model, make_analyzer, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+                              queue_size=args.queue_size)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+    # Print what was served
+    print(json.dumps(service.summary(), indent=2))
+
+if __name__ == '__main__':
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Serve the frame analysis over HTTP on localhost or a Unix socket.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port')
+    parser.add_argument('--unix', type=str, default=None, help='Unix socket path to listen on instead of TCP')
+    parser.add_argument('--max-batch', type=int, default=8, help='Maximum frames sent through the detector at once')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='How long the first request of a batch waits for more')
+    parser.add_argument('--queue-size', type=int, default=64, help='Requests that can wait before 503 is returned')
+    add_analysis_arguments(parser)
+    add_detector_arguments(parser)
+    args = parser.parse_args()
+
+    # Run the main function with the parsed arguments
+    main(args)
@@ -6,83 +6,247 @@ Description: This script provides a comprehensive pipeline for detecting objects
 
 Requirements:
 - OpenCV: For video processing and manipulation.
-- Ultralytics YOLO: For object detection tasks.
+- Ultralytics YOLO or ONNX Runtime: For object detection tasks.
 - Custom Modules:
   - distance_functions: Contains the DistanceEstimator class for estimating distances to detected objects.
   - hough_functions: Contains the LineDetector class for line detection using Hough Transform.
   - run_frame: Contains the FrameAnalyzer class that integrates object detection, line detection, and distance estimation.
 
 Usage:
-The script accepts a video file path as an input argument.
+The script accepts a video file path as an input argument. With --workers the video is split into frame ranges that
+are analyzed in parallel by worker processes and merged in frame order afterwards (see functions/video_chunks.py).
 
 Command Line Arguments:
 - --video, -v: Path to the input video file. Default is 'inputs/train_clip.mp4'.
+- --flush-frames, --flush-seconds, --format, --track, --detect-every, --adaptive-roi, --line-scale, --smoothing,
+  --line-gate, --line-gate-max-reuse, --profile, --profile-stats, --detector, --weights: Defined in
+  functions/arguments.py, shared with the other scripts.
+- --batch-size, -b: Number of frames run through YOLO in a single call, at least 1. Default is 1. Ignored with
+  --pipeline.
+- --pipeline: Run decode, detect, lines, annotate and encode as a threaded pipeline and print per-stage stats.
+  --detect-every is ignored in this mode.
+- --queue-size: Maximum number of frames waiting between two pipeline stages. Default is 8.
+- --reuse-buffers: Read the frames into a pool of preallocated buffers and let the line detection write into the same
+  intermediate images every frame, instead of allocating new arrays per frame. Ignored with --pipeline. See
+  benchmarks/bench_buffer_pool.py.
+- --line-state: JSON file the smoothed rail lines are restored from at start (if it exists) and saved to at exit, so
+  a restarted run doesn't need a window of frames to converge again.
+- --workers: Analyze the video in chunks with this many worker processes. Default is 0, a single process.
+  --pipeline and --profile are ignored in this mode.
+- --chunks: Number of frame ranges the video is split into with --workers. Default is one per worker.
+- --chunk-warmup: Frames analyzed before every chunk, without writing them, so the rail line smoothing has settled by
+  the chunk's first frame. A chunk warms up further back if its rails haven't settled by then. The chunked log is
+  close to a single process run, but distances near the start of a chunk can differ slightly. Default is 30.
+- --chunk-warmup-max: Maximum frames a chunk warms up when its rails don't settle, e.g. after a long stretch without
+  visible rails. A chunk that reaches it starts with unsettled rails, which is reported. Default is 300.
+- --headless: Only write the detection log. Nothing is drawn or encoded and no key presses are polled.
+- --render-every: Only draw and encode every Nth frame of the output video, which plays at the source frame rate
+  divided by N. Must be at least 1, use --headless for no output video. Default is 1.
+- --render-detections-only: Only draw and encode the frames with at least one detected object.
+- --record-events: Keep the last seconds of raw frames in memory and save a clip around every moment a relevant
+  object (person, vehicle, animal) is closer than --event-distance, see functions/event_recorder.py.
+  Not available with --workers.
+- --event-distance: Distance below which an event is recorded, in the units of the Distance column. Default is 25.
+- --pre-event-seconds: Seconds of frames saved from before an event. Default is 5.
+- --post-event-seconds: Seconds of frames saved after the last close object of an event. Default is 5.
 
 Output:
 - A CSV file ('output/csvs/video_objects.csv') containing details of the detected objects for each frame.
-- An output video ('output/videos_images/output_video.avi') showing the detected objects and lines for each frame.
+  With --format columnar this is a columnar log directory ('output/logs/video_objects') instead, read it with
+  functions.detection_sink.ColumnarLog.
+- An output video ('output/output_video.avi') showing the detected objects and lines for each frame, encoded at the
+  frame rate of the input video. Not written with --headless.
+- With --record-events, a clip and a CSV of its detections per event ('output/events/video_<first frame>.avi/.csv').
+- The average frames per second, printed when the video is done.
 """
 
 # Import necessary modules
 import cv2
-import csv
+import os
+import time
 import argparse
+from functions.arguments import add_log_arguments, add_analysis_arguments, add_profile_arguments, add_detector_arguments
+from functions.detection_sink import open_sink
+from functions.buffer_pool import FramePool
+from functions.detectors import load_detector
+from functions.event_recorder import EventRecorder
 from functions.distance_functions import DistanceEstimator
 from functions.hough_functions import LineDetector
+from functions.line_gate import LineGate
+from functions.profiler import StageProfiler
+from functions.pipeline import FramePipeline
+from functions.renderer import FrameRenderer, NULL_RENDERER
 from functions.run_frame import FrameAnalyzer
-from ultralytics import YOLO
-
-def main(video_path):
-    # Build YOLO, detector, and estimator
-    yolo_model = YOLO('models/yolov8n.pt')
-    detector = LineDetector()
-    estimator = DistanceEstimator()
-    fa = FrameAnalyzer(yolo_model, detector, estimator)
+from functions.tracker import ObjectTracker
+from functions.video_chunks import run_video_chunks
+
+def main(args):
+    """
+    Analyzes the video with the options of the command line.
+
+    :param args: Parsed command line arguments, see the module docstring
+    """
+    # Define output detection log and video paths
+    if args.format == 'csv':
+        output_path = "output/csvs/video_objects.csv"
+    else:
+        output_path = "output/logs/video_objects"
+    video_output_path = 'output/output_video.avi'
+
+    if args.workers:
+        # Every worker process loads its own model and analyzes whole chunks, nothing is loaded here
+        run_video_chunks(args.video, output_path, video_output_path, output_format=args.format, backend=args.detector,
+                         weights=args.weights, workers=args.workers, chunks=args.chunks, warmup=args.chunk_warmup,
+                         warmup_max=args.chunk_warmup_max, batch_size=args.batch_size, track=args.track,
+                         detect_every=args.detect_every, adaptive_roi=args.adaptive_roi, line_scale=args.line_scale,
+                         smoothing=args.smoothing, line_state=args.line_state, flush_frames=args.flush_frames,
+                         flush_seconds=args.flush_seconds, headless=args.headless, render_every=args.render_every,
+                         render_detections=args.render_detections_only, line_gate=args.line_gate,
+                         line_gate_max_reuse=args.line_gate_max_reuse, reuse_buffers=args.reuse_buffers)
+        return
 
     # Open video file
-    cap = cv2.VideoCapture(video_path)
-
-    # Define output CSV file
-    csv_file_name = "output/csvs/video_objects.csv"
-    with open(csv_file_name, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Frame', 'Class ID', 'Object Name', 'Confidence', 'X1', 'Y1', 'X2', 'Y2', 'Distance'])
-
-    # Define output video writer
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+    # Build the object detector, line detector, estimator and (optionally) tracker
+    yolo_model = load_detector(args.detector, args.weights)
+    detector = LineDetector(adaptive_roi=args.adaptive_roi, process_scale=args.line_scale,
+                            reuse_buffers=args.reuse_buffers)
+    estimator = DistanceEstimator(smoothing=args.smoothing)
+    if args.line_state and os.path.exists(args.line_state):
+        estimator.load_state(args.line_state)  # Warm start the rail lines from a previous run
+    tracker = ObjectTracker(fps=fps) if args.track else None
+    profiler = StageProfiler(stats_path=args.profile_stats) if args.profile or args.profile_stats else None
+    renderer = NULL_RENDERER if args.headless else FrameRenderer(args.render_every, args.render_detections_only)
+    gate = None
+    if args.line_gate is not None:
+        gate = LineGate(detector, threshold=args.line_gate, max_reuse=args.line_gate_max_reuse)
+    recorder = None
+    if args.record_events:
+        recorder = EventRecorder(fps, pre_seconds=args.pre_event_seconds, post_seconds=args.post_event_seconds,
+                                 threshold=args.event_distance, prefix='video')
+    fa = FrameAnalyzer(yolo_model, detector, estimator, tracker=tracker, detect_every=args.detect_every,
+                       profiler=profiler, renderer=renderer, recorder=recorder, line_gate=gate)
+
+    # Open the output detection log, kept open for the whole video
+    sink = open_sink(args.format, output_path, flush_frames=args.flush_frames,
+                     flush_seconds=args.flush_seconds)
+
+    # Define output video writer at the source frame rate, none in headless mode
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter('output/output_video.avi', cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30, (frame_width, frame_height))
+    out = None
+    if not args.headless:
+        out = cv2.VideoWriter(video_output_path, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'),
+                              fps / args.render_every, (frame_width, frame_height))
 
     frame_idx = 0  # Frame index
+    start_time = time.perf_counter()
 
-    # Process each frame in the video
-    while cap.isOpened():
-        success, frame = cap.read()  # Read a frame from the video
+    try:
+        if args.pipeline:
+            # Run decode, detect, lines, annotate and encode as overlapping threads
+            frame_pipeline = FramePipeline(fa, cap.read, sink=sink, writer=out,
+                                           queue_size=args.queue_size, annotate=not args.headless)
+            for item in frame_pipeline.run():
+                frame_idx += 1
 
-        if success:
-            # Analyze the frame using FrameAnalyzer
-            analyzed_frame = fa.run_frame(frame, csv_file_name, n_frame = frame_idx)
-            out.write(analyzed_frame)  # Write the processed frame to the output video
-
-            # Break the loop if 'q' is pressed
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                break
-
-            frame_idx += 1  # Increment frame index
+                # Stop reading if 'q' is pressed, the frames already in flight are still written
+                if not args.headless and cv2.waitKey(1) & 0xFF == ord("q"):
+                    frame_pipeline.stop()
+            print(frame_pipeline.report())
 
         else:
-            break  # Break the loop if the end of the video is reached
-
-    # Clean up
-    cap.release()  # Release the video capture object
-    out.release()  # Release the output video writer
-    cv2.destroyAllWindows()  # Close any open windows
+            # Read into a pool holding one batch, the frames are written out before their buffers are read into again
+            reader = FramePool(cap, args.batch_size) if args.reuse_buffers else cap
+
+            # Process the video a batch of frames at a time
+            while cap.isOpened():
+                # Read up to batch_size frames from the video
+                batch = []
+                while len(batch) < args.batch_size:
+                    success, frame = reader.read()
+                    if not success:
+                        break
+                    batch.append(frame)
+
+                if not batch:
+                    break  # Break the loop if the end of the video is reached
+
+                # Analyze the batch using FrameAnalyzer, YOLO runs once for the whole batch
+                analyzed_frames = fa.run_batch(batch, first_frame = frame_idx, sink = sink)
+                for analyzed_frame in analyzed_frames:
+                    if analyzed_frame is None:
+                        continue  # Not drawn, headless or skipped by the renderer
+                    with fa.profiler.stage('encode'):
+                        out.write(analyzed_frame)  # Write the processed frame to the output video
+
+                frame_idx += len(batch)  # Increment frame index
+
+                # Break the loop if 'q' is pressed
+                if not args.headless and cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+    finally:
+        # Clean up, also when the analysis raised
+        sink.close()  # Write any buffered rows and close the detection log
+        cap.release()  # Release the video capture object
+        if out is not None:
+            out.release()  # Release the output video writer
+        if recorder is not None:
+            recorder.close()  # Finish writing the event clips
+            print(recorder.report())
+        if profiler is not None:
+            profiler.close()  # Report the final per-stage latencies
+        if args.line_state:
+            # Last, so a failing save can't keep the outputs above from being closed
+            estimator.save_state(args.line_state)  # Keep the rail lines for the next run
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {frame_idx} frames in {elapsed:.2f}s ({frame_idx / max(elapsed, 1e-9):.2f} FPS)")
+    if gate is not None:
+        print(gate.report())
+    if out is not None:
+        cv2.destroyAllWindows()  # Close any open windows
 
 if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Detect objects in a video and save results to a CSV file.')
     parser.add_argument('--video', '-v', type=str, default='inputs/train_clip.mp4', help='Path to the input video file')
+    add_log_arguments(parser)
+    add_analysis_arguments(parser)
+    add_profile_arguments(parser)
+    add_detector_arguments(parser)
+    parser.add_argument('--batch-size', '-b', type=int, default=1, help='Number of frames sent through YOLO in one call')
+    parser.add_argument('--pipeline', action='store_true', help='Run the stages as a threaded pipeline')
+    parser.add_argument('--queue-size', type=int, default=8, help='Frames that can wait between two pipeline stages')
+    parser.add_argument('--reuse-buffers', action='store_true',
+                        help='Read frames into preallocated buffers and reuse the line detection images')
+    parser.add_argument('--line-state', type=str, default=None,
+                        help='JSON file to warm start the rail lines from and save them to on exit')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Analyze the video in chunks with this many worker processes')
+    parser.add_argument('--chunks', type=int, default=None, help='Frame ranges to split the video into with --workers')
+    parser.add_argument('--chunk-warmup', type=int, default=30,
+                        help='Frames analyzed before every chunk to settle the rail line smoothing, more if the '
+                             'rails are not settled by then. The result approximates a single process run')
+    parser.add_argument('--chunk-warmup-max', type=int, default=300,
+                        help='Maximum frames analyzed before a chunk whose rails do not settle')
+    parser.add_argument('--headless', action='store_true',
+                        help='Only write the detection log, no drawing, encoding or key polling')
+    parser.add_argument('--render-every', type=int, default=1, help='Only draw and encode every Nth frame')
+    parser.add_argument('--render-detections-only', action='store_true',
+                        help='Only draw and encode frames with detected objects')
+    parser.add_argument('--record-events', action='store_true',
+                        help='Save clips of the frames around relevant objects closer than --event-distance')
+    parser.add_argument('--event-distance', type=float, default=25.0, help='Distance that triggers an event clip')
+    parser.add_argument('--pre-event-seconds', type=float, default=5.0, help='Seconds saved from before an event')
+    parser.add_argument('--post-event-seconds', type=float, default=5.0, help='Seconds saved after an event')
     args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+    if args.render_every < 1:
+        parser.error('--render-every must be at least 1, use --headless to skip the output video')
 
-    # Run the main function with the specified video path
-    main(args.video)
+    # Run the main function with the parsed arguments
+    main(args)
@@ -0,0 +1,8 @@
+"""
+Makes the functions and benchmarks packages importable, the same way the scripts import them from run_files.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
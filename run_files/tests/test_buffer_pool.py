@@ -0,0 +1,69 @@
+"""
+Tests for FramePool.
+"""
+
+import cv2
+import numpy as np
+from functions.buffer_pool import FramePool
+
+
+class FakeCapture:
+    """
+    Reads numbered frames like cv2.VideoCapture, into the given array if it has the right shape.
+    """
+
+    def __init__(self, shapes):
+        self.shapes = list(shapes)
+        self.reads = 0
+        self.released = False
+
+    def read(self, image = None):
+        if self.reads >= len(self.shapes):
+            return False, None
+        shape = self.shapes[self.reads]
+        self.reads += 1
+        if image is None or image.shape != shape:
+            image = np.empty(shape, dtype=np.uint8)
+        image[:] = self.reads
+        return True, image
+
+    def release(self):
+        self.released = True
+
+
+def test_buffers_are_reused_round_robin():
+    pool = FramePool(FakeCapture([(4, 4, 3)] * 6), size=2)
+    frames = [pool.read()[1] for _ in range(6)]
+    assert pool.allocations == 2 and pool.reads == 6
+    assert frames[0] is frames[2] is frames[4]
+    assert frames[1] is frames[3] is frames[5]
+    assert frames[1] is not frames[0]
+    # a frame stays valid until size - 1 more frames were read
+    assert frames[5][0, 0, 0] == 6 and frames[4][0, 0, 0] == 5
+    assert pool.read() == (False, None)
+
+
+def test_resolution_change_allocates():
+    pool = FramePool(FakeCapture([(4, 4, 3), (4, 4, 3), (8, 8, 3), (8, 8, 3)]), size=1)
+    shapes = [pool.read()[1].shape for _ in range(4)]
+    assert shapes == [(4, 4, 3), (4, 4, 3), (8, 8, 3), (8, 8, 3)]
+    assert pool.allocations == 2
+    pool.release()
+    assert pool.cap.released and pool.buffers == [None]
+
+
+def test_same_frames_as_a_plain_capture(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30, (64, 48))
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        out.write(rng.integers(0, 255, (48, 64, 3), dtype=np.uint8))
+    out.release()
+
+    plain, pool = cv2.VideoCapture(path), FramePool(cv2.VideoCapture(path), size=3)
+    for _ in range(10):
+        expected, frame = plain.read()[1], pool.read()[1]
+        assert np.array_equal(expected, frame)
+    assert pool.allocations == 3
+    plain.release()
+    pool.release()
@@ -0,0 +1,90 @@
+"""
+Tests for the detection sinks, the columnar log and merge_logs.
+"""
+
+import csv
+import math
+import pytest
+from functions.detection_sink import HEADER, ColumnarLog, CsvSink, merge_logs, open_sink
+
+
+def rows_of(frame, names, trajectory = 'Straight Track'):
+    return [[frame, trajectory, i, name, 0.5, 10.0 + i, 1.0, 2.0, 3.0, 4.0, None, None, None]
+            for i, name in enumerate(names)]
+
+
+def read_csv(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_csv_sink_buffers_until_flush(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    sink = CsvSink(path, flush_frames=3, flush_seconds=float('inf'))
+    sink.write_frame(rows_of(0, ['person']))
+    sink.write_frame(rows_of(1, ['car']))
+    assert len(read_csv(path)) <= 1  # at most the header
+    sink.write_frame(rows_of(2, []))
+    assert len(read_csv(path)) == 3
+    sink.write_frame(rows_of(3, ['dog']))
+    sink.close()
+    sink.close()  # closing twice is fine
+    assert [row[0] for row in read_csv(path)[1:]] == ['0', '1', '3']
+
+
+def test_csv_sink_append(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with CsvSink(path) as sink:
+        sink.write_frame(rows_of(0, ['person']))
+    with CsvSink(path, append=True) as sink:
+        sink.write_frame(rows_of(1, ['car']))
+    assert read_csv(path)[0] == HEADER
+    assert [row[3] for row in read_csv(path)[1:]] == ['person', 'car']
+
+
+def test_columnar_round_trip(tmp_path):
+    path = str(tmp_path / 'log')
+    with open_sink('columnar', path, flush_frames=2) as sink:
+        for frame in range(5):
+            rows = rows_of(frame, ['person', 'car'][:frame % 3], trajectory=None if frame == 0 else 'Left Curve')
+            if frame == 4:
+                rows[0][5] = 'Error: No Lines Detected'
+            sink.write_frame(rows)
+
+    log = ColumnarLog(path)
+    assert log.rows == 4
+    data = log.read(start=1, stop=4)
+    assert data['frame'].tolist() == [1, 2, 2]
+    assert log.decode('object_name', data['object_name']) == ['person', 'person', 'car']
+    assert log.decode('trajectory', log.read(columns=['trajectory'])['trajectory'])[:1] == ['Left Curve']
+    assert math.isnan(log.read(start=4)['distance'][0])
+    assert log.read(start=4)['track_id'].tolist() == [-1]
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'columnar'])
+def test_merge_logs(tmp_path, fmt):
+    parts = []
+    for index, names in enumerate([['person', 'car'], ['dog'], []]):
+        part = str(tmp_path / f'part{index}{".csv" if fmt == "csv" else ""}')
+        with open_sink(fmt, part) as sink:
+            sink.write_frame(rows_of(index, names, trajectory=['Straight Track', 'Right Curve', None][index]))
+        parts.append(part)
+
+    merged = str(tmp_path / f'merged{".csv" if fmt == "csv" else ""}')
+    merge_logs(fmt, parts, merged)
+
+    if fmt == 'csv':
+        rows = read_csv(merged)
+        assert rows[0] == HEADER
+        assert [(row[0], row[3]) for row in rows[1:]] == [('0', 'person'), ('0', 'car'), ('1', 'dog')]
+    else:
+        log = ColumnarLog(merged)
+        data = log.read()
+        assert data['frame'].tolist() == [0, 0, 1]
+        assert log.decode('object_name', data['object_name']) == ['person', 'car', 'dog']
+        assert log.decode('trajectory', data['trajectory']) == ['Straight Track', 'Straight Track', 'Right Curve']
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        open_sink('parquet', 'log')
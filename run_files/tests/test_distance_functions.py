@@ -0,0 +1,70 @@
+"""
+Tests for LineDetector and DistanceEstimator on synthetic rail scenes with known geometry.
+"""
+
+import json
+import numpy as np
+import pytest
+from benchmarks.synthetic import RailScene
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+
+
+def analyzed(scene, estimator = None, frames = 5):
+    estimator = estimator or DistanceEstimator()
+    detector = LineDetector()
+    for seed in range(frames):
+        lines, params = detector.detect_lines_frame(scene.render(seed), return_params=True)
+        estimator.analyze_lines(lines, params)
+    return estimator
+
+
+def test_numpy_clustering_matches_kmeans():
+    scene = RailScene(1280, 720)
+    lines = LineDetector().detect_lines_frame(scene.render(0))
+    numpy_estimator, kmeans_estimator = DistanceEstimator(), DistanceEstimator(cluster_method='kmeans')
+    numpy_estimator.k_cluster_lines(lines)
+    kmeans_estimator.k_cluster_lines(lines)
+    assert numpy_estimator.left_line == pytest.approx(kmeans_estimator.left_line)
+    assert numpy_estimator.right_line == pytest.approx(kmeans_estimator.right_line)
+
+
+def test_lines_and_distances_match_the_scene():
+    scene = RailScene(1280, 720)
+    estimator = analyzed(scene)
+    (left, right) = scene.rail_lines()
+    assert estimator.left_line[1] == pytest.approx(left[1], abs=0.05)
+    assert estimator.right_line[1] == pytest.approx(right[1], abs=0.05)
+    assert estimator.trajectory == 'Straight Track'
+
+    boxes = scene.boxes()
+    distances = estimator.estimate_distances(scene.height, [box[3] for box, _ in boxes])
+    truth = np.array([distance for _, distance in boxes])
+    assert np.abs(distances / truth - 1).max() < 0.15
+    # the vectorized estimate agrees with the one-at-a-time estimate
+    assert distances[0] == pytest.approx(estimator.estimate_distance(scene.height, boxes[0][0][3]))
+
+
+def test_curves():
+    assert analyzed(RailScene(1280, 720, curvature=-0.035)).trajectory == 'Left Curve'
+    assert analyzed(RailScene(1280, 720, curvature=0.035)).trajectory == 'Right Curve'
+
+
+def test_no_lines():
+    estimator = DistanceEstimator()
+    estimator.analyze_lines(np.empty((0, 1, 4)))
+    assert np.isnan(estimator.estimate_distances(720, [500, 600])).all()
+    assert estimator.estimate_distance(720, 500) == 'Error: No Lines Detected'
+
+
+def test_saved_state_warm_starts(tmp_path):
+    estimator = analyzed(RailScene(1280, 720))
+    path = str(tmp_path / 'state.json')
+    estimator.save_state(path)
+    json.load(open(path))
+
+    restored = DistanceEstimator()
+    restored.load_state(path)
+    assert restored.left_line == estimator.left_line
+    assert restored.right_line == estimator.right_line
+    assert restored.trajectory == estimator.trajectory
@@ -0,0 +1,98 @@
+"""
+Tests for EventRecorder. The clip writer is replaced by one that blocks until released, so the tests can drive add()
+faster than the writer, the way a fast offline loop outruns MJPG encoding.
+"""
+
+import csv
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from functions import event_recorder
+from functions.detection_sink import HEADER
+from functions.event_recorder import EventRecorder
+
+
+class BlockingWriter:
+    """
+    Stands in for cv2.VideoWriter, write() waits until the test opens the gate.
+    """
+    gate = None
+
+    def __init__(self, *args):
+        pass
+
+    def write(self, frame):
+        BlockingWriter.gate.wait(10)
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    BlockingWriter.gate = threading.Event()
+    monkeypatch.setattr(event_recorder.cv2, 'VideoWriter', BlockingWriter)
+    yield BlockingWriter.gate
+    BlockingWriter.gate.set()
+
+
+def row(n_frame, distance):
+    values = [None] * len(HEADER)
+    values[0], values[3], values[5] = n_frame, 'person', distance
+    return values
+
+
+def run(recorder, triggers, n_frames, gate, release_at):
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    for n_frame in range(n_frames):
+        if n_frame == release_at:
+            # let the writer catch up before the rest of the frames come in
+            gate.set()
+            deadline = time.monotonic() + 10
+            while recorder.pinned.any() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        distance = 5.0 if n_frame in triggers else 100.0
+        recorder.add(frame, [row(n_frame, distance)], n_frame)
+    recorder.close()
+
+
+def first_frames(recorder):
+    frames = []
+    for clip in recorder.clips:
+        with open(clip[:-len('.avi')] + '.csv') as f:
+            frames.append([int(r[0]) for r in list(csv.reader(f))[1:]])
+    return frames
+
+
+def test_event_without_writer_lag(tmp_path):
+    recorder = EventRecorder(fps=10, pre_seconds=1, post_seconds=1, output_dir=str(tmp_path))
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    for n_frame in range(60):
+        recorder.add(frame, [row(n_frame, 5.0 if n_frame == 30 else 100.0)], n_frame)
+    recorder.close()
+
+    assert recorder.events == 1
+    assert [os.path.basename(c) for c in recorder.clips] == ['event_20.avi']
+    assert first_frames(recorder) == [list(range(20, 41))]
+
+
+def test_stalled_ring_does_not_reuse_old_frames(tmp_path, gate):
+    # the first event pins frames 5-25, the ring stalls on frame 5's slot from frame 26 on
+    recorder = EventRecorder(fps=10, pre_seconds=1, post_seconds=1, output_dir=str(tmp_path))
+    run(recorder, {15, 50}, 80, gate, release_at=51)
+
+    assert recorder.events == 2
+    assert [os.path.basename(c) for c in recorder.clips] == ['event_5.avi', 'event_50.avi']
+    second = first_frames(recorder)[1]
+    assert second and min(second) > 50
+
+
+def test_stalled_ring_keeps_recent_pre_roll(tmp_path, gate):
+    # frames 20-25 are still within a second of the trigger at 30, older ones are not
+    recorder = EventRecorder(fps=10, pre_seconds=1, post_seconds=1, output_dir=str(tmp_path))
+    run(recorder, {15, 30}, 70, gate, release_at=31)
+
+    assert [os.path.basename(c) for c in recorder.clips] == ['event_5.avi', 'event_20.avi']
+    assert first_frames(recorder)[1][:6] == list(range(20, 26))
@@ -0,0 +1,87 @@
+"""
+Tests for the image batch mode, with the stub detector and synthetic rail scenes.
+"""
+
+import os
+import cv2
+from benchmarks.synthetic import RailScene
+from functions.image_batch import find_images, output_names, read_progress, run_image_batch
+
+
+def write_images(directory, names):
+    os.makedirs(directory, exist_ok=True)
+    scene = RailScene(1280, 720)
+    for seed, name in enumerate(names):
+        cv2.imwrite(os.path.join(directory, name), scene.render(seed))
+
+
+def test_find_images_skips_the_excluded_directory(tmp_path):
+    write_images(tmp_path / 'in', ['a.png', 'b.jpg'])
+    write_images(tmp_path / 'in' / 'out' / 'images', ['a_processed.jpg'])
+    (tmp_path / 'in' / 'notes.txt').write_text('not an image')
+
+    found = find_images([str(tmp_path / 'in')], exclude=str(tmp_path / 'in' / 'out'))
+    assert [os.path.basename(path) for path in found] == ['a.png', 'b.jpg']
+    assert len(find_images([str(tmp_path / 'in' / '**' / '*.jpg')], exclude=str(tmp_path / 'in' / 'out'))) == 1
+    assert len(find_images([str(tmp_path / 'in')])) == 3
+
+
+def test_output_names_are_unique():
+    names = output_names(['archive/2023/cam1/001.jpg', 'archive/2023/cam2/001.jpg',
+                          'archive/2023/cam2/002.jpg', 'archive/2023/cam2/002.png'])
+    assert names == {'archive/2023/cam1/001.jpg': 'cam1__001', 'archive/2023/cam2/001.jpg': 'cam2__001',
+                     'archive/2023/cam2/002.jpg': 'cam2__002_jpg', 'archive/2023/cam2/002.png': 'cam2__002_png'}
+    assert output_names(['inputs/only.png']) == {'inputs/only.png': 'only'}
+
+
+def test_output_names_relative_to_a_root(tmp_path):
+    path = str(tmp_path / 'cam1' / '001.jpg')
+    assert output_names([path]) == {path: '001'}
+    assert output_names([path], root=str(tmp_path)) == {path: 'cam1__001'}
+
+
+def test_output_dir_inside_the_input(tmp_path):
+    inputs = tmp_path / 'in'
+    write_images(inputs, ['a.png', 'a.jpg', 'b.png'])
+    output_dir = str(inputs / 'out')
+
+    for _ in range(2):
+        counts = run_image_batch([str(inputs)], output_dir, backend='stub', workers=1)
+        assert counts['found'] == 3
+    assert sorted(os.listdir(os.path.join(output_dir, 'images'))) == [
+        'a_jpg_processed.jpg', 'a_png_processed.jpg', 'b_processed.jpg']
+
+
+def test_read_progress_only_counts_complete_groups(tmp_path):
+    path = tmp_path / 'done.txt'
+    assert read_progress(str(path)) == (set(), None)
+    path.write_text('a.png\nb.png\n#120\nc.png\n#180\nd.png\n#2')  # the last line was cut off
+    assert read_progress(str(path)) == ({'a.png', 'b.png', 'c.png'}, 180)
+    path.write_text('a.png\n#120\nb.png\nc.png\n')  # stopped before the group's size was written
+    assert read_progress(str(path)) == ({'a.png'}, 120)
+
+
+def test_resume_after_an_interrupted_run(tmp_path):
+    inputs = tmp_path / 'in'
+    write_images(inputs, ['a.png', 'b.png', 'c.png', 'd.png'])
+    paths = [str(inputs / name) for name in ['a.png', 'b.png', 'c.png', 'd.png']]
+    output_dir = str(tmp_path / 'out')
+    log_path = os.path.join(output_dir, 'image_objects.csv')
+    progress_path = os.path.join(output_dir, 'done.txt')
+
+    run_image_batch([str(inputs)], output_dir, backend='stub', workers=1, save_images=False, commit_every=2)
+    with open(log_path, 'rb') as file:
+        complete = file.read()
+    assert read_progress(progress_path) == (set(paths), len(complete))
+
+    # pretend the run stopped after the first group, with rows of the second group already in the log
+    with open(progress_path, 'w') as file:
+        file.write(f'{paths[0]}\n{paths[1]}\n#{len(complete)}\n{paths[2]}\n')
+    with open(log_path, 'ab') as file:
+        file.write(f'{paths[2]},0,Straight Track,0,person'.encode())
+
+    counts = run_image_batch([str(inputs)], output_dir, backend='stub', workers=1, save_images=False, resume=True)
+    assert (counts['skipped'], counts['analyzed']) == (2, 2)
+    with open(log_path, 'rb') as file:
+        assert file.read() == complete
+    assert read_progress(progress_path) == (set(paths), len(complete))
@@ -0,0 +1,53 @@
+"""
+Tests for LineGate.
+"""
+
+import numpy as np
+from benchmarks.synthetic import RailScene
+from functions.hough_functions import LineDetector
+from functions.line_gate import LineGate, merge_stats
+
+
+def test_stable_frames_reuse_the_lines_up_to_max_reuse():
+    scene = RailScene(1280, 720)
+    gate = LineGate(LineDetector(), threshold=2.0, max_reuse=3)
+    frame = scene.render(0)
+
+    decisions = [gate.unchanged(frame) for _ in range(9)]
+    assert decisions == [False, True, True, True, False, True, True, True, False]
+    stats = gate.stats()
+    assert (stats['frames'], stats['hits']) == (9, 6)
+
+
+def test_changed_frames_are_detected_again():
+    scene = RailScene(1280, 720)
+    moved = RailScene(1280, 720, curvature=0.05)
+    gate = LineGate(LineDetector(), threshold=2.0)
+
+    assert not gate.unchanged(scene.render(0))
+    assert gate.unchanged(scene.render(1))  # only the noise differs
+    assert not gate.unchanged(moved.render(0))
+    assert gate.unchanged(moved.render(2))
+
+
+def test_slow_drift_is_compared_with_the_last_detected_frame():
+    gate = LineGate(LineDetector(), threshold=2.0, max_reuse=100)
+    frame = np.full((720, 1280, 3), 100, dtype=np.uint8)
+    assert not gate.unchanged(frame)
+    # every step is below the threshold, but they add up
+    results = [gate.unchanged(np.full_like(frame, 100 + step)) for step in range(1, 5)]
+    assert results == [True, False, True, False]
+
+
+def test_reset_and_merge_stats():
+    gate = LineGate(LineDetector())
+    frame = RailScene(1280, 720).render(0)
+    gate.unchanged(frame)
+    gate.reset()
+    assert not gate.unchanged(frame)
+    gate.record_refresh(0.01)
+
+    merged = merge_stats([gate.stats(), {'frames': 2, 'hits': 2, 'hit_rate': 1.0, 'gate_seconds': 0.0,
+                                         'saved_seconds': 0.02}])
+    assert (merged['frames'], merged['hits'], merged['hit_rate']) == (4, 2, 0.5)
+    assert 'Line gate: reused the rail lines on 0/2 frames' in gate.report()
@@ -0,0 +1,79 @@
+"""
+Tests for LatestFrameCapture and DetectionScheduler, with a fake camera instead of cv2.VideoCapture.
+"""
+
+import time
+import numpy as np
+from functions.live_capture import DetectionScheduler, LatestFrameCapture
+
+
+class SlowCamera:
+    """
+    Returns numbered frames, each read taking `seconds`, until `frames` were read.
+    """
+
+    def __init__(self, seconds, frames = None):
+        self.seconds = seconds
+        self.frames = frames
+        self.reads = 0
+        self.reading = False
+
+    def read(self, buffer = None):
+        if self.frames is not None and self.reads >= self.frames:
+            return False, None
+        self.reading = True
+        time.sleep(self.seconds)
+        self.reads += 1
+        self.reading = False
+        frame = np.empty((2, 2, 3), dtype=np.uint8) if buffer is None else buffer
+        frame[:] = self.reads % 256
+        return True, frame
+
+
+def test_stop_waits_for_the_read_in_progress():
+    camera = SlowCamera(1.2)  # longer than the join timeout stop() used to have
+    capture = LatestFrameCapture(camera)
+    capture.start()
+    assert capture.read()[0]
+    capture.stop()
+    assert not capture.is_alive()
+    assert not camera.reading
+    capture.stop()  # a second stop is a no-op
+
+
+def test_stale_frames_are_dropped():
+    camera = SlowCamera(0.001, frames=50)
+    capture = LatestFrameCapture(camera)
+    capture.start()
+    capture.join()  # the whole stream is captured before anything is read
+
+    success, frame, _ = capture.read()
+    assert success and frame[0, 0, 0] == 50
+    assert capture.frames_captured == 50
+    assert capture.frames_dropped == 49
+    assert capture.read()[0] is False
+
+
+def test_reused_buffers_are_not_overwritten_while_held():
+    camera = SlowCamera(0.001, frames=200)
+    capture = LatestFrameCapture(camera, reuse_buffers=True)
+    capture.start()
+    while True:
+        success, frame, _ = capture.read()
+        if not success:
+            break
+        value = frame[0, 0, 0]
+        time.sleep(0.003)  # slower than the camera, the capture thread keeps reading meanwhile
+        assert (frame == value).all()
+    capture.stop()
+
+
+def test_scheduler_skips_frames_that_would_be_late():
+    scheduler = DetectionScheduler(target_latency=0.05, max_skip=2)
+    assert scheduler.should_detect(0.0)  # nothing measured yet
+    scheduler.record(True, 0.04)
+    assert scheduler.should_detect(0.0)
+    assert not scheduler.should_detect(0.02)
+    assert not scheduler.should_detect(0.02)
+    assert scheduler.should_detect(0.02)  # max_skip reached
+    assert scheduler.frames_skipped == 2
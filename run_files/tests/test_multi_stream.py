@@ -0,0 +1,75 @@
+"""
+Tests for StreamReader, with fake cameras instead of cv2.VideoCapture.
+"""
+
+import threading
+import time
+import numpy as np
+import pytest
+from functions.multi_stream import StreamReader, is_camera
+
+
+class FakeCapture:
+    """
+    Returns `frames` numbered frames as fast as they are read, at a nominal 10 FPS.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.reads = 0
+
+    def get(self, prop):
+        return 10
+
+    def read(self):
+        if self.reads >= self.frames:
+            return False, None
+        self.reads += 1
+        return True, np.full((2, 2, 3), self.reads, dtype=np.uint8)
+
+
+def read_all(reader):
+    reader.condition = threading.Condition()
+    reader.start()
+    return reader
+
+
+def test_is_camera():
+    assert is_camera(0) and is_camera('1')
+    assert not is_camera('front.mp4')
+
+
+def test_files_wait_for_room():
+    reader = read_all(StreamReader('file', FakeCapture(20), buffer_size=4))
+    time.sleep(0.1)
+    assert len(reader.frames) == 4 and reader.frames_dropped == 0
+
+    taken = []
+    while not reader.done:
+        with reader.condition:
+            if reader.frames:
+                taken.append(reader.frames.popleft()[0])
+                reader.condition.notify_all()
+            else:
+                reader.condition.wait(0.1)
+    assert taken == list(range(20))
+    reader.stop()
+
+
+@pytest.mark.parametrize('realtime', [False, True])
+def test_cameras_drop_the_oldest_frame_without_pacing(realtime):
+    start = time.perf_counter()
+    reader = read_all(StreamReader('camera', FakeCapture(20), buffer_size=4, realtime=realtime, live=True))
+    reader.join(5)
+    # 20 frames at a nominal 10 FPS would take 2 s if they were paced
+    assert time.perf_counter() - start < 1
+    assert [n_frame for n_frame, _, _ in reader.frames] == [16, 17, 18, 19]
+    assert reader.frames_dropped == 16
+
+
+def test_realtime_files_are_paced():
+    start = time.perf_counter()
+    reader = read_all(StreamReader('file', FakeCapture(3), buffer_size=4, realtime=True))
+    reader.join(5)
+    assert time.perf_counter() - start >= 0.2
+    assert reader.frames_read == 3
@@ -0,0 +1,23 @@
+"""
+Tests for the output names of run_image.py's --image-list mode.
+"""
+
+import io
+import sys
+import run_image
+
+
+PATHS = ['a/x.jpg', 'b/x.jpg', 'b/x.png']
+
+
+def test_list_file_is_named_like_batch_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'list.txt').write_text('\n'.join(PATHS) + '\n')
+    assert list(run_image.image_list_names('list.txt')) == [
+        ('a/x.jpg', 'a__x'), ('b/x.jpg', 'b__x_jpg'), ('b/x.png', 'b__x_png')]
+
+
+def test_stdin_names_never_collide(monkeypatch):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('\n'.join(PATHS + ['a/x.jpg']) + '\n'))
+    assert list(run_image.image_list_names('-')) == [
+        ('a/x.jpg', 'a__x'), ('b/x.jpg', 'b__x'), ('b/x.png', 'b__x_png'), ('a/x.jpg', 'a__x')]
@@ -0,0 +1,93 @@
+"""
+Tests for the analysis service's HTTP handling, with the stub detector and a synthetic rail scene.
+"""
+
+import asyncio
+import json
+import cv2
+from benchmarks.synthetic import RailScene
+from functions.detectors import StubDetector
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+from functions.renderer import NULL_RENDERER
+from functions.run_frame import FrameAnalyzer
+from functions.service import AnalysisService, parse_count
+
+
+def make_service():
+    scene = RailScene(1280, 720)
+    yolo = StubDetector([box for box, _ in scene.boxes()])
+
+    def make_analyzer(profiler):
+        return FrameAnalyzer(yolo, LineDetector(), DistanceEstimator(), profiler=profiler, renderer=NULL_RENDERER)
+
+    return AnalysisService(yolo, make_analyzer), cv2.imencode('.png', scene.render())[1].tobytes()
+
+
+async def send(port, head, body = b''):
+    """
+    Sends one raw request and returns the status and JSON body of the response.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(head.encode('latin-1') + b'\r\n\r\n' + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+    response = json.loads(await reader.readexactly(length))
+    writer.close()
+    return status, response
+
+
+def run_requests(requests):
+    """
+    Serves on a free port, sends the requests one after another and returns their (status, response).
+    """
+    service, frame = make_service()
+
+    async def main():
+        service.start()
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await send(port, head.format(length=len(frame)), frame if with_body else b'')
+                    for head, with_body in requests]
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.stop()
+
+    return asyncio.run(main()), service
+
+
+def test_parse_count():
+    assert parse_count('12') == 12
+    assert parse_count(' 0 ') == 0
+    for text in ('-1', '1.5', 'abc', '', '²'):
+        assert parse_count(text) is None
+
+
+def test_analyze():
+    [(status, response)], service = run_requests(
+        [('POST /analyze?stream=front&frame=7 HTTP/1.1\r\nContent-Length: {length}', True)])
+    assert status == 200
+    assert [obj['frame'] for obj in response['objects']] == [7] * 4
+    assert service.summary()['requests'] == 1
+
+
+def test_bad_frame_numbers_are_rejected():
+    results, _ = run_requests([('POST /analyze?frame=abc HTTP/1.1\r\nContent-Length: {length}', True),
+                               ('POST /analyze?frame=-3 HTTP/1.1\r\nContent-Length: {length}', True)])
+    assert [status for status, _ in results] == [400, 400]
+
+
+def test_bad_content_length_is_rejected():
+    results, _ = run_requests([('POST /analyze HTTP/1.1\r\nContent-Length: -5', False),
+                               ('POST /analyze HTTP/1.1\r\nContent-Length: lots', False),
+                               ('GET /health HTTP/1.1', False)])
+    assert [status for status, _ in results] == [400, 400, 200]
@@ -0,0 +1,83 @@
+"""
+Tests for RingSmoother.
+"""
+
+from collections import deque
+import numpy as np
+import pytest
+from functions.smoothing import RingSmoother
+
+
+def test_mean_matches_deque_average():
+    # the deques DistanceEstimator used to keep, summed with sum(deque) / len(deque)
+    rng = np.random.default_rng(0)
+    smoother = RingSmoother(window=10)
+    intercepts, slopes = deque(maxlen=10), deque(maxlen=10)
+    for _ in range(1000):
+        intercept, slope = (float(v) for v in rng.normal(300, 80, 2))
+        smoother.push([intercept, slope])
+        intercepts.append(intercept)
+        slopes.append(slope)
+        expected = [sum(intercepts) / len(intercepts), sum(slopes) / len(slopes)]
+        assert smoother.value() == pytest.approx(expected, rel=1e-12)
+
+
+def test_running_sum_does_not_drift():
+    # a huge value leaves rounding error in a running sum after it is evicted, the periodic recompute clears it
+    rng = np.random.default_rng(1)
+    smoother = RingSmoother(window=10)
+    smoother.push([1e15, -1e15])
+    for _ in range(100):
+        smoother.push(rng.normal(0, 0.1, 2))
+    assert smoother.value() == pytest.approx(smoother.buffer.mean(axis=0), abs=1e-12)
+
+
+def test_empty_and_partial_windows():
+    smoother = RingSmoother(window=3)
+    assert smoother.value() is None and len(smoother) == 0
+    smoother.push([1, 10])
+    smoother.push([3, 30])
+    assert smoother.value().tolist() == [2, 20]
+    for values in ([5, 50], [7, 70]):
+        smoother.push(values)
+    assert len(smoother) == 3
+    assert smoother.value().tolist() == [5, 50]
+    assert smoother.ordered().tolist() == [[3, 30], [5, 50], [7, 70]]
+
+
+def test_median_and_ewm():
+    median = RingSmoother(window=3, mode='median')
+    ewm = RingSmoother(window=3, mode='ewm', alpha=0.5)
+    for values in ([1, 1], [100, 100], [3, 3], [4, 4]):
+        median.push(values)
+        ewm.push(values)
+    assert median.value().tolist() == [4, 4]
+    assert ewm.value().tolist() == pytest.approx([((1 * 0.5 + 50) * 0.5 + 1.5) * 0.5 + 2] * 2)
+
+    with pytest.raises(ValueError):
+        RingSmoother(mode='mode')
+
+
+@pytest.mark.parametrize('mode', ['mean', 'ewm', 'median'])
+def test_state_round_trip(mode):
+    smoother = RingSmoother(window=4, mode=mode)
+    for i in range(7):
+        smoother.push([i, 2 * i])
+
+    restored = RingSmoother(window=4, mode=mode)
+    restored.set_state(smoother.get_state())
+    assert restored.value().tolist() == smoother.value().tolist()
+
+    # pushing on continues the same way
+    smoother.push([10, 20])
+    restored.push([10, 20])
+    assert restored.value().tolist() == smoother.value().tolist()
+
+
+def test_smaller_window_keeps_the_newest_values():
+    smoother = RingSmoother(window=5)
+    for i in range(5):
+        smoother.push([i, i])
+    restored = RingSmoother(window=2)
+    restored.set_state(smoother.get_state())
+    assert restored.ordered().tolist() == [[3, 3], [4, 4]]
@@ -0,0 +1,78 @@
+"""
+Tests for ObjectTracker.
+"""
+
+import numpy as np
+import pytest
+from functions.tracker import ObjectTracker, box_iou
+
+
+def person(box):
+    return (0, 'person', 0.9, box)
+
+
+def test_box_iou():
+    iou = box_iou([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+    assert iou == pytest.approx(np.array([[1.0, 1 / 3, 0.0]]))
+
+
+def test_ids_are_kept_across_frames():
+    tracker = ObjectTracker()
+    first = tracker.update([person([0, 0, 10, 10]), person([50, 50, 60, 60])])
+    second = tracker.update([person([52, 51, 62, 61]), person([1, 0, 11, 10])])
+    assert [t.track_id for t in first] == [0, 1]
+    assert [t.track_id for t in second] == [1, 0]
+
+
+def test_classes_do_not_match():
+    tracker = ObjectTracker()
+    tracker.update([person([0, 0, 10, 10])])
+    car = tracker.update([(2, 'car', 0.9, [0, 0, 10, 10])])
+    assert car[0].track_id == 1
+
+
+def test_lost_tracks_are_dropped_after_max_missed():
+    tracker = ObjectTracker(max_missed=2)
+    tracker.update([person([0, 0, 10, 10])])
+    for _ in range(2):
+        tracker.update([])
+    assert len(tracker.tracks) == 1
+    tracker.update([])
+    assert tracker.tracks == []
+
+
+def test_predict_skips_tracks_that_missed_their_detection():
+    # with --detect-every, an object YOLO didn't find on the last detection frame isn't reported in between
+    tracker = ObjectTracker(max_missed=5)
+    tracker.update([person([0, 0, 10, 10]), person([50, 50, 60, 60])])
+    tracker.update([person([0, 0, 10, 10])])
+
+    predicted = tracker.predict()
+    assert [t.track_id for t in predicted] == [0]
+    assert len(tracker.tracks) == 2
+
+    # the lost track is still there to be matched again
+    again = tracker.update([person([0, 0, 10, 10]), person([50, 50, 60, 60])])
+    assert [t.track_id for t in again] == [0, 1]
+    assert [t.track_id for t in tracker.predict()] == [0, 1]
+
+
+def test_predict_moves_boxes_with_their_velocity():
+    tracker = ObjectTracker(alpha=1.0, beta=1.0)
+    tracker.update([person([0, 0, 10, 10])])
+    tracker.update([person([2, 0, 12, 10])])
+    track = tracker.predict()[0]
+    assert track.box[0] > 2
+
+
+def test_closing_speed():
+    tracker = ObjectTracker(fps=10)
+    track = tracker.update([person([0, 0, 10, 10])])[0]
+    assert tracker.update_distance(track, 30.0) == (30.0, None)
+    for distance in (29.0, 28.0, 27.0, 26.0, 25.0, 24.0, 23.0, 22.0):
+        tracker.update([person([0, 0, 10, 10])])
+        smoothed, closing_speed = tracker.update_distance(track, distance)
+    # 1 unit per frame at 10 FPS
+    assert smoothed == pytest.approx(22.0, abs=1.5)
+    assert closing_speed > 5
+    assert tracker.update_distance(track, float('nan'))[0] < smoothed
@@ -0,0 +1,111 @@
+"""
+Tests for the chunked video processing, run in-process with the stub detector on a synthetic rail scene.
+"""
+
+import csv
+import cv2
+import pytest
+from benchmarks.synthetic import RailScene
+from functions import video_chunks
+from functions.detection_sink import MemorySink
+from functions.detectors import StubDetector
+from functions.distance_functions import DistanceEstimator
+from functions.hough_functions import LineDetector
+from functions.renderer import NULL_RENDERER
+from functions.run_frame import FrameAnalyzer
+
+
+def test_plan_chunks():
+    assert video_chunks.plan_chunks(100, 4, 30) == [(0, 25, 0), (25, 50, 0), (50, 75, 20), (75, None, 45)]
+    assert video_chunks.plan_chunks(10, 3, 2) == [(0, 3, 0), (3, 7, 1), (7, None, 5)]
+    # never more chunks than frames, and every frame in exactly one chunk
+    plan = video_chunks.plan_chunks(3, 8, 30)
+    assert [(start, stop) for start, stop, _ in plan] == [(0, 1), (1, 2), (2, None)]
+
+
+def test_render_every_below_one_is_rejected(tmp_path):
+    # 0 would open the output video at an infinite frame rate and never write to it
+    with pytest.raises(ValueError):
+        video_chunks.run_video_chunks('missing.avi', str(tmp_path / 'log.csv'), str(tmp_path / 'out.avi'),
+                                      render_every=0)
+    assert not (tmp_path / 'out.avi').exists()
+
+
+def test_batch_size_below_one_is_rejected(tmp_path):
+    # 0 would never read a frame and silently write empty outputs
+    with pytest.raises(ValueError):
+        video_chunks.run_video_chunks('missing.avi', str(tmp_path / 'log.csv'), str(tmp_path / 'out.avi'),
+                                      batch_size=0)
+
+
+def chunk_task(video, index, start, stop, warmup_start, log, warmup_max = 300):
+    return {'video': video, 'index': index, 'start': start, 'stop': stop, 'warmup_start': warmup_start,
+            'warmup_max': warmup_max, 'log': log, 'segment': None, 'format': 'csv', 'flush_frames': 30, 'flush_seconds': 1.0,
+            'batch_size': 1, 'track': False, 'detect_every': 1, 'adaptive_roi': False, 'line_scale': 1.0,
+            'smoothing': 'mean', 'load_state': None, 'save_state': None, 'headless': True, 'render_every': 1,
+            'render_detections': False, 'line_gate': None, 'line_gate_max_reuse': 5, 'reuse_buffers': False}
+
+
+@pytest.fixture
+def gap_video(tmp_path):
+    """
+    100 frames where the right rail is hidden on frames 10-59, so a chunk starting at 50 can't see it in its warm-up.
+    """
+    scene = RailScene(1280, 720)
+    path = str(tmp_path / 'gap.avi')
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30, (1280, 720))
+    for seed in range(100):
+        frame = scene.render(seed)
+        if 10 <= seed < 60:
+            frame[:, 660:] = 90
+        out.write(frame)
+    out.release()
+    return path, StubDetector([box for box, _ in scene.boxes()])
+
+
+def test_warmup_extends_until_the_rails_are_settled(tmp_path, gap_video, monkeypatch):
+    video, yolo = gap_video
+    monkeypatch.setitem(video_chunks._worker, 'yolo', yolo)
+
+    fa = FrameAnalyzer(yolo, LineDetector(), DistanceEstimator(), renderer=NULL_RENDERER)
+    sink = MemorySink()
+    cap = cv2.VideoCapture(video)
+    for n_frame in range(100):
+        fa.run_frame(cap.read()[1], n_frame=n_frame, sink=sink)
+    cap.release()
+    single = [row for row in sink.rows if row[0] >= 50]
+
+    log = str(tmp_path / 'part.csv')
+    _, frames, _, _, warmed_up, rails_settled = video_chunks.process_chunk(chunk_task(video, 1, 50, None, 20, log))
+    with open(log) as f:
+        chunk = list(csv.reader(f))[1:]
+
+    assert frames == 50
+    assert warmed_up == 50
+    assert rails_settled
+    assert len(chunk) == len(single)
+    for expected, row in zip(single, chunk):
+        assert int(row[0]) == expected[0]
+        assert row[1] == expected[1]
+        assert float(row[5]) == pytest.approx(expected[5])
+
+
+def test_warmup_extension_is_capped(tmp_path, gap_video, monkeypatch):
+    video, yolo = gap_video
+    monkeypatch.setitem(video_chunks._worker, 'yolo', yolo)
+    original, warmups = video_chunks.warm_up, []
+
+    def recording_warm_up(fa, reader, warmup_start, start):
+        warmups.append(start - warmup_start)
+        original(fa, reader, warmup_start, start)
+    monkeypatch.setattr(video_chunks, 'warm_up', recording_warm_up)
+
+    # the right rail is hidden from frame 10, so 35 frames back from 50 can't settle it
+    log = str(tmp_path / 'part.csv')
+    _, frames, _, _, warmed_up, rails_settled = video_chunks.process_chunk(
+        chunk_task(video, 1, 50, None, 40, log, warmup_max=35))
+
+    assert frames == 50
+    assert warmups == [10, 20, 35]
+    assert warmed_up == 35
+    assert not rails_settled